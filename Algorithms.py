@@ -1,72 +1,238 @@
 import hashlib # 导入 hashlib 模块，用于 MD5 哈希计算
 import logging # 导入 logging 模块
+import threading # 导入 threading 模块，用于保护密钥流缓存
+from collections import OrderedDict # 导入 OrderedDict，用于实现 LRU 缓存
+from typing import Iterable, List, Tuple # 导入类型提示
+
+try: # NumPy 为可选依赖，安装后大封包走向量化加解密
+    import numpy as np
+except ImportError: # 未安装时使用纯 Python 的整块运算
+    np = None
 
 # 配置 logging
 logger = logging.getLogger(__name__)
 
+NUMPY_MIN_LENGTH = 8192 # 封包主体达到该长度时才使用 NumPy，小封包的数组创建开销反而更大
+KEYSTREAM_CACHE_SIZE = 64 # 密钥流 LRU 缓存的最大条目数
+KEYSTREAM_CACHE_MAX_LENGTH = 65536 # 超过该长度的密钥流不缓存（如仓库列表），避免大块内存长期驻留
+INITIAL_KEY = b'!crAckmE4nOthIng:-)' # 收到 1001 数据包之前使用的初始密钥
+
+def _encrypt_bulk(plain, keystream: int, shift: int) -> bytes: # 纯 Python 整块加密（异或、位变换、旋转）
+    size = len(plain) + 1 # 密文主体长度，末尾补一个 0 字节
+    # 以小端大整数一次完成整段异或，keystream 为密钥流的小端整数形式
+    value = int.from_bytes(plain, 'little') ^ keystream
+    # 小端整数整体左移5位，等价于 cipher[i] = (cipher[i] << 5) | (cipher[i - 1] >> 3)，首字节低位补3
+    value = (value << 5) | 3
+    if shift: # 旋转：把低 shift 个字节移到末尾，等价于 cipher[shift:] + cipher[:shift]
+        value = (value >> (8 * shift)) | ((value & ((1 << (8 * shift)) - 1)) << (8 * (size - shift)))
+    return value.to_bytes(size, 'little')
+
+def _decrypt_bulk(cipher, keystream: int, shift: int) -> bytes: # 纯 Python 整块解密（反向旋转、位变换、异或）
+    size = len(cipher) # 密文主体长度
+    # 反向旋转直接在整数上拼接，等价于 cipher[size - shift:] + cipher[:size - shift]
+    value = int.from_bytes(cipher[size - shift:], 'little') | (int.from_bytes(cipher[:size - shift], 'little') << (8 * shift))
+    # 小端整数整体右移5位，等价于 plain[i] = (cipher[i] >> 5) | (cipher[i + 1] << 3)，丢弃最后一个字节
+    value = ((value >> 5) & ((1 << (8 * (size - 1))) - 1)) ^ keystream
+    return value.to_bytes(size - 1, 'little')
+
+def _encrypt_numpy(plain, keystream: bytes, shift: int, out): # NumPy 向量化加密，结果写入 out（长度为明文长度+1）
+    size = len(out) # 密文主体长度，末尾补一个 0 字节
+    data = np.zeros(size, dtype = np.uint8)
+    np.bitwise_xor(np.frombuffer(plain, dtype = np.uint8), np.frombuffer(keystream, dtype = np.uint8), out = data[:-1])
+    cipher = np.empty(size, dtype = np.uint8)
+    cipher[1:] = (data[1:] << 5) | (data[:-1] >> 3) # 整块位变换
+    cipher[0] = ((int(data[0]) << 5) & 0xFF) | 3 # 首字节左移5位并与3进行或运算
+    out[:size - shift] = cipher[shift:] # 旋转后直接写入输出缓冲区
+    out[size - shift:] = cipher[:shift]
+
+def _decrypt_numpy(cipher, keystream: bytes, shift: int, out): # NumPy 向量化解密，结果写入 out（长度为密文长度-1）
+    data = np.roll(np.frombuffer(cipher, dtype = np.uint8), shift) # 反向旋转
+    np.right_shift(data[:-1], 5, out = out) # 整块位变换还原
+    out |= data[1:] << 3
+    out ^= np.frombuffer(keystream, dtype = np.uint8) # 整块异或
+
+def mserial(a, b, c, d): # MSerial 序列号递推公式：a 为上一个序列号，b 为包体长度，c 为校验值，d 为命令ID
+    return a + c + int(a / -3) + (b % 17) + (d % 23) + 120
+
+def xor_crc8(body) -> int: # 包体所有字节的异或校验 (CRC8)，以大整数折半异或代替逐字节循环
+    value = int.from_bytes(body, 'little')
+    width = len(body) # 当前参与折叠的字节数
+    while width > 1:
+        half = (width + 1) // 2
+        value = (value & ((1 << (8 * half)) - 1)) ^ (value >> (8 * half)) # 高半部分异或到低半部分
+        width = half
+    return value
+
+def body_crc8(cmd_id: int, body) -> int: # 序列号计算所用的校验值，只有命令ID大于1000时才参与计算
+    return xor_crc8(body) if cmd_id > 1000 else 0
+
+class SerialAllocator: # MSerial 序列号链分配器，发送线程与接收线程共享，所有修改都在锁内完成
+    def __init__(self, value: int = 0): # 初始化方法，value 为链的起始值
+        self._value = value # 最近一次分配出去的序列号
+        self._lock = threading.Lock() # 保护序列号链的锁
+
+    @property
+    def value(self) -> int: # 最近一次分配出去的序列号
+        return self._value
+
+    def reset(self, value: int): # 重置序列号链，例如收到服务器 1001 封包时
+        with self._lock:
+            self._value = value
+
+    def next(self, cmd_id: int, body, crc: int = None) -> int: # 原子地为一个封包分配下一个序列号
+        if crc is None: # 校验值只依赖包体，在锁外计算
+            crc = body_crc8(cmd_id, body)
+        return self.advance(cmd_id, len(body), crc)
+
+    def advance(self, cmd_id: int, length: int, crc: int) -> int: # 已知包体长度与校验值时直接推进序列号链
+        with self._lock:
+            self._value = mserial(self._value, length, crc, cmd_id)
+            return self._value
+
+    def reserve(self, packets: Iterable[Tuple[int, bytes]]) -> List[int]: # 在一次加锁内为整批 (命令ID, 包体) 连续分配序列号
+        # 锁外预先计算校验值
+        return self.advance_many([(cmd_id, len(body), body_crc8(cmd_id, body)) for cmd_id, body in packets])
+
+    def rewind(self, expected: int, previous: int) -> bool: # 撤销最近一次分配：分配出去的序列号最终没有发出时调用
+        with self._lock:
+            if self._value != expected: # 期间序列号链已被重置或继续推进，不能撤销
+                return False
+            self._value = previous
+            return True
+
+    def advance_many(self, params: Iterable[Tuple[int, int, int]]) -> List[int]: # 在一次加锁内按 (命令ID, 包体长度, 校验值) 连续分配序列号
+        serials = []
+        with self._lock:
+            value = self._value
+            for cmd_id, length, crc in params:
+                value = mserial(value, length, crc, cmd_id)
+                serials.append(value)
+            self._value = value
+        return serials
+
 class Algorithms: # 定义 Algorithms 类，封装加密、解密等算法
     def __init__(self): # 初始化方法
-        self.key = b'!crAckmE4nOthIng:-)'  # 初始化加密密钥
-        self.result = 0  # 初始化一个结果变量，可能用于序列号或校验
+        self.serial = SerialAllocator() # 序列号分配器，替代原先直接读写的 result
+        self._keystream_cache = OrderedDict() # 密钥流 LRU 缓存，键为 (密钥, 长度)
+        self._keystream_lock = threading.Lock() # 缓存锁，发送线程与接收线程会同时加解密
+        self.keystream_hits = 0 # 缓存命中次数
+        self.keystream_misses = 0 # 缓存未命中次数
+        self.key = INITIAL_KEY  # 初始化加密密钥
+
+    @property
+    def result(self) -> int: # 最近一次计算出的序列号，保留该属性以兼容原有调用
+        return self.serial.value
+
+    @result.setter
+    def result(self, value: int): # 直接赋值等价于重置序列号链
+        self.serial.reset(value)
+
+    @property
+    def key(self) -> bytes: # 当前通信密钥
+        return self._key
+
+    @key.setter
+    def key(self, value: bytes): # 更换密钥时同步重建密钥流周期
+        self._key = bytes(value)
+        # 原逐字节循环的密钥索引序列为 0..L-1, 0, 0..L-1, 0, 0..L-1 ...
+        # 即首轮为完整密钥，之后每轮都是 key[0] + key (长度 L+1)，这里一次性预先展开周期
+        self._key_period = self._key[:1] + self._key
+        with self._keystream_lock: # 密钥更换后旧密钥流全部失效
+            self._keystream_cache.clear()
+
+    def keystream(self, length: int) -> bytes: # 按原密钥索引规则展开指定长度的异或密钥流
+        key = self._key
+        if length <= len(key): # 长度不超过首轮时直接截取密钥
+            return key[:length]
+        rest = length - len(key) # 首轮之后还需要的字节数
+        repeat = -(-rest // len(self._key_period)) # 向上取整得到周期重复次数
+        return key + (self._key_period * repeat)[:rest]
+
+    def _cached_keystream(self, length: int) -> Tuple[bytes, int]: # 从 LRU 缓存获取密钥流及其小端整数形式
+        cache_key = (self._key, length)
+        with self._keystream_lock:
+            entry = self._keystream_cache.get(cache_key)
+            if entry is not None: # 命中则移到队尾，标记为最近使用
+                self._keystream_cache.move_to_end(cache_key)
+                self.keystream_hits += 1
+                return entry
+            self.keystream_misses += 1
+        stream = self.keystream(length) # 未命中时在锁外展开，避免阻塞另一线程
+        entry = (stream, int.from_bytes(stream, 'little'))
+        if length <= KEYSTREAM_CACHE_MAX_LENGTH:
+            with self._keystream_lock:
+                self._keystream_cache[cache_key] = entry
+                if len(self._keystream_cache) > KEYSTREAM_CACHE_SIZE: # 超出容量时淘汰最久未使用的条目
+                    self._keystream_cache.popitem(last = False)
+        return entry
+
+    def _encrypt_params(self, plain) -> Tuple[int, bytes, int]: # 计算加密所需的旋转位数与密钥流
+        # 旋转位数：使用明文长度对密钥长度取模，获取密钥中的一个字节，乘以13后对密文长度取模
+        shift = self._key[len(plain) % len(self._key)] * 13 % (len(plain) + 1)
+        stream, stream_int = self._cached_keystream(len(plain)) # 获取（可能已缓存的）密钥流
+        return shift, stream, stream_int
+
+    def _decrypt_params(self, cipher) -> Tuple[int, bytes, int]: # 计算解密所需的旋转位数与密钥流
+        # 计算旋转索引，与加密过程类似，但基于密文长度
+        shift = self._key[(len(cipher) - 1) % len(self._key)] * 13 % len(cipher)
+        stream, stream_int = self._cached_keystream(len(cipher) - 1) # 获取（可能已缓存的）密钥流
+        return shift, stream, stream_int
 
     def encrypt(self, plain: bytes) -> bytes: # 加密方法，输入明文字节串，输出密文字节串
         cipher_len = len(plain) + 1  # 计算密文长度，比明文长度多1（可能是为了存储额外的校验或结束符）
-        plain = plain[4:]  # 跳过明文的前4个字节（通常是封包长度）
-        cipher = bytearray(len(plain) + 1)  # 创建一个字节数组用于存放密文，长度为处理后明文长度+1
-        # 加密核心逻辑
-        j = 0 # 初始化密钥索引
-        need_become_zero = False # 标记密钥索引是否需要在下一轮变为0
-        for i in range(len(plain)): # 遍历处理后的明文
-            if j == 1 and need_become_zero: # 特殊的密钥索引重置逻辑
-                j = 0
-                need_become_zero = False
-            if j == len(self.key): # 如果密钥索引达到密钥长度
-                j = 0 # 重置密钥索引
-                need_become_zero = True # 标记下一轮j=1时需要重置为0
-            cipher[i] = plain[i] ^ self.key[j] # 明文字节与密钥对应字节进行异或操作
-            j += 1 # 密钥索引递增
-        # 设置密文的最后一个字节为0
-        cipher[-1] = 0
-        # 对密文进行位操作变换
-        for i in range(len(cipher) - 1, 0, -1): # 从后向前遍历密文（不包括第一个字节）
-            # 将当前字节左移5位，并与前一个字节右移3位的结果进行或运算
-            cipher[i] = ((cipher[i] << 5) & 0xFF) | (cipher[i - 1] >> 3)
-        # 对密文的第一个字节进行位操作变换
-        cipher[0] = ((cipher[0] << 5) & 0xFF) | 3 # 左移5位并与3进行或运算
-        # 计算旋转索引并进行数组旋转
-        # 使用明文长度对密钥长度取模，获取密钥中的一个字节，乘以13后对密文长度取模，得到旋转的位数
-        result = self.key[len(plain) % len(self.key)] * 13 % len(cipher)
-        cipher = cipher[result:len(cipher)] + cipher[0:result] # 将密文数组旋转指定位数
+        plain = memoryview(plain)[4:]  # 跳过明文的前4个字节（通常是封包长度），不复制
+        shift, stream, stream_int = self._encrypt_params(plain)
+        if np is not None and len(plain) + 1 >= NUMPY_MIN_LENGTH: # 大封包使用 NumPy 整块运算
+            out = np.empty(len(plain) + 1, dtype = np.uint8)
+            _encrypt_numpy(plain, stream, shift, out)
+            cipher = out.tobytes()
+        else: # 其余情况使用大整数整块运算
+            cipher = _encrypt_bulk(plain, stream_int, shift)
         # 返回拼接原始封包长度（cipher_len）与加密后的数据
-        return cipher_len.to_bytes(length = 4, byteorder = 'big') + bytes(cipher)
+        return cipher_len.to_bytes(length = 4, byteorder = 'big') + cipher
 
     def decrypt(self, cipher: bytes) -> bytes: # 解密方法，输入密文字节串，输出明文字节串
         plain_len = len(cipher) - 1  # 计算明文长度，比密文长度少1
-        cipher = cipher[4:]  # 跳过密文的前4个字节（通常是封包长度）
-        # 计算旋转索引，与加密过程类似，但基于密文长度
-        result = self.key[(len(cipher) - 1) % len(self.key)] * 13 % len(cipher)
-        # 进行数组反向旋转
-        cipher = cipher[len(cipher) - result:len(cipher)] + cipher[0:len(cipher) - result]
-        # 初始化明文字节数组
-        plain = bytearray(len(cipher) - 1) # 明文长度比处理后的密文长度少1
-        # 进行位操作还原，与加密过程的位操作相反
-        for i in range(len(cipher) - 1): # 遍历处理后的密文（不包括最后一个字节）
-            # 将当前字节右移5位，并与后一个字节左移3位的结果进行或运算
-            plain[i] = ((cipher[i] >> 5) & 0xFF) | ((cipher[i + 1] << 3) & 0xFF)
-        # 解密核心逻辑，与加密的异或操作相同（异或的特性）
-        j = 0 # 初始化密钥索引
-        need_become_zero = False # 标记密钥索引是否需要在下一轮变为0
-        for i in range(len(plain)): # 遍历明文
-            if j == 1 and need_become_zero: # 特殊的密钥索引重置逻辑
-                j = 0
-                need_become_zero = False
-            if j == len(self.key): # 如果密钥索引达到密钥长度
-                j = 0 # 重置密钥索引
-                need_become_zero = True # 标记下一轮j=1时需要重置为0
-            plain[i] = plain[i] ^ self.key[j] # 密文字节与密钥对应字节进行异或操作得到明文字节
-            j += 1 # 密钥索引递增
+        cipher = memoryview(cipher)[4:]  # 跳过密文的前4个字节（通常是封包长度），不复制
+        shift, stream, stream_int = self._decrypt_params(cipher)
+        if np is not None and len(cipher) >= NUMPY_MIN_LENGTH: # 大封包使用 NumPy 整块运算
+            out = np.empty(len(cipher) - 1, dtype = np.uint8)
+            _decrypt_numpy(cipher, stream, shift, out)
+            plain = out.tobytes()
+        else: # 其余情况使用大整数整块运算
+            plain = _decrypt_bulk(cipher, stream_int, shift)
         # 返回拼接原始封包长度（plain_len）与解密后的数据
-        return plain_len.to_bytes(length = 4, byteorder = 'big') + bytes(plain)
+        return plain_len.to_bytes(length = 4, byteorder = 'big') + plain
+
+    def encrypt_into(self, src: memoryview, dst: bytearray) -> int: # 加密 src 中的完整封包并写入调用方提供的 dst，返回写入的字节数
+        # src 为含4字节长度头的明文封包，dst 至少需要 len(src) + 1 字节，从 dst[0] 开始写入
+        src = memoryview(src)
+        cipher_len = len(src) + 1 # 密文总长度
+        if len(dst) < cipher_len: # 目标缓冲区不足时直接报错，不做隐式扩容
+            raise ValueError(f"目标缓冲区长度不足: 需要 {cipher_len} 字节，实际 {len(dst)} 字节")
+        plain = src[4:] # 跳过长度头，不复制
+        shift, stream, stream_int = self._encrypt_params(plain)
+        dst[0:4] = cipher_len.to_bytes(length = 4, byteorder = 'big') # 写入长度头
+        if np is not None and cipher_len - 4 >= NUMPY_MIN_LENGTH: # NumPy 直接写入 dst 对应区域
+            _encrypt_numpy(plain, stream, shift, np.frombuffer(dst, dtype = np.uint8, count = cipher_len - 4, offset = 4))
+        else:
+            dst[4:cipher_len] = _encrypt_bulk(plain, stream_int, shift)
+        return cipher_len
+
+    def decrypt_into(self, src: memoryview, dst: bytearray) -> int: # 解密 src 中的完整封包并写入调用方提供的 dst，返回写入的字节数
+        # src 可以直接是接收缓冲区上的 memoryview，dst 至少需要 len(src) - 1 字节，从 dst[0] 开始写入
+        src = memoryview(src)
+        plain_len = len(src) - 1 # 明文总长度
+        if len(dst) < plain_len: # 目标缓冲区不足时直接报错，不做隐式扩容
+            raise ValueError(f"目标缓冲区长度不足: 需要 {plain_len} 字节，实际 {len(dst)} 字节")
+        cipher = src[4:] # 跳过长度头，不复制
+        shift, stream, stream_int = self._decrypt_params(cipher)
+        dst[0:4] = plain_len.to_bytes(length = 4, byteorder = 'big') # 写入长度头
+        if np is not None and len(cipher) >= NUMPY_MIN_LENGTH: # NumPy 直接写入 dst 对应区域
+            _decrypt_numpy(cipher, stream, shift, np.frombuffer(dst, dtype = np.uint8, count = plain_len - 4, offset = 4))
+        else:
+            dst[4:plain_len] = _decrypt_bulk(cipher, stream_int, shift)
+        return plain_len
 
     def InitKey(self, packet_data: bytes, userid: int): # 初始化或更新密钥的方法
         # 提取通信数据包的最后4个字节
@@ -87,15 +253,14 @@ class Algorithms: # 定义 Algorithms 类，封装加密、解密等算法
 
     def MSerial(self, a, b, c, d): # 一个用于计算序列号或某种校验和的函数
         # 执行一系列算术运算
-        return a + c + int(a / -3) + (b % 17) + (d % 23) + 120
+        return mserial(a, b, c, d)
+
+    def reset(self): # 恢复登录前的状态，重新登录之前调用
+        self.key = INITIAL_KEY # 恢复初始密钥
+        self.serial.reset(0) # 序列号链从头开始
 
     def calculate_result(self, cmdId, body): # 计算并更新 result 属性的方法
-        crc8_val = 0 # 初始化 CRC8 校验值
-        if cmdId > 1000:  # 如果命令ID大于1000
-            for byte in body: # 遍历消息体中的每个字节
-                crc8_val ^= byte # 计算 CRC8 校验值 (简单异或校验)
-        # 调用 MSerial 方法计算新的 result 值
-        new_result = self.MSerial(self.result, len(body), crc8_val, cmdId)
-        self.result = new_result # 更新对象的 result 属性
+        # 由序列号分配器原子地完成 CRC8 校验 (命令ID大于1000时) 与 MSerial 递推
+        new_result = self.serial.next(cmdId, body)
         logger.info(f"Updated result to: {new_result}") # 使用 logging 记录更新后的 result 值
         return new_result # 返回新的 result 值
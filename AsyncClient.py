@@ -0,0 +1,798 @@
+import time # 导入 time 模块，用于信箱有效期与批量等待的截止时间
+import random # 导入 random 模块，用于重连等待时间的随机抖动
+import asyncio # 导入 asyncio 模块，用于事件循环中的收发与等待
+import logging # 导入 logging 模块，用于日志记录
+from collections import deque # 导入 deque，用作等待队列与未认领响应的信箱
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union # 从 typing 模块导入类型提示
+from Algorithms import Algorithms # 从 Algorithms 文件导入 Algorithms 类
+from PacketTemplate import PacketTemplate # 从 PacketTemplate 文件导入预编译数据包模板
+from PacketTrace import PacketTrace # 从 PacketTrace 文件导入封包追踪
+from CommandRegistry import CommandRegistry, get_registry # 从 CommandRegistry 文件导入共享的命令注册表
+from ReceivePacketAnalysis import ReceiveBuffer, FrameError # 从 ReceivePacketAnalysis 文件导入接收缓冲区与分帧
+from SendPacketProcessing import enable_keepalive # 从 SendPacketProcessing 文件导入 TCP keepalive 设置
+from BattleEngine import BattleEngine, FIGHT_OVER # 从 BattleEngine 文件导入战斗状态机
+from RateLimiter import RateLimiter # 从 RateLimiter 文件导入自适应限速器
+from PetInventory import PetInventory, PetInfo # 从 PetInventory 文件导入背包/仓库模型
+from PetFightPacketManager import (BATTLE_PACKETS, PET_MOVE_PACKET, BACKPACK_LIST_PACKET, BACKPACK_LIST_COMMAND,
+                                   WAREHOUSE_LIST_PACKET, WAREHOUSE_LIST_COMMAND, STEP_BACKPACK_LIST,
+                                   STEP_WAREHOUSE_LIST, STEP_MOVE_PET, STEP_PACED, STEP_BATTLE_EVENT,
+                                   STEP_BATTLE_OVER, PetFightError, WarehouseIndex, backpack_steps, battle_steps,
+                                   load_backpack_list, load_warehouse_list,
+                                   response_command) # 与线程版共用数据包模板与背包检查、战斗序列的决策逻辑
+from RoutineProgram import RoutineError, load_routines, DEFAULT_ROUTINES_PATH # 从 RoutineProgram 文件导入日常程序
+from Checkpoint import Checkpoint, CheckpointStore # 从 Checkpoint 文件导入日常进度
+
+KEY_INIT_COMMAND = 1001 # 登录成功后服务器下发密钥的命令ID
+MINING_RESULT_COMMAND = 45543 # 开采结果命令ID
+
+# 每日执行的日常 (routines.json 中的名称)，与线程版 execute_daily_tasks 的任务名一致，两者的进度文件可以互相续跑
+DAILY_ROUTINES = (
+    "daily_props_collection",
+    "battery_dormant_switch",
+    "fire_buffer",
+    "experience_training_ground",
+    "learning_training_ground",
+    "trial_of_the_elf_king",
+    "x_team_chamber",
+    "titan_mines",
+)
+
+PacketHandler = Callable[[int, bytes], None] # 订阅回调：handler(命令ID, 数据包内容)
+Connector = Callable[[], Awaitable[Any]] # 重新登录并返回新 socket 的协程函数
+
+class AsyncClient(asyncio.Protocol): # 定义 AsyncClient 类，在事件循环中运行的单个会话
+    """asyncio 会话
+
+    与线程版 (SendPacketProcessing + ReceivePacketAnalysis + PetFightPacketManager) 使用相同的分帧、
+    加解密、数据包模板与日常程序，但不创建任何线程：接收由 asyncio.Protocol 回调驱动，
+    等待响应是 asyncio Future，日常通过 RoutineProgram.run_async 执行。
+    背包检查与战斗序列的决策 (backpack_steps、battle_steps) 与线程版共用，本类只负责收发；
+    同样支持 BattleEngine 战斗跟踪、RateLimiter 自适应限速与断线后自动重连。
+    一个事件循环可以同时运行大量会话，每个会话只持有自己的密钥与序列号状态。
+
+    除 login 中的登录验证外，所有方法都必须在事件循环线程中调用。
+    """
+
+    def __init__(self, userid: int, algorithms: Optional[Algorithms] = None,
+                 commands: Optional[CommandRegistry] = None, trace: Optional[PacketTrace] = None,
+                 rate_limiter: Optional[RateLimiter] = None, connector: Optional[Connector] = None): # 初始化方法
+        """
+        Args:
+            userid: 用户ID
+            algorithms: 该会话的加解密与序列号状态，默认新建
+            commands: 命令注册表，默认使用进程内共享的注册表
+            trace: 封包追踪，默认新建
+            rate_limiter: 自适应限速器，为 None 时不限速
+            connector: 重新登录并返回新 socket 的协程函数，为 None 时不重连 (login 会设置)
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.userid = userid
+        self.user_id = userid.to_bytes(length=4, byteorder='big') # 用户ID，转换为4字节大端序字节串
+        self.algorithms = algorithms or Algorithms()
+        self.commands = commands or get_registry()
+        self.trace = trace or PacketTrace()
+
+        self.transport: Optional[asyncio.Transport] = None # 当前连接，断开后为 None
+        self.buffer = ReceiveBuffer() # 接收缓冲区，负责分帧与重新对齐
+        self.key_ready = asyncio.Event() # 收到 1001 密钥初始化后置位
+        self.closed: Optional[asyncio.Future] = None # 连接断开时完成
+
+        self.waiters: Dict[int, deque] = {} # 命令ID -> 等待响应的 Future (按登记顺序)
+        self.mailbox = deque(maxlen=64) # (到达时间, 命令ID, 数据包内容)
+        self.mailbox_ttl = 2.0 # 信箱中响应的有效期（秒）
+        self.subscribers: Dict[int, Tuple[PacketHandler, ...]] = {} # 命令ID -> 订阅回调
+        self.predicate_subscribers: Tuple[Tuple[Callable[[int], bool], PacketHandler], ...] = () # (条件, 回调)
+        self.reply_observers: Tuple[Callable[[int, asyncio.Future, bytes], None], ...] = () # 响应交给等待方之后的回调
+
+        # 战斗与节奏配置，含义与 PetFightPacketManager 相同
+        self.battle_timeout = 3.0 # 秒
+        self.operation_delay = 0.3 # 秒
+        self.pacing = "ack"
+        self.pacing_acked = 0 # 收到响应后继续的步数
+        self.pacing_timeouts = 0 # 等满 operation_delay 后继续的步数
+        self.routines_path = DEFAULT_ROUTINES_PATH # 日常配置文件
+        self.checkpoint: Optional[Checkpoint] = None # 当天的日常进度，设置后日常可以断点续跑
+        self.checkpoints: Optional[CheckpointStore] = None # 日常进度存储，设置后每次执行日常时载入当天的进度
+        self.battle_over: Optional[asyncio.Future] = None # 当前战斗的 FIGHT_OVER 通知
+
+        # 重连配置，含义与 SendPacketProcessing 相同
+        self.connector = connector
+        self.reconnect_attempts = 6 # 最大重连次数
+        self.reconnect_base_delay = 1.0 # 第一次重试前的等待时间（秒），之后每次翻倍
+        self.reconnect_max_delay = 30.0 # 重试等待时间上限（秒）
+        self.key_timeout = 10.0 # 重新登录后等待 1001 数据包的超时时间（秒）
+        self.reconnecting: Optional[asyncio.Task] = None # 正在进行的重连
+        self.closing = False # 调用过 close，连接断开后不再重连
+
+        # 背包/仓库模型，只在相关的服务器推送到达时失效
+        self.inventory = PetInventory()
+        self.inventory.subscribe(self)
+        # 根据服务器的战斗通知跟踪战斗的开始、回合与结束，先于 _on_fight_over 订阅，唤醒等待方时战斗记录已更新
+        self.battle_engine = BattleEngine(self)
+        self.subscribe(FIGHT_OVER, self._on_fight_over)
+
+        self.rate_limiter = rate_limiter
+        if rate_limiter is not None:
+            rate_limiter.attach(self)
+
+        # 统计信息
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.bytes_quarantined = 0 # 重新对齐时跳过的字节数
+        self.reconnects = 0 # 重连成功次数
+
+    def connection_made(self, transport: asyncio.Transport): # 连接建立
+        self.transport = transport
+        self.closed = asyncio.get_running_loop().create_future()
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            enable_keepalive(sock)
+
+    def data_received(self, data: bytes): # 收到数据：写入接收缓冲区并处理其中所有完整的数据包
+        self.buffer.feed(data)
+        while True:
+            if self.buffer.resyncing: # 重新对齐：只跳过错误数据，而不是清空整个缓冲区
+                skipped = self.buffer.resync()
+                if skipped is None: # 等待更多数据后继续查找
+                    break
+                self.bytes_quarantined += len(skipped)
+                self.logger.warning(f"重新对齐，跳过 {len(skipped)} 字节")
+                continue
+            try:
+                frame = self.buffer.next_frame()
+            except FrameError as e: # 长度字段不合理：进入重新对齐状态
+                self.logger.warning(f"数据包长度异常: {e}")
+                continue
+            if frame is None:
+                break
+            try:
+                self._handle_frame(frame)
+            except Exception as e:
+                self.logger.error(f"处理数据包失败: {e}")
+                self.trace.dump(f"处理数据包失败: {e}")
+            finally:
+                self.buffer.release(frame) # 回调都是同步执行的，处理完即可释放视图
+
+    def connection_lost(self, exc: Optional[Exception]): # 连接断开：所有等待方以 ConnectionError 结束，并在后台重连
+        self.transport = None
+        error = ConnectionError(f"连接已断开: {exc}" if exc else "连接已断开")
+        for waiters in self.waiters.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(error)
+        self.waiters.clear()
+        if self.battle_over is not None and not self.battle_over.done():
+            self.battle_over.cancel()
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(exc)
+        self.logger.info(f"用户 {self.userid} 的连接已断开")
+
+        if self.closing or (self.reconnecting is not None and not self.reconnecting.done()):
+            return # 主动关闭，或重连过程中新连接失败 (由重连自己重试)
+        if self.rate_limiter is not None: # 通知限速器降速
+            self.rate_limiter.on_kick(str(exc) if exc else "连接已断开")
+        if self.connector is not None:
+            self.logger.warning("连接已断开，开始重连")
+            self.reconnecting = asyncio.get_running_loop().create_task(self._reconnect())
+
+    @property
+    def connected(self) -> bool: # 连接是否可用
+        return self.transport is not None and not self.transport.is_closing()
+
+    async def wait_for_key(self, timeout: Optional[float] = None) -> bool: # 等待密钥初始化完成
+        """等待服务器下发密钥 (1001)，超时返回 False"""
+        try:
+            await asyncio.wait_for(self.key_ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self): # 关闭连接
+        self.closing = True
+        if self.reconnecting is not None:
+            self.reconnecting.cancel()
+        if self.transport is not None:
+            self.transport.close()
+
+    async def _reconnect(self) -> bool: # 重新建立连接
+        """按指数退避重试：恢复初始密钥与序列号，通过 connector 重新登录，
+        把同一个会话挂到新连接上并等待 1001 数据包完成密钥初始化
+
+        Returns:
+            bool: 重连是否成功
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.reconnect_attempts):
+            if attempt:
+                delay = min(self.reconnect_max_delay, self.reconnect_base_delay * 2 ** (attempt - 1))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0)) # 随机抖动，避免多个账号同时重连
+            try:
+                # 收到新连接的 1001 数据包之前不会发送：发送方都在 _ensure_connected 中等待重连结束
+                self.algorithms.reset()
+                self.key_ready.clear()
+                self.buffer = ReceiveBuffer() # 旧连接上残留的半个数据包不能接到新连接的数据前面
+                tcp_socket = await self.connector()
+                if not tcp_socket:
+                    raise ConnectionError("登录失败")
+                await loop.create_connection(lambda: self, sock=tcp_socket)
+                if not await self.wait_for_key(self.key_timeout):
+                    if self.transport is not None:
+                        self.transport.abort()
+                    raise ConnectionError("未收到密钥初始化数据包")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"重连失败 (尝试 {attempt + 1}/{self.reconnect_attempts}): {e}")
+                continue
+
+            self.reconnects += 1
+            self.logger.info(f"重连成功 (尝试 {attempt + 1}/{self.reconnect_attempts})")
+            return True
+
+        self.logger.error(f"重连失败，已尝试 {self.reconnect_attempts} 次")
+        return False
+
+    async def _ensure_connected(self) -> bool: # 连接断开时等待正在进行的重连
+        """正在重连时等待重连结束 (新连接完成密钥初始化之前不能发送)，返回连接是否可用"""
+        reconnecting = self.reconnecting
+        if reconnecting is not None and not reconnecting.done():
+            try:
+                await asyncio.shield(reconnecting)
+            except asyncio.CancelledError:
+                if not reconnecting.cancelled(): # 调用方被取消，而不是会话已关闭
+                    raise
+        return self.connected
+
+    async def wait_closed(self): # 等待连接完全关闭
+        if self.closed is not None:
+            await asyncio.shield(self.closed)
+
+    def _handle_frame(self, frame: memoryview): # 解密并分发一个数据包
+        packet_data = bytearray(len(frame) - 1) # 明文比密文少1字节
+        self.algorithms.decrypt_into(frame, packet_data)
+        packet_data = bytes(packet_data)
+        command_id = int.from_bytes(packet_data[5:9], byteorder='big')
+        self.packets_received += 1
+        self.trace.record('recv', command_id, packet_data, name=self.commands.name(command_id))
+
+        if command_id == KEY_INIT_COMMAND:
+            self._handle_key_init(packet_data)
+        for handler in self.subscribers.get(command_id, ()):
+            self._call_handler(handler, command_id, packet_data)
+        for predicate, handler in self.predicate_subscribers:
+            if predicate(command_id):
+                self._call_handler(handler, command_id, packet_data)
+
+        waiters = self.waiters.get(command_id)
+        while waiters: # 交给最早登记且仍在等待的请求方
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(packet_data)
+                for observer in self.reply_observers:
+                    self._call_observer(observer, command_id, future, packet_data)
+                return
+        self.mailbox.append((time.monotonic(), command_id, packet_data)) # 暂存未被认领的响应
+
+    def _call_handler(self, handler: PacketHandler, command_id: int, packet_data: bytes): # 执行订阅回调，异常不影响其他回调
+        try:
+            handler(command_id, packet_data)
+        except Exception as e:
+            self.logger.error(f"命令 {command_id} 的订阅回调出错: {e}")
+
+    def _call_observer(self, observer, command_id: int, future: asyncio.Future, packet_data: bytes): # 执行响应观察回调
+        try:
+            observer(command_id, future, packet_data)
+        except Exception as e:
+            self.logger.error(f"执行响应观察回调时发生错误: {e}")
+
+    def _handle_key_init(self, packet_data: bytes): # 处理密钥初始化 (命令ID 1001)
+        self.algorithms.InitKey(packet_data, self.userid) # 使用接收到的数据包和用户ID初始化/更新密钥
+        self.algorithms.serial.reset(int.from_bytes(packet_data[13:17], byteorder='big')) # 重置序列号链
+        self.logger.info('密钥初始化完成')
+        self.key_ready.set()
+
+    def subscribe(self, command: Union[int, Callable[[int], bool]], handler: PacketHandler, inline: bool = True): # 订阅数据包
+        """订阅数据包，之后每个匹配的数据包都会调用 handler(命令ID, 数据包内容)
+
+        与 ReceivePacketAnalysis.subscribe 的签名相同，订阅方可以不加修改地用于两种会话。
+        回调总是在事件循环中同步执行，inline 参数只为兼容而保留。
+
+        Args:
+            command: 命令ID，或者接收命令ID并返回是否匹配的函数
+            handler: 回调函数，应尽量简短，不能阻塞
+            inline: 忽略
+        """
+        if callable(command):
+            self.predicate_subscribers += ((command, handler),)
+        else:
+            self.subscribers[command] = self.subscribers.get(command, ()) + (handler,)
+
+    def unsubscribe(self, command: Union[int, Callable[[int], bool]], handler: PacketHandler) -> bool: # 取消订阅
+        """取消 subscribe 登记的订阅，返回是否找到并取消了订阅"""
+        if callable(command):
+            remaining = tuple(entry for entry in self.predicate_subscribers
+                              if not (entry[0] == command and entry[1] == handler))
+            removed = len(remaining) != len(self.predicate_subscribers)
+            self.predicate_subscribers = remaining
+            return removed
+        handlers = self.subscribers.get(command, ())
+        if handler not in handlers:
+            return False
+        self.subscribers[command] = tuple(entry for entry in handlers if entry != handler)
+        return True
+
+    def observe_replies(self, observer: Callable[[int, asyncio.Future, bytes], None]): # 观察交给等待方的响应
+        """登记响应观察回调，与 ReceivePacketAnalysis.observe_replies 相同 (RateLimiter 据此测量 RTT)"""
+        self.reply_observers += (observer,)
+
+    def waiting(self, command_id: int) -> List[asyncio.Future]: # 获取等待某个命令响应的 Future
+        """获取等待某个命令响应的 Future (按登记顺序)"""
+        return [future for future in self.waiters.get(command_id, ()) if not future.done()]
+
+    def expect(self, command_id: int, use_mailbox: bool = True) -> asyncio.Future: # 登记对某个命令响应的等待
+        """登记对某个命令响应的等待
+
+        Args:
+            command_id: 命令ID
+            use_mailbox: 是否先认领信箱中有效期内尚未被认领的同命令响应
+
+        Returns:
+            asyncio.Future: 结果为响应数据包，连接断开时为 ConnectionError
+        """
+        future = asyncio.get_running_loop().create_future()
+        if use_mailbox: # 先从信箱中认领有效期内最早到达的同命令响应
+            deadline = time.monotonic() - self.mailbox_ttl
+            for entry in list(self.mailbox):
+                if entry[0] < deadline:
+                    self.mailbox.remove(entry)
+                elif entry[1] == command_id:
+                    self.mailbox.remove(entry)
+                    future.set_result(entry[2])
+                    return future
+        if not self.connected:
+            future.set_exception(ConnectionError("连接已断开"))
+            return future
+        self.waiters.setdefault(command_id, deque()).append(future)
+        return future
+
+    def cancel_wait(self, command_id: int, future: asyncio.Future) -> bool: # 放弃等待
+        """放弃等待，返回是否确实取消 (False 表示响应已经到达)"""
+        waiters = self.waiters.get(command_id)
+        if waiters and future in waiters:
+            waiters.remove(future)
+        return future.cancel()
+
+    async def _wait(self, future: asyncio.Future, command_id: int, timeout: float) -> Optional[bytes]: # 等待响应，超时或断线返回 None
+        done, _ = await asyncio.wait((future,), timeout=timeout)
+        if not done and self.cancel_wait(command_id, future):
+            return None
+        return self._result(future, command_id)
+
+    def _result(self, future: asyncio.Future, command_id: int) -> Optional[bytes]: # 取出已完成的等待结果，断线返回 None
+        try:
+            return future.result()
+        except ConnectionError as e:
+            self.logger.error(f"等待命令 {command_id} 的响应失败: {e}")
+            return None
+
+    def _render(self, packet: Union[str, PacketTemplate], values: Optional[Dict[str, int]]) -> Tuple[PacketTemplate, bytearray, int]: # 填入参数槽位
+        template = packet if isinstance(packet, PacketTemplate) else PacketTemplate.from_hex(packet)
+        buffer, crc = template.render(values)
+        return template, buffer, crc
+
+    def _seal(self, template: PacketTemplate, buffer: bytearray, serial: int) -> bytes: # 写入用户ID与序列号并加密
+        template.stamp(buffer, self.user_id, serial)
+        encrypted_packet = self.algorithms.encrypt(buffer)
+        self.trace.record('send', template.cmd_id, buffer, raw=encrypted_packet)
+        return encrypted_packet
+
+    def send(self, packet: Union[str, PacketTemplate], **values) -> bool: # 发送一个数据包
+        """组装、加密并写出一个数据包 (写入传输层缓冲区，不等待，也不经过限速器，日常中的发送使用 submit)
+
+        Args:
+            packet: 十六进制字符串或预编译的 PacketTemplate
+            **values: 模板参数槽位的取值
+
+        Returns:
+            bool: 是否已写出 (连接断开或数据包格式错误时为 False)
+        """
+        if not self.connected:
+            self.logger.error("连接已断开，无法发送数据包")
+            return False
+        try:
+            template, buffer, crc = self._render(packet, values)
+        except ValueError as e:
+            self.logger.error(f"数据包格式错误: {e}")
+            return False
+        # 单线程执行，分配序列号与写出之间不会插入其他数据包
+        serial = self.algorithms.serial.advance(template.cmd_id, len(template.body), crc)
+        self.transport.write(self._seal(template, buffer, serial))
+        self.packets_sent += 1
+        return True
+
+    def send_many(self, packets: Iterable[Tuple[Union[str, PacketTemplate], Optional[Dict[str, int]]]]) -> bool: # 一次写出一批数据包
+        """组装、加密一批数据包并一次写出，任一数据包格式错误时整批都不发送
+
+        Args:
+            packets: (数据包, 参数槽位取值) 序列，取值可以为 None
+
+        Returns:
+            bool: 是否已写出
+        """
+        if not self.connected:
+            self.logger.error("连接已断开，无法发送数据包")
+            return False
+        try:
+            rendered = [self._render(packet, values) for packet, values in packets]
+        except ValueError as e:
+            self.logger.error(f"数据包格式错误: {e}")
+            return False
+        if not rendered:
+            return True
+        serials = self.algorithms.serial.advance_many(
+            (template.cmd_id, len(template.body), crc) for template, _, crc in rendered
+        )
+        self.transport.write(b''.join(
+            self._seal(template, buffer, serial) for (template, buffer, _), serial in zip(rendered, serials)
+        ))
+        self.packets_sent += len(rendered)
+        return True
+
+    async def _throttle(self, packets: Iterable[Union[str, PacketTemplate]]): # 按限速器等待令牌
+        if self.rate_limiter is None:
+            return
+        delay = self.rate_limiter.reserve_many(
+            (packet if isinstance(packet, PacketTemplate) else PacketTemplate.from_hex(packet)).cmd_id
+            for packet in packets
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def submit(self, packet: Union[str, PacketTemplate], **values) -> bool: # 经过限速器发送一个数据包
+        """等待重连与限速器的令牌后发送一个数据包，与 SendPacketProcessing.SendPacket 相对应
+
+        Returns:
+            bool: 是否已写出
+        """
+        if not await self._ensure_connected():
+            self.logger.error("连接已断开，无法发送数据包")
+            return False
+        await self._throttle((packet,))
+        return self.send(packet, **values)
+
+    async def _send_expecting(self, packet: Union[str, PacketTemplate], response_cmd_id: int, **values) -> Optional[asyncio.Future]: # 先登记等待再发送
+        if not await self._ensure_connected():
+            self.logger.error("连接已断开，无法发送数据包")
+            return None
+        future = self.expect(response_cmd_id, use_mailbox=False)
+        await self._throttle((packet,)) # 等待已登记，限速器据此记录发送时间
+        if not self.send(packet, **values):
+            self.cancel_wait(response_cmd_id, future)
+            return None
+        return future
+
+    async def send_and_wait(self, packet: Union[str, PacketTemplate], response_cmd_id: Optional[int] = None,
+                            timeout: Optional[float] = None, idempotent: bool = False, **values) -> Optional[bytes]: # 发送数据包并等待对应的响应
+        """发送数据包并等待对应的响应，等待在发送之前登记
+
+        Args:
+            packet: 数据包 (十六进制字符串或预编译模板)
+            response_cmd_id: 响应的命令ID，默认与请求的命令ID相同
+            timeout: 超时时间(秒)，默认使用 battle_timeout
+            idempotent: 请求是否可以安全地重复发送 (例如查询列表)，是则等待期间断线时在重连后重发一次
+            **values: 模板参数槽位的取值
+
+        Returns:
+            Optional[bytes]: 响应数据包，发送失败、超时或断线返回 None
+        """
+        response_cmd_id = response_command(packet, response_cmd_id)
+        timeout = self.battle_timeout if timeout is None else timeout
+        response = None
+        for _ in range(2):
+            future = await self._send_expecting(packet, response_cmd_id, **values)
+            if future is None:
+                return None
+            response = await self._wait(future, response_cmd_id, timeout)
+            if response is not None or not idempotent or self.connected or not await self._ensure_connected():
+                break
+        return response
+
+    async def paced_send(self, packet: Union[str, PacketTemplate], response_cmd_id: Optional[int] = None,
+                         on_sent: Optional[Callable[[], None]] = None, **values) -> Optional[bytes]: # 发送一步操作并按节奏模式等待后再继续
+        """发送一步操作并按节奏模式等待，含义与 PetFightPacketManager._paced_send 相同
+
+        Returns:
+            Optional[bytes]: ack 模式下收到的响应数据包，其余情况返回 None
+        """
+        if self.pacing != "ack":
+            if await self.submit(packet, **values) and on_sent is not None:
+                on_sent()
+            await asyncio.sleep(self.operation_delay)
+            return None
+
+        response_cmd_id = response_command(packet, response_cmd_id)
+        future = await self._send_expecting(packet, response_cmd_id, **values)
+        if future is None:
+            return None
+        if on_sent is not None:
+            on_sent()
+        response = await self._wait(future, response_cmd_id, self.operation_delay)
+        if response is None:
+            self.pacing_timeouts += 1
+        else:
+            self.pacing_acked += 1
+        return response
+
+    async def send_batch(self, items: Iterable[Tuple[Union[str, PacketTemplate], Optional[Dict[str, int]], Optional[int]]],
+                         timeout: Optional[float] = None) -> List[Optional[bytes]]: # 批量发送互不依赖的数据包
+        """批量发送互不依赖的数据包，一次写出，再统一收集响应
+
+        Args:
+            items: (数据包, 参数槽位取值, 响应的命令ID) 序列，取值与响应命令ID可以为 None
+            timeout: 收集整批响应的总超时时间(秒)，默认使用 battle_timeout
+
+        Returns:
+            List[Optional[bytes]]: 与 items 一一对应的响应数据包，发送失败或超时的项为 None
+        """
+        items = [(packet, values, response_command(packet, response_cmd_id))
+                 for packet, values, response_cmd_id in items]
+        if not await self._ensure_connected():
+            self.logger.error("连接已断开，无法发送数据包")
+            return [None] * len(items)
+        expected = [self.expect(response_cmd_id, use_mailbox=False) for _, _, response_cmd_id in items]
+        await self._throttle(packet for packet, _, _ in items) # 一次预约整批所需的令牌
+        if not self.send_many((packet, values) for packet, values, _ in items):
+            for (_, _, response_cmd_id), future in zip(items, expected):
+                self.cancel_wait(response_cmd_id, future)
+            return [None] * len(items)
+
+        if expected:
+            await asyncio.wait(expected, timeout=self.battle_timeout if timeout is None else timeout)
+        responses: List[Optional[bytes]] = []
+        for (_, _, response_cmd_id), future in zip(items, expected):
+            if not future.done() and self.cancel_wait(response_cmd_id, future): # 超时
+                responses.append(None)
+            else:
+                responses.append(self._result(future, response_cmd_id))
+
+        failed = responses.count(None)
+        if failed:
+            self.logger.warning(f"批量发送 {len(items)} 个数据包，{failed} 个未收到响应")
+        return responses
+
+    def _on_fight_over(self, command_id: int, packet_data: bytes): # 收到战斗结束通知
+        if self.battle_over is not None and not self.battle_over.done():
+            self.battle_over.set_result(packet_data)
+
+    async def execute_battle_sequence(self, battle_type: str): # 执行战斗序列
+        """执行战斗序列，与 PetFightPacketManager._execute_battle_sequence 共用 battle_steps，
+        每一步等待服务器对应的战斗通知，服务器报告结果后不再发送剩余的技能
+
+        Args:
+            battle_type: 战斗类型
+
+        Raises:
+            PetFightError: 战斗类型未知或战斗已在进行中
+        """
+        packets = BATTLE_PACKETS.get(battle_type)
+        if packets is None:
+            raise PetFightError(f"执行战斗序列失败: 未知的战斗类型: {battle_type}")
+        if self.battle_over is not None:
+            raise PetFightError("执行战斗序列失败: 已在战斗中")
+
+        self.battle_over = asyncio.get_running_loop().create_future()
+        record = self.battle_engine.current
+        if record is not None and record.battle_type == battle_type and record.finished: # 结果在发起战斗后就已到达
+            self.battle_over.set_result(record.result)
+        try:
+            await self._run_steps(battle_steps(self.battle_engine, battle_type, packets, self.pacing == "ack"))
+        finally:
+            over, self.battle_over = self.battle_over, None
+            if not over.done():
+                over.cancel()
+
+    def _begin_battle(self, battle_type: str): # 在发送发起战斗的请求之前开始跟踪战斗 (仅 ack 节奏)
+        if self.pacing == "ack":
+            self.battle_engine.begin(battle_type)
+
+    async def _send_battle_step(self, packet: PacketTemplate, event: int): # 发送一个战斗数据包并等待对应的战斗通知
+        future = await self._send_expecting(packet, event)
+        if future is None:
+            return
+        # 通知到达或服务器已报告战斗结束都可以继续，最多等待 operation_delay
+        await asyncio.wait((future, self.battle_over), timeout=self.operation_delay, return_when=asyncio.FIRST_COMPLETED)
+        if future.done() or self.battle_over.done():
+            self.pacing_acked += 1
+        else:
+            self.pacing_timeouts += 1
+        if not future.done():
+            self.cancel_wait(event, future)
+
+    async def check_backpack_pets(self, pet_ids: Tuple[int, ...]) -> bool: # 确保背包里恰好是指定的宠物
+        """确保背包里恰好是指定的宠物 (按顺序)，与 PetFightPacketManager.check_backpack_pets 共用 backpack_steps
+
+        Returns:
+            bool: 是否成功完成检查和处理
+        """
+        try:
+            return await self._run_steps(backpack_steps(self.inventory, tuple(pet_ids)))
+        except Exception as e:
+            self.logger.error(f"检查背包宠物失败: {e}")
+            return False
+
+    async def _run_steps(self, steps): # 执行 backpack_steps / battle_steps 生成的步骤，返回生成器的返回值
+        try:
+            while True:
+                try:
+                    op, payload = next(steps)
+                except StopIteration as stop:
+                    return stop.value
+                await self._perform_step(op, payload)
+        finally:
+            steps.close()
+
+    async def _perform_step(self, op: str, payload): # 执行一个需要与服务器通信的步骤
+        if op == STEP_BACKPACK_LIST:
+            await self._refresh_backpack()
+        elif op == STEP_WAREHOUSE_LIST:
+            await self._refresh_warehouse(payload)
+        elif op == STEP_MOVE_PET:
+            await self._move_pet(*payload)
+        elif op == STEP_PACED:
+            await self.paced_send(payload)
+        elif op == STEP_BATTLE_EVENT:
+            await self._send_battle_step(*payload)
+        elif op == STEP_BATTLE_OVER:
+            await asyncio.wait((self.battle_over,), timeout=self.operation_delay)
+
+    async def _refresh_backpack(self): # 请求背包宠物列表并载入背包/仓库模型
+        generation = self.inventory.begin_refresh()
+        packet_data = await self.send_and_wait(BACKPACK_LIST_PACKET, BACKPACK_LIST_COMMAND, idempotent=True)
+        load_backpack_list(self.inventory, packet_data, generation)
+
+    async def _refresh_warehouse(self, pet_ids: Tuple[int, ...] = ()) -> WarehouseIndex: # 请求仓库宠物列表并载入背包/仓库模型
+        generation = self.inventory.begin_refresh()
+        packet_data = await self.send_and_wait(WAREHOUSE_LIST_PACKET, WAREHOUSE_LIST_COMMAND, idempotent=True)
+        return load_warehouse_list(self.inventory, packet_data, generation, pet_ids)
+
+    async def _move_pet(self, pet: PetInfo, to_backpack: bool): # 发送存取数据包并更新背包/仓库模型
+        sent = False
+
+        def on_sent():
+            nonlocal sent
+            sent = True
+
+        # 确认发出后才等待其响应，与 PetFightPacketManager._move_pet 相同
+        self.inventory.begin_move()
+        try:
+            await self.paced_send(PET_MOVE_PACKET, on_sent=on_sent, catch_time=pet.timestamp, location=1 if to_backpack else 0)
+        finally:
+            self.inventory.record_move(pet.pet_id, to_backpack, sent)
+
+    async def _check_mining_result(self) -> bool: # 检查矿物开采结果
+        future = self.expect(MINING_RESULT_COMMAND)
+        response = await self._wait(future, MINING_RESULT_COMMAND, self.battle_timeout)
+        return bool(response) and response[17] == 1 # 1表示成功
+
+    async def run_routine(self, name: str): # 执行 routines.json 中定义的日常
+        """执行 routines.json 中定义的日常
+
+        Raises:
+            PetFightError: 日常未定义或执行失败
+        """
+        try:
+            program = load_routines(self.routines_path)[name]
+        except (OSError, ValueError, KeyError, RoutineError) as e:
+            raise PetFightError(f"加载日常 {name} 失败: {str(e)}")
+
+        try:
+            await program.run_async(self, self.checkpoint)
+        except Exception as e:
+            self.logger.error(f"{program.title}失败: {e}")
+            raise PetFightError(f"{program.title}失败: {str(e)}")
+
+    async def execute_daily_tasks(self, routines: Iterable[str] = DAILY_ROUTINES) -> bool: # 依次执行日常
+        """依次执行日常，已完成的跳过，单个日常失败不影响其余日常
+
+        设置了 checkpoints 时每次执行都按当前时间载入当天的进度，跨过重置时间后使用新一天的进度；
+        进度文件的读写都在线程池中执行，不阻塞事件循环。
+
+        Returns:
+            bool: 是否全部成功
+        """
+        loop = asyncio.get_running_loop()
+        if self.checkpoints is not None: # 读取进度文件是阻塞的文件操作，放到线程池中执行
+            self.checkpoint = await loop.run_in_executor(None, self.checkpoints.load, self.userid)
+        success = True
+        for name in routines:
+            if self.checkpoint is not None and self.checkpoint.is_done(name):
+                self.logger.info(f"{name} 今天已完成，跳过")
+                continue
+            try:
+                await self.run_routine(name)
+                if self.checkpoint is not None:
+                    self.checkpoint.mark_done(name, flush=False)
+                    await loop.run_in_executor(None, self.checkpoint.flush)
+                self.logger.info(f"{name} 完成")
+                await asyncio.sleep(self.operation_delay)
+            except Exception as e:
+                self.logger.error(f"{name} 失败: {e}")
+                success = False
+        return success
+
+    def stats(self) -> dict: # 获取会话统计信息
+        """获取会话统计信息"""
+        return {
+            "userid": self.userid,
+            "connected": self.connected,
+            "key_ready": self.key_ready.is_set(),
+            "packets_sent": self.packets_sent,
+            "packets_received": self.packets_received,
+            "bytes_quarantined": self.bytes_quarantined,
+            "pacing_acked": self.pacing_acked,
+            "pacing_timeouts": self.pacing_timeouts,
+            "waiting": sum(len(waiters) for waiters in self.waiters.values()),
+            "reconnects": self.reconnects,
+            "battles": self.battle_engine.stats(),
+            "rate_limiter": self.rate_limiter.stats() if self.rate_limiter is not None else None,
+        }
+
+    def __repr__(self) -> str: # 返回对象的详细字符串表示
+        return f"AsyncClient(userid={self.userid}, connected={self.connected})"
+
+async def connect(host: str, port: int, userid: int, **kwargs) -> AsyncClient: # 建立一个会话连接
+    """连接到服务器并返回会话 (不发送登录数据包，用于已有凭证或测试)
+
+    Args:
+        host: 服务器地址
+        port: 端口
+        userid: 用户ID
+        **kwargs: 传给 AsyncClient 的参数
+
+    Returns:
+        AsyncClient: 已连接的会话
+    """
+    loop = asyncio.get_running_loop()
+    client = AsyncClient(userid, **kwargs)
+    await loop.create_connection(lambda: client, host, port)
+    return client
+
+async def login(userid: int, password: str, key_timeout: float = 10.0, interactive: bool = True,
+                **kwargs) -> AsyncClient: # 登录并返回会话
+    """登录并返回密钥已初始化的会话
+
+    登录验证使用阻塞的 HTTP 请求与 socket，放到默认线程池中执行；
+    登录数据包发出后 socket 交给事件循环，此后的收发都不再占用线程。
+    多个会话同时需要验证码时逐个提示输入 (Login.CAPTCHA_LOCK)。
+
+    Args:
+        userid: 用户ID
+        password: 密码
+        key_timeout: 等待服务器下发密钥的超时时间（秒）
+        interactive: 需要验证码时是否在控制台提示输入，为 False 时登录直接失败
+        **kwargs: 传给 AsyncClient 的参数
+
+    Returns:
+        AsyncClient: 已登录的会话
+
+    Raises:
+        ConnectionError: 登录失败 (包括不允许交互时需要验证码) 或等待密钥超时
+    """
+    from Login import Login # 登录依赖 requests，只在真正登录时导入
+
+    loop = asyncio.get_running_loop()
+    client = AsyncClient(userid, **kwargs)
+    login_method = Login(client.algorithms, interactive).login
+
+    async def connector(): # 断线后重新登录
+        return await loop.run_in_executor(None, login_method, userid, password)
+
+    tcp_socket = await connector()
+    if tcp_socket is None:
+        raise ConnectionError(f"用户 {userid} 登录失败")
+    await loop.create_connection(lambda: client, sock=tcp_socket)
+    if not await client.wait_for_key(key_timeout):
+        client.close()
+        raise ConnectionError(f"用户 {userid} 等待密钥初始化超时")
+    client.connector = connector
+    return client
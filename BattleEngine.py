@@ -0,0 +1,198 @@
+import time # 导入 time 模块，用于记录战斗各阶段的时间
+import logging # 导入 logging 模块，用于日志记录
+import threading # 导入 threading 模块，用于在通知到达时唤醒等待方
+from collections import deque # 导入 deque，用作最近战斗记录的环形缓冲区
+from dataclasses import dataclass, field # 从 dataclasses 模块导入 dataclass，用于创建简单的数据类
+from typing import Dict, List, Optional # 从 typing 模块导入类型提示
+
+# 战斗相关的命令ID
+READY_TO_FIGHT = 2404 # 客户端：载入战斗
+USE_SKILL = 2405 # 客户端：使用技能
+NOTE_READY_TO_FIGHT = 2503 # 服务器：双方准备完毕
+NOTE_START_FIGHT = 2504 # 服务器：战斗开始
+NOTE_USE_SKILL = 2505 # 服务器：一回合的技能结果
+FIGHT_OVER = 2506 # 服务器：战斗结束
+
+# 客户端请求 -> 表示该请求已被处理的服务器通知
+STEP_EVENTS = {
+    READY_TO_FIGHT: NOTE_START_FIGHT,
+    USE_SKILL: NOTE_USE_SKILL,
+}
+
+@dataclass # 使用 dataclass 装饰器，自动生成 __init__, __repr__ 等方法
+class BattleRecord: # 定义 BattleRecord 数据类，记录一场战斗的过程
+    """一场战斗的记录"""
+    battle_type: str # 战斗类型
+    begun_at: float # 开始发送战斗数据包的时间 (monotonic)
+    ready_at: Optional[float] = None # 收到 NOTE_READY_TO_FIGHT 的时间
+    started_at: Optional[float] = None # 收到 NOTE_START_FIGHT 的时间
+    ended_at: Optional[float] = None # 收到 FIGHT_OVER 的时间
+    rounds: int = 0 # 收到的 NOTE_USE_SKILL 回合数
+    round_times: List[float] = field(default_factory=list) # 每回合结果到达的时间
+    result: Optional[bytes] = None # FIGHT_OVER 数据包内容
+    timed_out: bool = False # 是否未等到 FIGHT_OVER 就结束
+
+    @property
+    def finished(self) -> bool: # 服务器是否已报告战斗结束
+        return self.ended_at is not None
+
+    @property
+    def duration(self) -> Optional[float]: # 从开始到服务器报告结束的耗时（秒）
+        return self.ended_at - self.begun_at if self.ended_at is not None else None
+
+class BattleEngine: # 定义 BattleEngine 类，根据服务器的战斗通知跟踪战斗状态
+    """战斗状态机
+
+    订阅服务器的战斗通知 (2503 准备完毕、2504 战斗开始、2505 回合结果、2506 战斗结束)，
+    跟踪当前战斗的开始、回合与结束，发送方可以等待某一步对应的通知，
+    并在服务器报告战斗结果的瞬间结束战斗，不再依赖固定的休眠时间。
+    """
+
+    def __init__(self, receive_packet_analysis, history: int = 100): # 初始化方法
+        """初始化战斗状态机并订阅战斗通知
+
+        Args:
+            receive_packet_analysis: ReceivePacketAnalysis 实例
+            history: 保留的最近战斗记录数量
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.receive_packet_analysis = receive_packet_analysis
+        self.condition = threading.Condition() # 保护状态，并在通知到达时唤醒等待方
+        self.current: Optional[BattleRecord] = None # 当前战斗
+        self.counts: Dict[int, int] = {} # 当前战斗中各通知的到达次数
+        self.history = deque(maxlen=history) # 最近的战斗记录
+
+        # 在解码线程中同步处理，保证通知按到达顺序更新状态
+        self.handlers = {
+            NOTE_READY_TO_FIGHT: self._on_ready,
+            NOTE_START_FIGHT: self._on_start,
+            NOTE_USE_SKILL: self._on_round,
+            FIGHT_OVER: self._on_over,
+        }
+        for command_id, handler in self.handlers.items():
+            receive_packet_analysis.subscribe(command_id, handler, inline=True)
+
+    @property
+    def fighting(self) -> bool: # 服务器是否已开始战斗且尚未结束
+        current = self.current
+        return current is not None and current.started_at is not None and not current.finished
+
+    def begin(self, battle_type: str) -> BattleRecord: # 开始跟踪一场新的战斗
+        """开始跟踪一场新的战斗，应在发送发起战斗的请求 (例如关卡请求) 之前调用，
+        否则在此之前到达的战斗通知不会记录到这场战斗
+
+        Args:
+            battle_type: 战斗类型
+
+        Returns:
+            BattleRecord: 新战斗的记录
+        """
+        with self.condition:
+            self.current = BattleRecord(battle_type, time.monotonic())
+            self.counts = {}
+            return self.current
+
+    def mark(self, command_id: int) -> int: # 获取某个通知当前的到达次数
+        """获取某个通知当前的到达次数，发送请求之前调用，之后传给 wait_event"""
+        with self.condition:
+            return self.counts.get(command_id, 0)
+
+    def wait_event(self, command_id: int, mark: int, timeout: float) -> bool: # 等待某个通知再次到达
+        """等待某个通知在 mark 之后再次到达，或者战斗结束
+
+        Args:
+            command_id: 通知的命令ID
+            mark: mark 返回的到达次数
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            bool: 通知已到达或战斗已结束时为 True，超时为 False
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.counts.get(command_id, 0) > mark or self._over(), timeout
+            )
+
+    def wait_over(self, timeout: float) -> bool: # 等待服务器报告战斗结束
+        """等待服务器报告当前战斗结束
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            bool: 战斗是否已结束
+        """
+        with self.condition:
+            return self.condition.wait_for(self._over, timeout)
+
+    def finish(self) -> Optional[BattleRecord]: # 结束跟踪当前战斗并写入历史记录
+        """结束跟踪当前战斗，未收到 FIGHT_OVER 时标记为超时
+
+        Returns:
+            Optional[BattleRecord]: 当前战斗的记录
+        """
+        with self.condition:
+            record, self.current = self.current, None
+            if record is None:
+                return None
+            record.timed_out = not record.finished
+            self.history.append(record)
+        if record.timed_out:
+            self.logger.warning(f"战斗 {record.battle_type} 未收到结束通知")
+        else:
+            self.logger.info(
+                f"战斗 {record.battle_type} 结束：{record.rounds} 回合，耗时 {record.duration:.3f} 秒"
+            )
+        return record
+
+    def _over(self) -> bool: # 当前战斗是否已结束 (调用方需持有 condition)
+        return self.current is None or self.current.finished
+
+    def _note(self, command_id: int) -> Optional[BattleRecord]: # 记录通知到达并返回当前战斗
+        self.counts[command_id] = self.counts.get(command_id, 0) + 1
+        self.condition.notify_all()
+        return self.current
+
+    def _on_ready(self, command_id: int, packet_data: bytes): # NOTE_READY_TO_FIGHT
+        with self.condition:
+            record = self._note(command_id)
+            if record is not None:
+                record.ready_at = time.monotonic()
+
+    def _on_start(self, command_id: int, packet_data: bytes): # NOTE_START_FIGHT
+        with self.condition:
+            record = self._note(command_id)
+            if record is not None:
+                record.started_at = time.monotonic()
+
+    def _on_round(self, command_id: int, packet_data: bytes): # NOTE_USE_SKILL
+        with self.condition:
+            record = self._note(command_id)
+            if record is not None:
+                record.rounds += 1
+                record.round_times.append(time.monotonic())
+
+    def _on_over(self, command_id: int, packet_data: bytes): # FIGHT_OVER
+        with self.condition:
+            record = self.current
+            if record is not None and not record.finished:
+                record.ended_at = time.monotonic()
+                record.result = bytes(packet_data)
+            self._note(command_id)
+
+    def stats(self) -> dict: # 获取最近战斗的统计信息
+        """获取最近战斗的统计信息"""
+        with self.condition:
+            records = list(self.history)
+        finished = [record.duration for record in records if not record.timed_out]
+        return {
+            "battles": len(records),
+            "timed_out": len(records) - len(finished),
+            "average_duration": sum(finished) / len(finished) if finished else None,
+            "average_rounds": sum(record.rounds for record in records) / len(records) if records else None,
+        }
+
+    def close(self): # 取消订阅战斗通知
+        """取消订阅战斗通知"""
+        for command_id, handler in self.handlers.items():
+            self.receive_packet_analysis.unsubscribe(command_id, handler)
@@ -0,0 +1,171 @@
+import os # 导入 os 模块，用于创建目录与原子替换进度文件
+import json # 导入 json 模块，用于读写进度文件
+import logging # 导入 logging 模块，用于日志记录
+import datetime # 导入 datetime 模块，用于按日期区分进度
+import threading # 导入 threading 模块，用于保护进度数据
+from typing import Any, Dict, Optional # 从 typing 模块导入类型提示
+
+DEFAULT_CHECKPOINT_DIR = 'checkpoints' # 默认的进度文件目录
+CHECKPOINT_FORMAT = 1 # 进度文件格式版本，格式变化时递增使旧进度失效
+
+class Checkpoint: # 定义 Checkpoint 类，表示一个账号一天的日常进度
+    """一个账号一天的日常进度
+
+    记录已完成的日常任务，以及正在执行的日常程序的位置 (指令位置、循环计数与循环变量)。
+    每次修改默认立即写入文件 (先写临时文件再替换)，程序中断后重新执行时跳过已完成的任务，
+    未完成的日常从中断的那一轮循环继续。
+    修改时传入 flush=False 只更新内存中的进度，之后由 flush 一次写入，
+    事件循环中的会话据此把文件读写放到线程池中 (多次修改合并为一次写入)。
+    """
+
+    def __init__(self, path: str, account: int, day: str): # 初始化方法
+        """加载进度文件，不存在或已损坏时从空进度开始
+
+        Args:
+            path: 进度文件路径
+            account: 账号 (用户ID)
+            day: 日期，格式为 YYYY-MM-DD
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.path = path
+        self.account = account
+        self.day = day
+        self.lock = threading.Lock() # 保护 data
+        self.write_lock = threading.Lock() # 保证按修改顺序写入文件 (先于 lock 获取)
+        self.data: Dict[str, Any] = self._load()
+        self.dirty = False # 是否有尚未写入文件的修改
+
+    def _load(self) -> Dict[str, Any]: # 读取进度文件
+        empty = {'format': CHECKPOINT_FORMAT, 'account': self.account, 'day': self.day, 'tasks': [], 'routines': {}}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return empty
+        except (OSError, ValueError) as e: # 文件损坏时从头开始
+            self.logger.warning(f"读取进度文件 {self.path} 失败，从头开始: {e}")
+            return empty
+        if data.get('format') != CHECKPOINT_FORMAT or data.get('day') != self.day:
+            return empty
+        return data
+
+    def flush(self) -> bool: # 写入尚未保存的修改
+        """把尚未写入文件的修改写入进度文件 (阻塞，事件循环中应放到线程池执行)
+
+        Returns:
+            bool: 是否有修改需要写入
+        """
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return False
+                text = json.dumps(self.data, ensure_ascii=False)
+                self.dirty = False
+            self._write(text)
+            return True
+
+    def _write(self, text: str): # 写入进度文件 (调用方需持有 write_lock)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(text)
+            os.replace(temp_path, self.path)
+        except OSError as e: # 写入失败不影响日常执行，只是无法断点续跑
+            self.logger.error(f"写入进度文件 {self.path} 失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def is_done(self, task: str) -> bool: # 任务今天是否已完成
+        """任务今天是否已完成"""
+        with self.lock:
+            return task in self.data['tasks']
+
+    def mark_done(self, task: str, flush: bool = True): # 记录任务已完成
+        """记录任务已完成，同时清除该任务的日常程序进度
+
+        Args:
+            task: 任务名称
+            flush: 是否立即写入文件，为 False 时由之后的 flush 写入
+        """
+        with self.lock:
+            if task not in self.data['tasks']:
+                self.data['tasks'].append(task)
+            self.data['routines'].pop(task, None)
+            self.dirty = True
+        if flush:
+            self.flush()
+
+    def routine_state(self, name: str, signature: str) -> Optional[Dict[str, Any]]: # 获取日常程序的中断位置
+        """获取日常程序的中断位置
+
+        Args:
+            name: 日常名称
+            signature: 程序签名，日常定义修改后旧的进度不再适用
+
+        Returns:
+            Optional[Dict[str, Any]]: 中断位置 (position、loops、variables)，没有可用进度时返回 None
+        """
+        with self.lock:
+            state = self.data['routines'].get(name)
+        if state is None or state.get('signature') != signature:
+            return None
+        return state
+
+    def save_routine(self, name: str, state: Dict[str, Any], flush: bool = True): # 保存日常程序的执行位置
+        """保存日常程序的执行位置 (应包含 signature、position、loops、variables)，
+        flush 为 False 时只更新内存中的进度，由之后的 flush 写入"""
+        with self.lock:
+            self.data['routines'][name] = state
+            self.dirty = True
+        if flush:
+            self.flush()
+
+    def finish_routine(self, name: str, flush: bool = True): # 日常程序执行完毕，清除执行位置
+        """日常程序执行完毕，清除执行位置，flush 为 False 时由之后的 flush 写入"""
+        with self.lock:
+            if self.data['routines'].pop(name, None) is None:
+                return
+            self.dirty = True
+        if flush:
+            self.flush()
+
+    def reset(self): # 清空今天的进度
+        """清空今天的进度"""
+        with self.lock:
+            self.data['tasks'] = []
+            self.data['routines'] = {}
+            self.dirty = True
+        self.flush()
+
+class CheckpointStore: # 定义 CheckpointStore 类，管理所有账号的进度文件
+    """进度文件目录，每个账号每天一个文件"""
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIR, reset_hour: int = 0): # 初始化方法
+        """
+        Args:
+            directory: 进度文件目录
+            reset_hour: 每天的日常在几点重置，此前的时间算作前一天
+        """
+        self.directory = directory
+        self.reset_hour = reset_hour
+
+    def today(self) -> str: # 当前的日常日期
+        """当前的日常日期 (YYYY-MM-DD)，重置时间之前算作前一天"""
+        now = datetime.datetime.now() - datetime.timedelta(hours=self.reset_hour)
+        return now.strftime('%Y-%m-%d')
+
+    def load(self, account: int, day: Optional[str] = None) -> Checkpoint: # 获取账号某天的进度
+        """获取账号某天的进度
+
+        Args:
+            account: 账号 (用户ID)
+            day: 日期 (YYYY-MM-DD)，默认为今天
+
+        Returns:
+            Checkpoint: 进度
+        """
+        day = day or self.today()
+        os.makedirs(self.directory, exist_ok=True)
+        return Checkpoint(os.path.join(self.directory, f"{account}-{day}.json"), account, day)
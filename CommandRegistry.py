@@ -0,0 +1,132 @@
+import os # 导入 os 模块，用于获取文件状态与原子替换缓存文件
+import json # 导入 json 模块，用于解析 Command.json
+import marshal # 导入 marshal 模块，用于读写预编译的命令表缓存
+import logging # 导入 logging 模块，用于日志记录
+import threading # 导入 threading 模块，用于保证注册表只加载一次
+from typing import Dict, Optional, Tuple # 从 typing 模块导入类型提示
+
+DEFAULT_COMMAND_PATH = 'Command.json' # 默认的命令配置文件
+CACHE_SUFFIX = '.cache' # 预编译缓存文件的后缀，与 JSON 放在同一目录
+CACHE_FORMAT = 1 # 缓存格式版本，格式变化时递增使旧缓存失效
+UNKNOWN_COMMAND = 'Unknown Command' # 未知命令的名称
+
+_registries: Dict[str, 'CommandRegistry'] = {} # 进程内共享的注册表，键为命令配置文件的绝对路径
+_registries_lock = threading.Lock() # 保护 _registries
+
+class CommandRegistry: # 定义 CommandRegistry 类，表示命令ID与命令名称的映射表
+    """命令注册表
+
+    以整数命令ID为键保存命令名称，并提供名称到命令ID的反向索引。
+    解析后的命令表以 marshal 格式缓存在 JSON 旁边，JSON 的修改时间或大小变化时自动重建。
+    通常通过 get_registry 获取进程内共享的实例，多个账号共用同一份命令表。
+    """
+
+    def __init__(self, path: str = DEFAULT_COMMAND_PATH): # 初始化方法
+        """加载命令表
+
+        Args:
+            path: 命令配置文件路径
+
+        Raises:
+            FileNotFoundError: 如果命令配置文件不存在
+            json.JSONDecodeError: 如果命令配置文件格式错误
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.path = path # 命令配置文件路径
+        self.cache_path = os.path.splitext(path)[0] + CACHE_SUFFIX # 预编译缓存文件路径
+        self.names: Dict[int, Tuple[str, ...]] = self._load() # 命令ID -> 命令名称 (部分命令有多个名称)
+        self.ids: Dict[str, int] = { # 命令名称 -> 命令ID
+            name: command_id for command_id, names in self.names.items() for name in names
+        }
+
+    def _load(self) -> Dict[int, Tuple[str, ...]]: # 优先从缓存加载命令表
+        """加载命令表，缓存有效时直接读取缓存，否则解析 JSON 并重建缓存"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError: # 捕获文件未找到异常
+            self.logger.error(f"{self.path} 文件不存在") # 记录错误日志
+            raise # 重新抛出异常
+        signature = (CACHE_FORMAT, stat.st_mtime_ns, stat.st_size) # 缓存对应的 JSON 版本
+
+        try:
+            with open(self.cache_path, 'rb') as file:
+                cached_signature, names = marshal.loads(file.read()) # 整块读取后解析，逐段读文件对象要慢得多
+            if tuple(cached_signature) == signature:
+                return names
+        except (OSError, EOFError, ValueError, TypeError): # 缓存不存在或已损坏时重新解析 JSON
+            pass
+
+        names = self._parse_json()
+        self._write_cache(signature, names)
+        return names
+
+    def _parse_json(self) -> Dict[int, Tuple[str, ...]]: # 解析命令配置文件
+        """解析 Command.json，键转换为整数，名称列表转换为元组"""
+        try:
+            with open(self.path, 'r') as file: # 打开命令配置文件进行读取
+                data = json.load(file) # 解析 JSON 文件内容
+        except json.JSONDecodeError: # 捕获 JSON 解析异常
+            self.logger.error(f"{self.path} 格式错误") # 记录错误日志
+            raise # 重新抛出异常
+        return {int(command_id): tuple(names) for command_id, names in data.items()}
+
+    def _write_cache(self, signature: tuple, names: Dict[int, Tuple[str, ...]]): # 写入预编译缓存
+        """写入预编译缓存，先写临时文件再替换，写入失败 (例如目录只读) 时只记录日志"""
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(marshal.dumps((signature, names)))
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            self.logger.debug(f"写入命令表缓存失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def name(self, command_id: int) -> str: # 根据命令ID获取命令名称
+        """获取命令名称
+
+        Args:
+            command_id: 命令ID (整数)
+
+        Returns:
+            str: 命令的第一个名称，如果未找到则返回 'Unknown Command'
+        """
+        names = self.names.get(command_id)
+        return names[0] if names else UNKNOWN_COMMAND
+
+    def id(self, name: str) -> Optional[int]: # 根据命令名称获取命令ID
+        """获取命令ID
+
+        Args:
+            name: 命令名称，例如 'NOTE_START_FIGHT'
+
+        Returns:
+            Optional[int]: 命令ID，如果未找到则返回 None
+        """
+        return self.ids.get(name)
+
+    def __contains__(self, command_id: int) -> bool: # 判断命令ID是否已登记
+        return command_id in self.names
+
+    def __len__(self) -> int: # 已登记的命令数量
+        return len(self.names)
+
+def get_registry(path: str = DEFAULT_COMMAND_PATH) -> CommandRegistry: # 获取进程内共享的命令注册表
+    """获取进程内共享的命令注册表，同一文件只会加载一次
+
+    Args:
+        path: 命令配置文件路径
+
+    Returns:
+        CommandRegistry: 命令注册表
+    """
+    key = os.path.abspath(path)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(key)
+            if registry is None: # 双重检查，避免多个线程重复加载
+                registry = _registries[key] = CommandRegistry(path)
+    return registry
@@ -1,13 +1,22 @@
 import hashlib, requests, socket, struct # 导入所需模块：hashlib 用于MD5加密，requests 用于HTTP请求，socket 用于网络通信，struct 用于处理字节数据
 import logging # 导入 logging 模块
+import threading # 导入 threading 模块，用于串行处理多个账号的验证码
 
 # 配置 logging
 logger = logging.getLogger(__name__)
 from Algorithms import Algorithms # 从 Algorithms 文件导入 Algorithms 类
 
+# 验证码图片写入同一个文件并在控制台提示输入，多个账号在线程池中同时登录时逐个处理
+CAPTCHA_LOCK = threading.Lock()
+
+class CaptchaRequired(ConnectionError): # 定义 CaptchaRequired 异常，表示登录需要输入验证码但不允许交互
+    """登录需要输入验证码，但当前登录不允许交互 (例如无人值守的多账号会话)"""
+    pass
+
 class Login(): # 定义 Login 类，处理登录逻辑
-    def __init__(self, algorithms: Algorithms): # 初始化方法，接收一个 Algorithms 对象作为参数
+    def __init__(self, algorithms: Algorithms, interactive: bool = True): # 初始化方法，接收一个 Algorithms 对象作为参数
         self.algorithms = algorithms # 将传入的 Algorithms 对象赋值给实例变量
+        self.interactive = interactive # 需要验证码时是否在控制台提示输入，为 False 时抛出 CaptchaRequired
         self.serverList = { # 定义服务器列表，键为服务器编号，值为端口号
         1: 1241, 2: 1242, 3: 1243, 4: 1244, 5: 1245, 6: 1246, 7: 1247, 8: 1248, 9: 1249, 10: 1250,
         11: 1251, 12: 1252, 13: 1253, 14: 1254, 15: 1255, 16: 1256, 17: 1257, 18: 1258, 19: 1259, 20: 1260,
@@ -71,13 +80,16 @@ class Login(): # 定义 Login 类，处理登录逻辑
             logger.warning('密码错误') # 使用 logging 记录密码错误信息
         elif recv_packet_body[3] == 2:
             logger.warning('验证码错误') # 使用 logging 记录验证码错误信息
-            with open(r'验证码.bmp', 'wb')as f: # 将返回的验证码图片数据保存到文件
-                f.write(recv_packet_body[24:])
-            _verification_code_num = recv_packet_body[4:4+16] # 提取新的验证码编号
-            _verification_code = input('请查看保存在代码运行目录下的验证码图片并输入验证码：').encode() # 提示用户输入验证码
+            if not self.interactive: # 无法提示输入时直接失败，而不是阻塞在 input 上
+                raise CaptchaRequired(f"用户 {userid} 登录需要输入验证码")
+            with CAPTCHA_LOCK: # 同一时间只有一个账号写入验证码图片并等待输入
+                with open(r'验证码.bmp', 'wb')as f: # 将返回的验证码图片数据保存到文件
+                    f.write(recv_packet_body[24:])
+                _verification_code_num = recv_packet_body[4:4+16] # 提取新的验证码编号
+                _verification_code = input(f'请查看保存在代码运行目录下的验证码图片并输入用户 {userid} 的验证码：').encode() # 提示用户输入验证码
             if len(_verification_code) == 4: # 如果输入的验证码长度为4
                 # 递归调用 login_verify 方法，使用新的验证码信息进行重试
-                self.login_verify(userid, double_md5_password, _verification_code_num, _verification_code)
+                return self.login_verify(userid, double_md5_password, _verification_code_num, _verification_code)
         return recv_data # 返回服务器的原始响应数据
 
     def LOGIN_IN(self, userid_bytes, recv_body): # 构建最终登录游戏服务器的数据包
@@ -0,0 +1,105 @@
+import struct # 导入 struct 模块，用于按类型写入参数槽位
+from functools import lru_cache # 导入 lru_cache，用于缓存由十六进制字符串编译出的模板
+from typing import Dict, Optional, Tuple # 从 typing 模块导入类型提示
+from Algorithms import xor_crc8 # 从 Algorithms 文件导入包体异或校验函数
+
+HEADER_LENGTH = 17 # 包头长度：长度(4) + 版本(1) + 命令ID(4) + 用户ID(4) + 序列号(4)
+_SERIAL = struct.Struct('>I') # 序列号字段的打包格式
+
+class PacketTemplate: # 定义 PacketTemplate 类，表示预编译的发送数据包模板
+    """预编译的数据包模板
+
+    十六进制字符串只在构造时解析一次，得到版本号、命令ID与包体，并预先计算包体的异或校验值。
+    参数槽位 (slots) 以包体内偏移和 struct 格式描述，发送时只需写入槽位、用户ID与序列号。
+    """
+
+    def __init__(self, packet: str, slots: Optional[Dict[str, Tuple[int, str]]] = None): # 初始化方法
+        """编译数据包模板
+
+        Args:
+            packet: 十六进制字符串格式的原始数据包，用户ID与序列号字段会被忽略
+            slots: 参数槽位，键为参数名，值为 (包体内偏移, struct 格式)，例如 {'stage': (8, '>I')}
+
+        Raises:
+            ValueError: 如果数据包长度小于17字节或槽位超出包体范围
+        """
+        raw = bytes.fromhex(packet) # 只在编译时解析一次十六进制字符串
+        if len(raw) < HEADER_LENGTH: # 检查数据包长度是否足够包含头部信息
+            raise ValueError("数据包长度不足 (至少需要17字节)")
+
+        self.length = int.from_bytes(raw[0:4], byteorder='big') # 包总长度 (沿用原始包中的长度字段)
+        self.version = raw[4] # 版本号
+        self.cmd_id = int.from_bytes(raw[5:9], byteorder='big') # 命令ID
+        self.body = raw[HEADER_LENGTH:] # 包体 (槽位处为默认值)
+
+        # 编译参数槽位
+        self.slots: Dict[str, Tuple[int, struct.Struct]] = {}
+        for name, (offset, fmt) in (slots or {}).items():
+            packer = struct.Struct(fmt)
+            if offset < 0 or offset + packer.size > len(self.body): # 槽位必须完整落在包体内
+                raise ValueError(f"参数槽位 {name} 超出包体范围")
+            self.slots[name] = (HEADER_LENGTH + offset, packer) # 保存为相对整个数据包的偏移
+
+        # 预先计算不含槽位部分的包体校验值，发送时只需再异或槽位字节
+        static_body = bytearray(self.body)
+        for offset, packer in self.slots.values():
+            static_body[offset - HEADER_LENGTH:offset - HEADER_LENGTH + packer.size] = bytes(packer.size)
+        self.static_crc = xor_crc8(static_body) if self.cmd_id > 1000 else 0 # 命令ID不大于1000时校验值固定为0
+
+        # 预先组装好的数据包原型，用户ID与序列号字段清零
+        self._prototype = raw[:9] + bytes(8) + self.body
+
+    @classmethod
+    def from_hex(cls, packet: str) -> 'PacketTemplate': # 由十六进制字符串获取 (缓存的) 无参数模板
+        """获取十六进制字符串对应的模板，同一字符串只会解析一次
+
+        Args:
+            packet: 十六进制字符串格式的原始数据包
+
+        Returns:
+            PacketTemplate: 编译好的模板
+        """
+        return _compile(packet)
+
+    def render(self, values: Optional[Dict[str, int]] = None) -> Tuple[bytearray, int]: # 填入参数槽位
+        """复制数据包原型并填入参数槽位
+
+        Args:
+            values: 参数名到参数值的映射，未提供的槽位保留模板中的默认值
+
+        Returns:
+            Tuple[bytearray, int]: 待写入用户ID与序列号的数据包，以及用于计算序列号的校验值
+
+        Raises:
+            ValueError: 如果传入了模板中不存在的参数
+        """
+        buffer = bytearray(self._prototype)
+        crc = self.static_crc
+        if values:
+            for name, value in values.items():
+                if name not in self.slots:
+                    raise ValueError(f"模板中不存在参数槽位: {name}")
+                offset, packer = self.slots[name]
+                packer.pack_into(buffer, offset, value)
+        if self.cmd_id > 1000: # 只有参与校验的命令才需要异或槽位字节
+            for offset, packer in self.slots.values():
+                crc ^= xor_crc8(buffer[offset:offset + packer.size])
+        return buffer, crc
+
+    def stamp(self, buffer: bytearray, user_id: bytes, serial: int): # 写入用户ID与序列号
+        """向已填好参数的数据包写入用户ID与序列号
+
+        Args:
+            buffer: render 返回的数据包
+            user_id: 4字节大端序用户ID
+            serial: 由序列号分配器计算出的序列号
+        """
+        buffer[9:13] = user_id
+        _SERIAL.pack_into(buffer, 13, serial)
+
+    def __repr__(self) -> str: # 返回对象的详细字符串表示
+        return f"PacketTemplate(cmd_id={self.cmd_id}, body_length={len(self.body)}, slots={list(self.slots)})"
+
+@lru_cache(maxsize=1024) # 大部分封包都是固定的字面量，缓存后每个字符串只解析一次
+def _compile(packet: str) -> PacketTemplate:
+    return PacketTemplate(packet)
@@ -0,0 +1,93 @@
+import time # 导入 time 模块，用于记录封包时间
+import logging # 导入 logging 模块，用于日志记录
+import threading # 导入 threading 模块，用于保护环形缓冲区
+from collections import deque # 导入 deque，用作固定容量的环形缓冲区
+from dataclasses import dataclass # 从 dataclasses 模块导入 dataclass，用于创建简单的数据类
+from typing import List, Optional # 从 typing 模块导入类型提示
+
+DEFAULT_TRACE_CAPACITY = 128 # 默认保留的最近封包数量
+
+@dataclass # 使用 dataclass 装饰器，自动生成 __init__, __repr__ 等方法
+class PacketRecord: # 定义 PacketRecord 数据类，表示环形缓冲区中的一条封包记录
+    """封包记录"""
+    timestamp: float # 记录时间
+    direction: str # 方向："send" 或 "recv"
+    cmd_id: int # 命令ID
+    data: bytes # 明文封包
+    raw: Optional[bytes] = None # 线上的原始字节 (发送时为加密后的封包)
+
+class HexDump: # 延迟格式化的十六进制输出，只有日志真正输出时才会调用 __str__
+    """延迟格式化的十六进制字符串"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data): # 初始化方法，只保存引用，不做任何格式化
+        self.data = data
+
+    def __str__(self) -> str: # 一次性生成以空格分隔的大写十六进制字符串
+        return self.data.hex(' ').upper()
+
+class PacketTrace: # 定义 PacketTrace 类，负责封包日志与最近封包的环形缓冲
+    """封包追踪
+
+    每个封包只以引用形式记录到固定容量的环形缓冲区中，十六进制格式化延迟到日志真正输出时才进行，
+    日志级别未开启时热路径上没有任何字符串格式化开销。出错时可以调用 dump 输出最近的封包。
+    """
+
+    def __init__(self, capacity: int = DEFAULT_TRACE_CAPACITY, level: int = logging.DEBUG): # 初始化方法
+        """初始化封包追踪
+
+        Args:
+            capacity: 环形缓冲区容量，为 0 时不保留封包
+            level: 逐包十六进制日志的输出级别
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.level = level # 逐包日志级别
+        self.records = deque(maxlen=capacity) # 最近封包的环形缓冲区
+        self.lock = threading.Lock() # 发送线程与接收线程会同时写入
+
+    def record(self, direction: str, cmd_id: int, data, raw=None, name: str = None): # 记录一个封包
+        """记录一个封包，并在日志级别开启时输出十六进制内容
+
+        Args:
+            direction: 方向："send" 或 "recv"
+            cmd_id: 命令ID
+            data: 明文封包 (调用方之后不应再修改它)
+            raw: 线上的原始字节，可选
+            name: 命令名称，可选
+        """
+        if self.records.maxlen:
+            with self.lock:
+                self.records.append(PacketRecord(time.time(), direction, cmd_id, data, raw))
+
+        if self.logger.isEnabledFor(self.level): # 未开启时不产生任何格式化开销
+            self.logger.log(self.level, "%s %s (CmdId: %d): %s", direction, name or '', cmd_id, HexDump(data))
+            if raw is not None:
+                self.logger.log(self.level, "%s raw (CmdId: %d): %s", direction, cmd_id, HexDump(raw))
+
+    def snapshot(self) -> List[PacketRecord]: # 获取当前缓冲区中的封包副本
+        """获取最近封包列表 (从旧到新)"""
+        with self.lock:
+            return list(self.records)
+
+    def dump(self, reason: str = '', level: int = logging.ERROR): # 输出最近的封包，通常在出错时调用
+        """把环形缓冲区中的最近封包写入日志
+
+        Args:
+            reason: 输出原因，会写在第一行
+            level: 输出级别
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        records = self.snapshot()
+        self.logger.log(level, "最近 %d 个封包 %s", len(records), reason)
+        for record in records:
+            self.logger.log(
+                level, "  %.3f %s (CmdId: %d): %s",
+                record.timestamp, record.direction, record.cmd_id, HexDump(record.data)
+            )
+
+    def clear(self): # 清空环形缓冲区
+        """清空最近封包"""
+        with self.lock:
+            self.records.clear()
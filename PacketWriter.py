@@ -0,0 +1,230 @@
+import queue # 导入 queue 模块，使用其中的 Full 异常表示队列已满
+import socket # 导入 socket 模块，用于判断 sendmsg 是否可用
+import logging # 导入 logging 模块，用于日志记录
+import threading # 导入 threading 模块，用于写线程与条件变量
+import itertools # 导入 itertools 模块，用于截取待写出的缓冲区
+from collections import deque # 导入 deque，用作发送队列
+from concurrent.futures import Future # 导入 Future，用于通知每个封包的发送结果
+from typing import Iterable, List, Optional # 从 typing 模块导入类型提示
+
+IOV_MAX = 512 # 单次 sendmsg 提交的最大缓冲区数量
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg') # Windows 上没有 sendmsg，退化为拼接后 sendall
+
+class FrameDiscarded(ConnectionError): # 封包没有写出就被丢弃时的异常
+    """封包还在队列中就被丢弃 (写线程停止、写出失败或连接重建)，确定没有写入 socket"""
+
+class PacketWriter: # 定义 PacketWriter 类，由单个写线程负责把加密封包写入 socket
+    """发送队列与写线程
+
+    调用方只需把加密后的封包放入队列即可返回，写线程每次取出队列中所有积压的封包，
+    用一次 sendmsg (或拼接后 sendall) 写出，并处理部分写入。每个封包对应一个 Future，
+    队列长度达到高水位时 submit 会阻塞，实现背压。
+    写出失败时数据流可能断在某个封包中间，之后的数据都无法被服务器正确切分，
+    因此任何写出错误都视为连接已损坏：写线程停止，关闭 socket，所有未写出的封包以 FrameDiscarded 结束。
+    """
+
+    def __init__(self, tcp_socket, high_water: int = 256, max_batch: int = 64): # 初始化方法
+        """初始化发送队列
+
+        Args:
+            tcp_socket: TCP socket 连接对象
+            high_water: 队列高水位，达到后 submit 阻塞等待
+            max_batch: 单次合并写出的最大封包数
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.tcp_socket = tcp_socket # TCP socket 连接对象
+        self.high_water = high_water # 队列高水位
+        self.max_batch = max_batch # 单次合并写出的最大封包数
+
+        self.queue = deque() # 待发送的 (封包, Future) 队列
+        self.condition = threading.Condition() # 保护队列，并在入队/出队时互相通知
+        self.running = False # 写线程运行状态
+        self.thread: Optional[threading.Thread] = None # 写线程
+        self.error: Optional[Exception] = None # 导致写线程停止的写出错误，reset 后清除
+
+        # 统计信息
+        self.frames_sent = 0 # 已写出的封包数
+        self.batches_sent = 0 # 已执行的写出次数 (合并后的系统调用次数)
+        self.max_depth = 0 # 观察到的最大队列长度
+
+    @property
+    def depth(self) -> int: # 当前队列长度
+        return len(self.queue)
+
+    def start(self): # 启动写线程
+        """启动写线程"""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name='PacketWriter', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 1.0): # 停止写线程
+        """停止写线程，未写出的封包对应的 Future 会以异常结束"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        self._fail_pending(FrameDiscarded("发送队列已停止"))
+
+    def reset(self, tcp_socket): # 更换 socket (重连后调用)
+        """更换 socket，丢弃仍在队列中的封包
+
+        队列中的封包是用旧连接的密钥与序列号加密的，不能写入新连接，它们的 Future 以 FrameDiscarded 结束。
+        写线程因写出失败而停止时重新启动。
+
+        Args:
+            tcp_socket: 新的 TCP socket 连接对象
+        """
+        with self.condition:
+            self.tcp_socket = tcp_socket
+            failed, self.error = self.error is not None, None
+        self._fail_pending(FrameDiscarded("连接已重建，丢弃旧连接上未写出的封包"))
+        if failed:
+            self.start()
+
+    def submit(self, frame: bytes, timeout: Optional[float] = None) -> Future: # 提交一个加密封包
+        """提交一个加密封包
+
+        Args:
+            frame: 加密后的完整封包
+            timeout: 队列达到高水位时的最长等待时间，None 表示一直等待
+
+        Returns:
+            Future: 写出后结果为封包长度，写出失败时为对应异常
+
+        Raises:
+            queue.Full: 等待超时后队列仍然达到高水位
+        """
+        return self.submit_many((frame,), timeout)[0]
+
+    def submit_many(self, frames: Iterable[bytes], timeout: Optional[float] = None) -> List[Future]: # 提交一批加密封包
+        """一次性提交一批加密封包，它们在队列中保持连续且有序
+
+        Args:
+            frames: 加密后的封包序列
+            timeout: 队列达到高水位时的最长等待时间，None 表示一直等待
+
+        Returns:
+            List[Future]: 与 frames 一一对应的 Future，写线程取出封包后就不能再取消
+
+        Raises:
+            queue.Full: 等待超时后队列仍然达到高水位
+        """
+        items = [(frame, Future()) for frame in frames]
+        with self.condition:
+            self._wait_writable(timeout)
+            self.queue.extend(items)
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify_all()
+        return [future for _, future in items]
+
+    def wait_writable(self, timeout: Optional[float] = None): # 等待队列可以接受新的封包
+        """等待队列低于高水位，调用方确认可以提交之后再分配序列号
+
+        只有提交方会向队列添加封包，调用方持有发送锁时，返回之后到提交之前队列不会变满。
+
+        Args:
+            timeout: 最长等待时间，None 表示一直等待
+
+        Raises:
+            FrameDiscarded: 写线程没有运行
+            queue.Full: 等待超时后队列仍然达到高水位
+        """
+        with self.condition:
+            self._wait_writable(timeout)
+
+    def _wait_writable(self, timeout: Optional[float]): # 背压：队列达到高水位时等待写线程消化 (调用方需持有条件变量)
+        if not self.running:
+            raise FrameDiscarded("发送队列未启动")
+        if not self.condition.wait_for(lambda: len(self.queue) < self.high_water or not self.running, timeout):
+            raise queue.Full("发送队列已达到高水位")
+        if not self.running:
+            raise FrameDiscarded("发送队列已停止")
+
+    def _run(self): # 写线程主循环
+        """写线程主循环"""
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue or not self.running)
+                if not self.running:
+                    break
+                # 取出当前积压的全部封包 (最多 max_batch 个)
+                batch = self._claim(self.queue.popleft() for _ in range(min(len(self.queue), self.max_batch)))
+                self.condition.notify_all() # 唤醒因背压而等待的提交方
+
+            try:
+                self._write([frame for frame, _ in batch])
+            except Exception as e: # 数据流可能断在封包中间，连接不能再用
+                self._abort(e, batch)
+                break
+
+            self.frames_sent += len(batch)
+            self.batches_sent += 1
+            for frame, future in batch:
+                if future is not None:
+                    future.set_result(len(frame))
+
+    @staticmethod
+    def _claim(items: Iterable[tuple]) -> list: # 出队时认领 Future，之后调用方无法再取消
+        """认领出队封包的 Future (set_running_or_notify_cancel)，之后 set_result/set_exception 不会与 cancel 竞争；
+        已被取消的 Future 记为 None，其封包照常写出 (序列号已经分配，跳过会破坏序列号链)，只是不再通知结果
+        """
+        return [(frame, future if future.set_running_or_notify_cancel() else None) for frame, future in items]
+
+    def _abort(self, error: Exception, batch: list): # 写出失败：停止写线程并关闭连接
+        """写出失败后停止写线程，这一批封包可能已部分写出，以原异常结束；
+        队列中其余封包确定没有写出，以 FrameDiscarded 结束。关闭 socket 使接收循环发现断线并触发重连。
+        """
+        self.logger.error(f"写出封包失败，连接已不可用: {error}")
+        with self.condition:
+            self.running = False
+            self.error = error
+            tcp_socket = self.tcp_socket
+            self.condition.notify_all()
+        for _, future in batch:
+            if future is not None:
+                future.set_exception(error)
+        self._fail_pending(FrameDiscarded(f"写出失败，丢弃未写出的封包: {error}"))
+        try:
+            tcp_socket.shutdown(socket.SHUT_RDWR)
+        except (OSError, AttributeError):
+            pass
+
+    def _write(self, frames: List[bytes]): # 合并写出一批封包，处理部分写入
+        """合并写出一批封包"""
+        if not HAS_SENDMSG or not hasattr(self.tcp_socket, 'sendmsg'): # 不支持 sendmsg 时拼接后一次写出
+            self.tcp_socket.sendall(b''.join(frames))
+            return
+
+        views = deque(memoryview(frame) for frame in frames if frame)
+        while views:
+            sent = self.tcp_socket.sendmsg(list(itertools.islice(views, IOV_MAX)))
+            # 跳过已完整写出的缓冲区，部分写出的缓冲区从剩余位置继续
+            while sent and views:
+                if sent >= len(views[0]):
+                    sent -= len(views.popleft())
+                else:
+                    views[0] = views[0][sent:]
+                    sent = 0
+
+    def _fail_pending(self, error: Exception): # 让队列中剩余封包的 Future 以异常结束
+        with self.condition:
+            pending = self._claim(self.queue)
+            self.queue.clear()
+            self.condition.notify_all()
+        for _, future in pending:
+            if future is not None:
+                future.set_exception(error)
+
+    def stats(self) -> dict: # 获取发送队列统计信息
+        """获取发送队列统计信息"""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "frames_sent": self.frames_sent,
+            "batches_sent": self.batches_sent,
+        }
@@ -1,21 +1,280 @@
 import time
+import struct
 import logging
-from typing import Tuple, List, Optional, Dict
-from dataclasses import dataclass
+from typing import Callable, Tuple, List, Optional, Dict, Union, Iterable
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from SendPacketProcessing import SendPacketProcessing
 from ReceivePacketAnalysis import ReceivePacketAnalysis
+from PacketTemplate import PacketTemplate
+from BattleEngine import BattleEngine, STEP_EVENTS
+from PetInventory import PetInventory, PetInfo
+from PetRecord import PetTable, decode_pet_list, warehouse_layout
+from RoutineProgram import RoutineError, load_routines, DEFAULT_ROUTINES_PATH
+from Checkpoint import Checkpoint
+
+logger = logging.getLogger(__name__)
+
+# 预编译的参数化数据包模板
+# 宠物存取 (09 00)：捕获时间戳、位置标记 (0 放入仓库，1 放入背包)
+PET_MOVE_PACKET = PacketTemplate(
+    '00 00 00 19 31 00 00 09 00 00 00 00 00 00 00 00 00 '
+    '00 00 00 00 00 00 00 00',
+    slots={'catch_time': (0, '>I'), 'location': (4, '>I')}
+)
+# 切换出战宠物 (09 67)：捕获时间戳
+CHANGE_PET_PACKET = PacketTemplate(
+    '00 00 00 15 31 00 00 09 67 00 00 00 00 00 00 00 00 '
+    '00 00 00 00',
+    slots={'catch_time': (0, '>I')}
+)
+
+# 背包/仓库列表请求与对应的响应命令ID
+BACKPACK_LIST_PACKET = PacketTemplate('00 00 00 11 31 00 00 AA BA 00 00 00 00 00 00 00 00')
+BACKPACK_LIST_COMMAND = 43706
+WAREHOUSE_LIST_PACKET = PacketTemplate(
+    '00 00 00 19 31 00 00 B1 E7 00 00 00 00 00 00 00 00 '
+    '00 00 00 00 00 00 03 E7'
+)
+WAREHOUSE_LIST_COMMAND = 45543
+
+# 各战斗类型依次发送的数据包
+BATTLE_PACKETS: Dict[str, Tuple[str, ...]] = {
+    "84": (
+        # 载入战斗
+        '00 00 00 11 31 00 00 09 64 00 00 00 00 00 00 00 00',
+        # 首发表姐，使用守御八方
+        '00 00 00 15 31 00 00 09 65 00 00 00 00 00 00 00 00 00 00 7B 11',
+        # ... 其他数据包
+    ),
+    "aggressive": (
+        # 载入战斗
+        '00 00 00 11 31 00 00 09 64 00 00 00 00 00 00 00 00',
+        # ... 其他数据包
+    ),
+    "battlefield": (
+        # 战场相关数据包
+    ),
+}
+
+# 仓库记录开头的宠物ID与捕获时间戳 (无法推出记录边界时按此格式读取)
+WAREHOUSE_RECORD_HEAD = struct.Struct('>II')
+# 合理的宠物ID上限，用于验证推出的记录长度
+WAREHOUSE_MAX_PET_ID = 100000
+
+class WarehouseIndex:
+    """仓库宠物索引
+
+    仓库列表响应只解析一次，建立 宠物ID -> (捕获时间戳, 槽位) 的索引。
+    包体为 数量(4) + 等长记录，记录长度由 (包体长度 - 4) / 数量 推出，
+    只在记录边界上读取宠物ID，不会误匹配到其他字段中的相同字节。
+    推出的记录长度只有在每条记录开头的宠物ID与捕获时间戳都合理时才采用，
+    否则 (或无法推出时) 退回到在包体中搜索宠物ID (与旧实现一致)。
+    """
+
+    def __init__(self, packet_data: bytes):
+        """解析仓库列表响应
 
-@dataclass
-class PetInfo:
-    """宠物信息"""
-    pet_id: int
-    timestamp: int
-    location: str  # "backpack" 或 "warehouse"
+        Args:
+            packet_data: 完整的仓库列表响应数据包 (含17字节包头)
+        """
+        self.body = bytes(packet_data[17:])
+        self.entries: Dict[int, Tuple[int, int]] = {}  # 宠物ID -> (捕获时间戳, 槽位)
+        self.stride = self._record_stride()  # 记录长度，无法推出时为 None
+        self.table: Optional[PetTable] = None  # 按列解码的仓库记录
+        if self.stride:
+            self.table = decode_pet_list(self.body, warehouse_layout(self.stride))
+            for slot, (pet_id, timestamp) in enumerate(zip(self.table['pet_id'], self.table['catch_time'])):
+                self.entries.setdefault(pet_id, (timestamp, slot))  # 重复的宠物取第一个
+
+    def _record_stride(self) -> Optional[int]:
+        """由宠物数量与包体长度推出记录长度
+
+        数量与包体长度总能凑出一个记录长度 (例如数量为1时)，因此还要验证：
+        最后一条记录恰好在包体末尾结束，且每条记录开头的宠物ID与捕获时间戳都合理。
+        """
+        if len(self.body) < 4:
+            return None
+        count = int.from_bytes(self.body[:4], byteorder='big')
+        if count <= 0 or (len(self.body) - 4) % count:
+            return None
+        stride = (len(self.body) - 4) // count
+        if stride < WAREHOUSE_RECORD_HEAD.size or 4 + stride * count != len(self.body):
+            return None
+        for offset in range(4, len(self.body), stride):
+            pet_id, timestamp = WAREHOUSE_RECORD_HEAD.unpack_from(self.body, offset)
+            if not 0 < pet_id <= WAREHOUSE_MAX_PET_ID or not timestamp:  # 不像记录开头，记录长度是凑出来的
+                return None
+        return stride
+
+    def lookup(self, pet_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+        """一次查询多个宠物
+
+        Args:
+            pet_ids: 宠物ID序列
+
+        Returns:
+            Dict[int, Tuple[int, int]]: 找到的宠物ID -> (捕获时间戳, 槽位)
+        """
+        if not self.stride:  # 没有记录边界时在包体中搜索，结果同样缓存到索引中
+            for pet_id in pet_ids:
+                if pet_id not in self.entries:
+                    self._search(pet_id)
+        return {pet_id: self.entries[pet_id] for pet_id in pet_ids if pet_id in self.entries}
+
+    def _search(self, pet_id: int):
+        """在包体中搜索宠物ID，其后4字节为捕获时间戳，槽位记为字节偏移"""
+        offset = self.body.find(pet_id.to_bytes(4, byteorder='big'))
+        if 0 <= offset <= len(self.body) - WAREHOUSE_RECORD_HEAD.size:
+            self.entries[pet_id] = (WAREHOUSE_RECORD_HEAD.unpack_from(self.body, offset)[1], offset)
+
+    def get(self, pet_id: int) -> Optional[Tuple[int, int]]:
+        """查询单个宠物，返回 (捕获时间戳, 槽位)，不存在返回 None"""
+        return self.lookup((pet_id,)).get(pet_id)
+
+    def __len__(self) -> int:
+        return len(self.entries)
 
 class PetFightError(Exception):
     """宠物战斗相关错误"""
     pass
 
+# 线程版 (PetFightPacketManager) 与 asyncio 版 (AsyncClient) 共用的决策逻辑。
+# 与 RoutineProgram._steps 相同，需要与服务器通信的步骤以 (操作, 参数) 的形式交给执行方，
+# 执行方完成后把结果 send 回来；两种会话只负责收发，何时刷新、存取哪些宠物、战斗何时结束都在这里决定。
+STEP_BACKPACK_LIST = 'backpack_list'  # 刷新背包列表，没有结果
+STEP_WAREHOUSE_LIST = 'warehouse_list'  # 刷新仓库列表，参数为要查找的宠物ID，没有结果
+STEP_MOVE_PET = 'move_pet'  # 存取一只宠物，参数为 (宠物信息, 是否放入背包)，没有结果
+STEP_PACED = 'paced'  # 按节奏模式发送一步，参数为数据包模板，没有结果
+STEP_BATTLE_EVENT = 'battle_event'  # 发送一个战斗数据包并等待对应的战斗通知，参数为 (数据包模板, 通知命令ID)，没有结果
+STEP_BATTLE_OVER = 'battle_over'  # 等待服务器报告战斗结束，没有结果
+
+def response_command(packet: Union[str, PacketTemplate], response_cmd_id: Optional[int]) -> int:
+    """获取响应的命令ID，未指定时与请求的命令ID相同"""
+    if response_cmd_id is not None:
+        return response_cmd_id
+    template = packet if isinstance(packet, PacketTemplate) else PacketTemplate.from_hex(packet)
+    return template.cmd_id
+
+def load_backpack_list(inventory: PetInventory, packet_data: Optional[bytes], generation: int) -> PetTable:
+    """解码背包列表响应并载入背包/仓库模型
+
+    Args:
+        inventory: 背包/仓库模型
+        packet_data: 背包列表响应数据包 (含17字节包头)，请求失败时为 None
+        generation: 发送请求之前 begin_refresh 的返回值
+
+    Returns:
+        PetTable: 按 390 字节的记录布局解码的背包宠物表
+
+    Raises:
+        PetFightError: 请求失败或解码失败
+    """
+    if not packet_data:
+        raise PetFightError("获取背包宠物列表失败")
+    try:
+        table = decode_pet_list(packet_data[17:])
+    except Exception as e:
+        logger.error(f"处理背包宠物数据失败: {e}")
+        raise PetFightError(f"处理背包宠物数据失败: {str(e)}")
+    logger.info(f"背包宠物数量: {len(table)}")
+
+    pets = list(zip(table['pet_id'], table['catch_time']))
+    if logger.isEnabledFor(logging.INFO):
+        for pet_id, timestamp in pets:
+            logger.info(f"背包精灵 {pet_id} 的时间戳: {timestamp}")
+    inventory.load_backpack(pets, generation)
+    return table
+
+def load_warehouse_list(inventory: PetInventory, packet_data: Optional[bytes], generation: int,
+                        pet_ids: Tuple[int, ...] = ()) -> WarehouseIndex:
+    """建立仓库索引并载入背包/仓库模型
+
+    Args:
+        inventory: 背包/仓库模型
+        packet_data: 仓库列表响应数据包，请求失败时为 None
+        generation: 发送请求之前 begin_refresh 的返回值
+        pet_ids: 需要查找的宠物ID (无法推出记录边界时只能按ID搜索)
+
+    Returns:
+        WarehouseIndex: 仓库索引
+
+    Raises:
+        PetFightError: 请求失败
+    """
+    if not packet_data:
+        raise PetFightError("获取仓库宠物列表失败")
+    index = WarehouseIndex(packet_data)
+    index.lookup(pet_ids)
+    # 能推出记录边界时索引即为仓库的全部内容
+    inventory.load_warehouse(index.entries, bool(index.stride), generation)
+    return index
+
+def backpack_steps(inventory: PetInventory, pet_ids: Tuple[int, ...]):
+    """确保背包里恰好是指定的宠物 (按顺序) 的步骤
+
+    背包/仓库模型有效时直接在本地计算所需的最少存取操作，
+    只有模型失效或有宠物位置未知时才重新请求背包与仓库列表。
+    生成 STEP_BACKPACK_LIST、STEP_WAREHOUSE_LIST 与 STEP_MOVE_PET，结束时返回是否所有宠物都已找到。
+    """
+    if not inventory.valid:
+        yield STEP_BACKPACK_LIST, None
+
+    # 位置未知的宠物到仓库中查找
+    unknown = inventory.unknown(pet_ids)
+    if unknown and not inventory.warehouse_complete:
+        yield STEP_WAREHOUSE_LIST, unknown
+        unknown = inventory.unknown(pet_ids)
+    if unknown:
+        for pet_id in unknown:
+            logger.error(f"精灵 {pet_id} 未找到")
+        return False
+
+    # 只执行使背包与要求一致所需的存取操作
+    move_out, move_in = inventory.plan(tuple(pet_ids))
+    for pet in move_out:
+        yield STEP_MOVE_PET, (pet, False)
+    for pet in move_in:
+        yield STEP_MOVE_PET, (pet, True)
+    return True
+
+def battle_steps(battle_engine: BattleEngine, battle_type: str, packets: Iterable[Union[str, PacketTemplate]], ack: bool):
+    """执行战斗序列的步骤
+
+    "ack" 节奏下每个有对应战斗通知的数据包都等待该通知，服务器报告结果后不再发送剩余的技能，
+    战斗已经开始但还没有结束时最后再等待一次结果；其余节奏下每个数据包都按普通步骤发送。
+    生成 STEP_PACED、STEP_BATTLE_EVENT 与 STEP_BATTLE_OVER，结束 (或被关闭) 时结束跟踪战斗。
+
+    Args:
+        battle_engine: 战斗状态机
+        battle_type: 战斗类型
+        packets: 依次发送的数据包
+        ack: 是否为 "ack" 节奏
+    """
+    try:
+        if not ack:
+            for packet in packets:
+                yield STEP_PACED, packet
+            return
+
+        record = battle_engine.current
+        if record is None or record.battle_type != battle_type:  # 发起战斗的请求之前没有开始跟踪
+            record = battle_engine.begin(battle_type)
+        for packet in packets:
+            template = packet if isinstance(packet, PacketTemplate) else PacketTemplate.from_hex(packet)
+            event = STEP_EVENTS.get(template.cmd_id)
+            if event is None:  # 没有对应战斗通知的数据包按普通步骤处理
+                yield STEP_PACED, template
+            else:
+                yield STEP_BATTLE_EVENT, (template, event)
+            if record.finished:  # 服务器已报告结果，剩余的技能不再发送
+                break
+
+        # 战斗已经开始但还没有结束时，等待服务器报告结果，最多等待一步的时间 (与固定节奏相同)
+        if record.started_at is not None and not record.finished:
+            yield STEP_BATTLE_OVER, None
+    finally:
+        battle_engine.finish()
+
 class PetFightPacketManager:
     """管理宠物战斗相关的数据包"""
 
@@ -31,16 +290,35 @@ class PetFightPacketManager:
         # 战斗配置
         self.battle_timeout = 3.0  # 秒
         self.operation_delay = 0.3  # 秒
+        # 节奏控制："ack" 每步等待服务器的对应响应，operation_delay 作为最长等待时间；
+        # "fixed" 每步固定休眠 operation_delay
+        self.pacing = "ack"
+        self.pacing_acked = 0  # 收到响应后继续的步数
+        self.pacing_timeouts = 0  # 等满 operation_delay 后继续的步数
+        self.routines_path = DEFAULT_ROUTINES_PATH  # 日常配置文件，加载时编译为数据包程序
+        self.checkpoint: Optional[Checkpoint] = None  # 当天的日常进度，设置后日常可以断点续跑
         
-        # 缓存
-        self.pet_cache: Dict[int, PetInfo] = {}
+        # 背包/仓库模型，只在相关的服务器推送到达时失效
+        self.inventory = PetInventory()
+        self.inventory.subscribe(receive_packet_analysis)
+        self.backpack_table: Optional[PetTable] = None  # 最近一次解码的背包宠物表
         
         # 战斗状态
         self.is_fighting = False
         self.current_battle_type: Optional[str] = None
+        # 根据服务器的战斗通知跟踪战斗的开始、回合与结束
+        self.battle_engine = BattleEngine(receive_packet_analysis)
+
+    @property
+    def pet_cache(self) -> Dict[int, PetInfo]:
+        """宠物ID -> 宠物信息 (背包/仓库模型中已知位置的宠物)"""
+        return self.inventory.pets
 
     def check_backpack_pets(self, pet_ids: Tuple[int, ...]) -> bool:
-        """检查背包里是否有指定的宠物
+        """确保背包里恰好是指定的宠物 (按顺序)
+        
+        背包/仓库模型有效时直接在本地计算所需的最少存取操作，
+        只有模型失效或有宠物位置未知时才重新请求背包与仓库列表。
         
         Args:
             pet_ids: 要检查的宠物ID元组
@@ -52,33 +330,84 @@ class PetFightPacketManager:
             PetFightError: 宠物相关错误
         """
         try:
-            # 获取背包宠物列表
-            self.send_packet_processing.SendPacket(
-                '00 00 00 11 31 00 00 AA BA 00 00 00 00 00 00 00 00'
-            )
-            packet_data = self.receive_packet_analysis.wait_for_specific_data(
-                43706, 
-                timeout=self.battle_timeout
-            )
-            if not packet_data:
-                raise PetFightError("获取背包宠物列表失败")
-
-            # 解析背包数据
-            packet_body = packet_data[17:]
-            if packet_body == b'\x00\x00\x00\x00\x00\x00\x00\x00':
-                self.logger.info("背包为空，检查仓库")
-                return self.check_warehouse_pets(pet_ids)
-
-            # 处理背包宠物
-            self._process_backpack_pets(packet_body)
-            
-            # 检查仓库
-            return self.check_warehouse_pets(pet_ids)
-
+            return self._run_steps(backpack_steps(self.inventory, tuple(pet_ids)))
         except Exception as e:
             self.logger.error(f"检查背包宠物失败: {e}")
             return False
 
+    def _run_steps(self, steps):
+        """执行 backpack_steps / battle_steps 生成的步骤，返回生成器的返回值"""
+        try:
+            while True:
+                try:
+                    op, payload = next(steps)
+                except StopIteration as stop:
+                    return stop.value
+                self._perform_step(op, payload)
+        finally:
+            steps.close()
+
+    def _perform_step(self, op: str, payload):
+        """执行一个需要与服务器通信的步骤"""
+        if op == STEP_BACKPACK_LIST:
+            self._refresh_backpack()
+        elif op == STEP_WAREHOUSE_LIST:
+            self._refresh_warehouse(payload)
+        elif op == STEP_MOVE_PET:
+            self._move_pet(*payload)
+        elif op == STEP_PACED:
+            self._paced_send(payload)
+        elif op == STEP_BATTLE_EVENT:
+            self._send_battle_step(*payload)
+        elif op == STEP_BATTLE_OVER:
+            self.battle_engine.wait_over(self.operation_delay)
+
+    def _refresh_backpack(self):
+        """请求背包宠物列表并载入背包/仓库模型
+
+        Raises:
+            PetFightError: 获取背包宠物列表失败
+        """
+        generation = self.inventory.begin_refresh()
+        packet_data = self.send_and_wait(BACKPACK_LIST_PACKET, BACKPACK_LIST_COMMAND, idempotent=True)
+        self.backpack_table = load_backpack_list(self.inventory, packet_data, generation)
+
+    def _refresh_warehouse(self, pet_ids: Tuple[int, ...] = ()) -> WarehouseIndex:
+        """请求仓库宠物列表并载入背包/仓库模型
+
+        Args:
+            pet_ids: 需要查找的宠物ID (无法推出记录边界时只能按ID搜索)
+
+        Returns:
+            WarehouseIndex: 仓库索引
+
+        Raises:
+            PetFightError: 获取仓库宠物列表失败
+        """
+        generation = self.inventory.begin_refresh()
+        packet_data = self.send_and_wait(WAREHOUSE_LIST_PACKET, WAREHOUSE_LIST_COMMAND, idempotent=True)
+        return load_warehouse_list(self.inventory, packet_data, generation, pet_ids)
+
+    def _move_pet(self, pet: PetInfo, to_backpack: bool):
+        """发送存取数据包并更新背包/仓库模型
+
+        Args:
+            pet: 宠物信息
+            to_backpack: True 放入背包，False 放入仓库
+        """
+        sent = False
+
+        def on_sent():
+            nonlocal sent
+            sent = True
+
+        # 确认发出后才等待其响应，发送失败的请求不会让之后别人发起的存取被当成自己的
+        self.inventory.begin_move()
+        try:
+            self._send_pet_packet(pet.timestamp.to_bytes(4, byteorder='big'), is_backpack=not to_backpack, on_sent=on_sent)
+        finally:
+            self.inventory.record_move(pet.pet_id, to_backpack, sent)
+
     def check_warehouse_pets(self, pet_ids: Tuple[int, ...]) -> bool:
         """检查仓库里是否有指定的宠物
         
@@ -92,22 +421,12 @@ class PetFightPacketManager:
             PetFightError: 宠物相关错误
         """
         try:
-            # 获取仓库宠物列表
-            self.send_packet_processing.SendPacket(
-                '00 00 00 19 31 00 00 B1 E7 00 00 00 00 00 00 00 00 '
-                '00 00 00 00 00 00 03 E7'
-            )
-            
-            packet_data = self.receive_packet_analysis.wait_for_specific_data(
-                45543,
-                timeout=self.battle_timeout
-            )
-            if not packet_data:
-                raise PetFightError("获取仓库宠物列表失败")
+            # 获取仓库宠物列表，只解析一次仓库数据，一次查出所有宠物
+            index = self._refresh_warehouse(pet_ids)
 
             # 检查每个宠物
             for pet_id in pet_ids:
-                if not self._find_pet_in_warehouse(pet_id, packet_data):
+                if not self._find_pet_in_warehouse(pet_id, index):
                     self.logger.error(f"精灵 {pet_id} 未找到")
                     return False
                     
@@ -117,6 +436,133 @@ class PetFightPacketManager:
             self.logger.error(f"检查仓库宠物失败: {e}")
             return False
 
+    def send_and_wait(self, packet: Union[str, PacketTemplate], response_cmd_id: Optional[int] = None,
+                      timeout: Optional[float] = None, idempotent: bool = False, **values) -> Optional[bytes]:
+        """发送数据包并等待对应的响应
+
+        等待在发送之前登记，因此不会错过任何快速到达的响应。
+        
+        Args:
+            packet: 数据包 (十六进制字符串或预编译模板)
+            response_cmd_id: 响应的命令ID，默认与请求的命令ID相同
+            timeout: 超时时间(秒)，默认使用 battle_timeout
+            idempotent: 请求是否可以安全地重复发送 (例如查询列表)，是则断线重连后自动重发
+            **values: 模板参数槽位的取值
+            
+        Returns:
+            Optional[bytes]: 响应数据包，发送失败或超时返回 None
+        """
+        response_cmd_id = response_command(packet, response_cmd_id)
+        if timeout is None:
+            timeout = self.battle_timeout
+
+        future = self._send_expecting(packet, response_cmd_id, idempotent=idempotent, **values)
+        if future is None:
+            return None
+        return self.receive_packet_analysis.wait_for_future(future, response_cmd_id, timeout)
+
+    def _paced_send(self, packet: Union[str, PacketTemplate], response_cmd_id: Optional[int] = None,
+                    on_sent: Optional[Callable[[], None]] = None, **values) -> Optional[bytes]:
+        """发送一步操作并按节奏模式等待后再继续
+
+        "ack" 模式下收到服务器的对应响应就立即继续，最多等待 operation_delay；
+        "fixed" 模式下固定休眠 operation_delay。
+
+        Args:
+            packet: 数据包 (十六进制字符串或预编译模板)
+            response_cmd_id: 响应的命令ID，默认与请求的命令ID相同
+            on_sent: 数据包成功发出后、等待之前调用
+            **values: 模板参数槽位的取值
+
+        Returns:
+            Optional[bytes]: ack 模式下收到的响应数据包，其余情况返回 None
+        """
+        if self.pacing != "ack":
+            if self.send_packet_processing.SendPacket(packet, **values) and on_sent is not None:
+                on_sent()
+            time.sleep(self.operation_delay)
+            return None
+
+        response_cmd_id = response_command(packet, response_cmd_id)
+        future = self._send_expecting(packet, response_cmd_id, **values)
+        if future is None:
+            return None
+        if on_sent is not None:
+            on_sent()
+        try:
+            response = future.result(self.operation_delay)
+        except FutureTimeoutError:
+            if self.receive_packet_analysis.cancel_wait(response_cmd_id, future):
+                self.pacing_timeouts += 1
+                return None
+            response = future.result()  # 取消前恰好收到了响应
+        self.pacing_acked += 1
+        return response
+
+    def _send_expecting(self, packet: Union[str, PacketTemplate], response_cmd_id: int,
+                        idempotent: bool = False, **values) -> Optional[Future]:
+        """先登记等待再发送请求，只认领发送之后到达的响应，幂等请求登记为断线重连后需要重发
+
+        Returns:
+            Optional[Future]: 等待响应的 Future，发送失败返回 None
+        """
+        future = self.receive_packet_analysis.expect(response_cmd_id, use_mailbox=False)
+        if not self.send_packet_processing.SendPacket(packet, idempotent=idempotent, **values):
+            self.receive_packet_analysis.cancel_wait(response_cmd_id, future)
+            return None
+        if idempotent:
+            self.send_packet_processing.track_unacked(packet, values, future)
+        return future
+
+    def send_batch(self, items: Iterable[Tuple[Union[str, PacketTemplate], Optional[Dict[str, int]], Optional[int]]],
+                   timeout: Optional[float] = None) -> List[Optional[bytes]]:
+        """批量发送互不依赖的数据包，再统一收集响应
+
+        整批数据包一次性组装、加密并交给写线程，不逐个等待响应；
+        所有等待都在发送之前登记，同一命令的多个响应按到达顺序依次对应。
+
+        Args:
+            items: (数据包, 参数槽位取值, 响应的命令ID) 序列，取值与响应命令ID可以为 None
+            timeout: 收集整批响应的总超时时间(秒)，默认使用 battle_timeout
+
+        Returns:
+            List[Optional[bytes]]: 与 items 一一对应的响应数据包，发送失败或超时的项为 None
+        """
+        if timeout is None:
+            timeout = self.battle_timeout
+        items = [(packet, values, response_command(packet, response_cmd_id))
+                 for packet, values, response_cmd_id in items]
+        expected = [self.receive_packet_analysis.expect(response_cmd_id, use_mailbox=False)
+                    for _, _, response_cmd_id in items]
+
+        try:
+            writes = self.send_packet_processing.submit_batch((packet, values) for packet, values, _ in items)
+        except Exception as e:
+            self.logger.error(f"批量发送失败: {e}")
+            for (_, _, response_cmd_id), future in zip(items, expected):
+                self.receive_packet_analysis.cancel_wait(response_cmd_id, future)
+            return [None] * len(items)
+
+        deadline = time.monotonic() + timeout
+        responses: List[Optional[bytes]] = []
+        for (_, _, response_cmd_id), write, future in zip(items, writes, expected):
+            response = None
+            try:
+                write.result(max(0.0, deadline - time.monotonic()))
+                response = future.result(max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                if not self.receive_packet_analysis.cancel_wait(response_cmd_id, future):
+                    response = future.result()  # 取消前恰好收到了响应
+            except Exception as e:
+                self.logger.error(f"批量发送命令 {response_cmd_id} 失败: {e}")
+                self.receive_packet_analysis.cancel_wait(response_cmd_id, future)
+            responses.append(response)
+
+        failed = responses.count(None)
+        if failed:
+            self.logger.warning(f"批量发送 {len(items)} 个数据包，{failed} 个未收到响应")
+        return responses
+
     def prepare_battle(self, battle_type: str) -> bool:
         """准备战斗
         
@@ -163,8 +609,13 @@ class PetFightPacketManager:
 
         success = True
         for task, name in tasks:
+            if self.checkpoint is not None and self.checkpoint.is_done(task.__name__):
+                self.logger.info(f"{name} 今天已完成，跳过")
+                continue
             try:
                 task()
+                if self.checkpoint is not None:
+                    self.checkpoint.mark_done(task.__name__)
                 self.logger.info(f"{name} 完成")
                 time.sleep(self.operation_delay)
             except Exception as e:
@@ -193,141 +644,51 @@ class PetFightPacketManager:
 
     def _get_84_battle_packets(self) -> List[str]:
         """获取84战斗类型的数据包"""
-        return [
-            # 载入战斗
-            '00 00 00 11 31 00 00 09 64 00 00 00 00 00 00 00 00',
-            # 首发表姐，使用守御八方
-            '00 00 00 15 31 00 00 09 65 00 00 00 00 00 00 00 00 00 00 7B 11',
-            # ... 其他数据包
-        ]
+        return list(BATTLE_PACKETS["84"])
 
     def _get_aggressive_battle_packets(self) -> List[str]:
         """获取强攻类型的数据包"""
-        return [
-            # 载入战斗
-            '00 00 00 11 31 00 00 09 64 00 00 00 00 00 00 00 00',
-            # ... 其他数据包
-        ]
+        return list(BATTLE_PACKETS["aggressive"])
 
     def _get_battlefield_battle_packets(self) -> List[str]:
         """获取战场类型的数据包"""
-        return [
-            # 战场相关数据包
-        ]
+        return list(BATTLE_PACKETS["battlefield"])
+
+    def run_routine(self, name: str):
+        """执行 routines.json 中定义的日常
 
-    def _process_backpack_pets(self, packet_body: bytes):
-        """处理背包宠物数据
-        
         Args:
-            packet_body: 数据包主体
-            
+            name: 日常名称
+
         Raises:
-            PetFightError: 处理失败
+            PetFightError: 日常未定义或执行失败
         """
         try:
-            # 获取宠物数量
-            pet_count = int.from_bytes(packet_body[:4], byteorder='big')
-            self.logger.info(f"背包宠物数量: {pet_count}")
-
-            # 解析每个宠物的数据
-            pet_data_start = 4
-            pet_data_length = 390
-            
-            for i in range(pet_count):
-                pet_data = packet_body[
-                    pet_data_start:pet_data_start + pet_data_length
-                ]
-                
-                # 提取宠物信息
-                pet_id = int.from_bytes(pet_data[:4], byteorder='big')
-                timestamp = int.from_bytes(
-                    pet_data[148:152], 
-                    byteorder='big'
-                )
-                
-                # 缓存宠物信息
-                self.pet_cache[pet_id] = PetInfo(
-                    pet_id=pet_id,
-                    timestamp=timestamp,
-                    location="backpack"
-                )
-                
-                self.logger.info(
-                    f"背包精灵 {pet_id} 的时间戳: {timestamp}"
-                )
-                
-                # 发送宠物数据包
-                self._send_pet_packet(
-                    timestamp.to_bytes(4, byteorder='big'), 
-                    is_backpack=True
-                )
-                
-                pet_data_start += pet_data_length
+            program = load_routines(self.routines_path)[name]
+        except (OSError, ValueError, KeyError, RoutineError) as e:
+            raise PetFightError(f"加载日常 {name} 失败: {str(e)}")
 
+        try:
+            program.run(self, self.checkpoint)
         except Exception as e:
-            self.logger.error(f"处理背包宠物数据失败: {e}")
-            raise PetFightError(f"处理背包宠物数据失败: {str(e)}")
+            self.logger.error(f"{program.title}失败: {e}")
+            raise PetFightError(f"{program.title}失败: {str(e)}")
 
     def daily_props_collection(self):
         """执行日常道具收集任务"""
-        data = [
-            # 星愿漂流瓶签到
-            '00 00 00 19 31 00 00 B8 BE 00 00 00 00 00 00 00 00 00 00 00 09 00 00 00 01',
-            '00 00 00 19 31 00 00 B8 BE 00 00 00 00 00 00 00 00 00 00 00 09 00 00 00 02',
-            '00 00 00 19 31 00 00 B8 BE 00 00 00 00 00 00 00 00 00 00 00 09 00 00 00 03',
-            '00 00 00 19 31 00 00 B8 BE 00 00 00 00 00 00 00 00 00 00 00 09 00 00 00 04',
-            '00 00 00 19 31 00 00 B8 BE 00 00 00 00 00 00 00 00 00 00 00 09 00 00 00 05',
-            '00 00 00 19 31 00 00 B8 BE 00 00 00 00 00 00 00 00 00 00 00 09 00 00 00 06',
-            '00 00 00 19 31 00 00 B8 BE 00 00 00 00 00 00 00 00 00 00 00 09 00 00 00 07',
-            # 荣誉大厅军阶商店签到
-            '00 00 00 19 31 00 00 A5 8C 00 00 00 00 00 00 00 00 00 00 00 04 00 00 00 04',
-            # 勇者之塔扫荡
-            '00 00 00 15 31 00 00 A2 EC 00 00 00 00 00 00 00 00 00 00 00 01',
-            # 其他签到数据包...
-        ]
-        self._execute_packet_sequence(data)
+        self.run_routine("daily_props_collection")
 
     def battery_dormant_switch(self):
         """电池休眠开关"""
-        self.send_packet_processing.SendPacket(
-            '00 00 00 15 31 00 00 A0 CA 00 00 00 00 00 00 00 00 00 00 00 00'
-        )
+        self.run_routine("battery_dormant_switch")
 
     def fire_buffer(self):
         """火焰增益"""
-        data = [
-            '00 00 00 15 31 00 00 10 C4 00 00 00 00 00 00 00 00 02 63 43 9C',
-            '00 00 00 15 31 00 00 10 C4 00 00 00 00 00 00 00 00 02 2B F9 3F'
-        ]
-        self._execute_packet_sequence(data)
+        self.run_routine("fire_buffer")
 
     def experience_training_ground(self):
         """经验训练场"""
-        try:
-            data = [
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 67 00 00 00 06 00 00 00 01',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 67 00 00 00 06 00 00 00 02',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 67 00 00 00 06 00 00 00 03',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 67 00 00 00 06 00 00 00 04',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 67 00 00 00 06 00 00 00 05',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 67 00 00 00 06 00 00 00 06'
-            ]
-
-            for _ in range(6):
-                for packet in data:
-                    self.send_packet_processing.SendPacket(packet)
-                    time.sleep(self.operation_delay)
-                    self._execute_battle_sequence("84")
-
-            # 完成后的处理
-            self.send_packet_processing.SendPacket(
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 67 '
-                '00 00 00 03 00 00 00 00 00 00 00 00'
-            )
-
-        except Exception as e:
-            self.logger.error(f"经验训练场失败: {e}")
-            raise
+        self.run_routine("experience_training_ground")
 
     def _execute_battle_sequence(self, battle_type: str):
         """执行战斗序列
@@ -341,10 +702,8 @@ class PetFightPacketManager:
         try:
             if not self.prepare_battle(battle_type):
                 raise PetFightError("准备战斗失败")
-                
-            for packet in self.battle_packets:
-                self.send_packet_processing.SendPacket(packet)
-                time.sleep(self.operation_delay)
+
+            self._run_steps(battle_steps(self.battle_engine, battle_type, self.battle_packets, self.pacing == "ack"))
                 
         except Exception as e:
             self.logger.error(f"执行战斗序列失败: {e}")
@@ -352,6 +711,30 @@ class PetFightPacketManager:
         finally:
             self.end_battle()
 
+    def _begin_battle(self, battle_type: str):
+        """在发送发起战斗的请求之前开始跟踪战斗 (仅 ack 节奏)，之后到达的战斗通知都记录到这场战斗
+
+        Args:
+            battle_type: 战斗类型
+        """
+        if self.pacing == "ack":
+            self.battle_engine.begin(battle_type)
+
+    def _send_battle_step(self, packet: PacketTemplate, event: int):
+        """发送一个战斗数据包，并等待服务器对应的战斗通知 (最多等待 operation_delay)
+
+        Args:
+            packet: 数据包模板
+            event: 对应的战斗通知命令ID
+        """
+        mark = self.battle_engine.mark(event)
+        if not self.send_packet_processing.SendPacket(packet):
+            return
+        if self.battle_engine.wait_event(event, mark, self.operation_delay):
+            self.pacing_acked += 1
+        else:
+            self.pacing_timeouts += 1
+
     def _execute_packet_sequence(self, packets: List[str]):
         """执行数据包序列
         
@@ -363,197 +746,26 @@ class PetFightPacketManager:
         """
         try:
             for packet in packets:
-                self.send_packet_processing.SendPacket(packet)
-                time.sleep(self.operation_delay)
+                self._paced_send(packet)
         except Exception as e:
             self.logger.error(f"执行数据包序列失败: {e}")
             raise PetFightError(f"执行数据包序列失败: {str(e)}")
 
     def learning_training_ground(self):
         """学习力训练场"""
-        try:
-            data = [
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 66 00 00 00 06 00 00 00 01',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 66 00 00 00 06 00 00 00 02',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 66 00 00 00 06 00 00 00 03',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 66 00 00 00 06 00 00 00 04',
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 66 00 00 00 06 00 00 00 05'
-            ]
-
-            for _ in range(6):
-                for packet in data:
-                    self.send_packet_processing.SendPacket(packet)
-                    time.sleep(self.operation_delay)
-                    self._execute_battle_sequence("84")
-
-            # 完成后的处理
-            self.send_packet_processing.SendPacket(
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 66 '
-                '00 00 00 03 00 00 00 00 00 00 00 00'
-            )
-
-        except Exception as e:
-            self.logger.error(f"学习力训练场失败: {e}")
-            raise PetFightError(f"学习力训练场失败: {str(e)}")
+        self.run_routine("learning_training_ground")
 
     def trial_of_the_elf_king(self):
         """精灵王试炼"""
-        try:
-            data = '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 6A 00 00 00 0F 00 00 00 03'
-
-            for _ in range(15):
-                self.send_packet_processing.SendPacket(data)
-                time.sleep(self.operation_delay)
-                self._execute_battle_sequence("84")
-
-        except Exception as e:
-            self.logger.error(f"精灵王试炼失败: {e}")
-            raise PetFightError(f"精灵王试炼失败: {str(e)}")
+        self.run_routine("trial_of_the_elf_king")
 
     def x_team_chamber(self):
         """X战队密室"""
-        try:
-            data = [
-                # 开启副本
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 69 00 00 00 01 00 00 00 01 00 00 00 00',
-                # 开启挑战
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 69 00 00 00 07 00 00 00 00',
-                # 通关奖励
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 69 00 00 00 02 00 00 00 00 00 00 00 00'
-            ]
-
-            for _ in range(3):
-                self.send_packet_processing.SendPacket(data[0])
-                time.sleep(self.operation_delay)
-                
-                self.send_packet_processing.SendPacket(data[1])
-                time.sleep(self.operation_delay)
-                
-                self._execute_battle_sequence("84")
-
-            # 领取奖励
-            self.send_packet_processing.SendPacket(data[2])
-
-        except Exception as e:
-            self.logger.error(f"X战队密室失败: {e}")
-            raise PetFightError(f"X战队密室失败: {str(e)}")
+        self.run_routine("x_team_chamber")
 
     def titan_mines(self):
-        """泰坦���洞"""
-        try:
-            # 检查所需宠物
-            pet_ids_needed = (3512, 3437, 3045)
-            if not self.check_backpack_pets(pet_ids_needed):
-                raise PetFightError("所需宠物不足")
-
-            # 选择困难模式
-            self.send_packet_processing.SendPacket(
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 68 '
-                '00 00 00 01 00 00 00 03 00 00 00 00'
-            )
-            time.sleep(self.operation_delay)
-
-            # 执行各个阶段
-            self._execute_titan_mines_stages()
-
-        except Exception as e:
-            self.logger.error(f"泰坦矿洞失败: {e}")
-            raise PetFightError(f"泰坦矿洞失败: {str(e)}")
-
-    def _execute_titan_mines_stages(self):
-        """执行泰坦矿洞的各个阶段"""
-        try:
-            # 第一阶段：打开通道，击败守卫
-            self._execute_titan_mines_stage1()
-            
-            # 第二阶段：清扫矿区
-            self._execute_titan_mines_stage2()
-            
-            # 第三阶段：矿洞开采
-            self._execute_titan_mines_stage3()
-            
-            # 第四阶段：安全撤离
-            self._execute_titan_mines_stage4()
-
-        except Exception as e:
-            raise PetFightError(f"执行泰坦矿洞阶段失败: {str(e)}")
-
-    def _execute_titan_mines_stage1(self):
-        """执行泰坦矿洞第一阶段"""
-        try:
-            self.send_packet_processing.SendPacket(
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 68 '
-                '00 00 00 03 00 00 00 01'
-            )
-            time.sleep(self.operation_delay)
-            self._execute_battle_sequence("84")
-
-        except Exception as e:
-            raise PetFightError(f"泰坦矿洞第一阶段失败: {str(e)}")
-
-    def _execute_titan_mines_stage2(self):
-        """执行泰坦矿洞第二阶段"""
-        try:
-            # 切换到艾欧
-            pet_ids_needed = (3437, )
-            if not self.check_backpack_pets(pet_ids_needed):
-                raise PetFightError("缺少艾欧")
-
-            # 执行16次清扫
-            for _ in range(16):
-                self.send_packet_processing.SendPacket(
-                    '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 68 '
-                    '00 00 00 03 00 00 00 02'
-                )
-                time.sleep(self.operation_delay)
-                self._execute_battle_sequence("aggressive")
-
-        except Exception as e:
-            raise PetFightError(f"泰坦矿洞第二阶段失败: {str(e)}")
-
-    def _execute_titan_mines_stage3(self):
-        """执行泰坦矿洞第三阶段(矿洞开采)"""
-        try:
-            # 矿洞开采数据包序列
-            mining_packets = [
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 68 00 00 00 02 00 00 00 02 00 00 00 00',
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 68 00 00 00 02 00 00 00 03 00 00 00 00',
-                '00 00 00 21 31 00 00 A5 9B 00 00 00 00 00 00 00 00 00 00 00 68 00 00 00 02 00 00 00 04 00 00 00 00',
-                # ... 更多开采点位的数据包
-            ]
-
-            # 执行开采序列
-            for packet in mining_packets:
-                self.send_packet_processing.SendPacket(packet)
-                time.sleep(self.operation_delay)
-                
-                # 检查开采结果
-                if not self._check_mining_result():
-                    raise PetFightError("开采失败")
-
-        except Exception as e:
-            raise PetFightError(f"泰坦矿洞第三阶段失败: {str(e)}")
-
-    def _execute_titan_mines_stage4(self):
-        """执行泰坦矿洞第四阶段(安全撤离)"""
-        try:
-            # 检查所需宠物
-            pet_ids_needed = (3512, 3437, 3045)
-            if not self.check_backpack_pets(pet_ids_needed):
-                raise PetFightError("缺少撤离所需宠物")
-
-            # 发送撤离数据包
-            self.send_packet_processing.SendPacket(
-                '00 00 00 1D 31 00 00 A5 9C 00 00 00 00 00 00 00 00 00 00 00 68 '
-                '00 00 00 03 00 00 00 04'
-            )
-            time.sleep(self.operation_delay)
-
-            # 执行撤离战斗
-            self._execute_battle_sequence("84")
-
-        except Exception as e:
-            raise PetFightError(f"泰坦矿洞第四阶段失败: {str(e)}")
+        """泰坦矿洞"""
+        self.run_routine("titan_mines")
 
     def _check_mining_result(self) -> bool:
         """检查矿物开采结果
@@ -588,12 +800,18 @@ class PetFightPacketManager:
         return {
             "is_fighting": self.is_fighting,
             "battle_type": self.current_battle_type,
-            "pet_cache_count": len(self.pet_cache)
+            "pet_cache_count": len(self.inventory),
+            "inventory_valid": self.inventory.valid,
+            "pacing": self.pacing,
+            "pacing_acked": self.pacing_acked,
+            "pacing_timeouts": self.pacing_timeouts,
+            "server_fighting": self.battle_engine.fighting,
+            "battles": self.battle_engine.stats()
         }
 
     def clear_pet_cache(self):
         """清理宠物缓存"""
-        self.pet_cache.clear()
+        self.inventory.clear()
         self.logger.info("宠物缓存已清理")
 
     def get_cached_pet_info(self, pet_id: int) -> Optional[PetInfo]:
@@ -605,7 +823,7 @@ class PetFightPacketManager:
         Returns:
             Optional[PetInfo]: 宠物信息，不存在则返回None
         """
-        return self.pet_cache.get(pet_id)
+        return self.inventory.get(pet_id)
 
     def _validate_pet_id(self, pet_id: int) -> bool:
         """验证宠物ID是否有效
@@ -636,7 +854,7 @@ class PetFightPacketManager:
         return (
             f"PetFightPacketManager(fighting={self.is_fighting}, "
             f"battle_type={self.current_battle_type}, "
-            f"cached_pets={len(self.pet_cache)})"
+            f"cached_pets={len(self.inventory)})"
         )
 
     def __repr__(self) -> str:
@@ -649,64 +867,54 @@ class PetFightPacketManager:
             f"operation_delay={self.operation_delay}, "
             f"is_fighting={self.is_fighting}, "
             f"battle_type={self.current_battle_type!r}, "
-            f"pet_cache={self.pet_cache!r})"
+            f"inventory_pets={self.inventory.pets!r})"
         )
 
-    def _find_pet_in_warehouse(self, pet_id: int, packet_data: bytes) -> bool:
+    def _find_pet_in_warehouse(self, pet_id: int, packet_data: Union[bytes, WarehouseIndex]) -> bool:
         """在仓库数据中查找指定宠物
         
         Args:
             pet_id: 宠物ID
-            packet_data: 仓库数据
+            packet_data: 仓库数据，或已解析的仓库索引
             
         Returns:
             bool: 是否找到宠物
         """
         try:
-            pet_id_hex = pet_id.to_bytes(4, byteorder='big').hex()
-            
-            for i in range(len(packet_data) - 8):
-                current_id = packet_data[i:i+4]
-                if current_id == bytes.fromhex(pet_id_hex):
-                    timestamp = packet_data[i+4:i+8]
-                    timestamp_int = int.from_bytes(timestamp, byteorder='big')
-                    
-                    # 缓存宠物信息
-                    self.pet_cache[pet_id] = PetInfo(
-                        pet_id=pet_id,
-                        timestamp=timestamp_int,
-                        location="warehouse"
-                    )
-                    
-                    self.logger.info(
-                        f"仓库精灵 {pet_id} 的时间戳: {timestamp_int}"
-                    )
-                    
-                    # 发送宠物数据包
-                    self._send_pet_packet(timestamp, is_backpack=False)
-                    return True
-                    
-            return False
+            index = packet_data if isinstance(packet_data, WarehouseIndex) else WarehouseIndex(packet_data)
+            entry = index.get(pet_id)
+            if entry is None:
+                return False
+            timestamp_int, _ = entry
+
+            self.logger.info(
+                f"仓库精灵 {pet_id} 的时间戳: {timestamp_int}"
+            )
+
+            # 放入背包并更新背包/仓库模型
+            pet = self.inventory.get(pet_id) or PetInfo(pet_id, timestamp_int, "warehouse")
+            self._move_pet(pet, to_backpack=True)
+            return True
 
         except Exception as e:
             self.logger.error(f"查找仓库宠物失败: {e}")
             return False
 
-    def _send_pet_packet(self, timestamp: bytes, is_backpack: bool):
+    def _send_pet_packet(self, timestamp: bytes, is_backpack: bool, on_sent: Optional[Callable[[], None]] = None):
         """发送宠物相关数据包
         
         Args:
             timestamp: 时间戳
             is_backpack: 是否在背包中
+            on_sent: 数据包成功发出后调用
         """
         try:
-            location_flag = "00" if is_backpack else "01"
-            packet = (
-                f"00 00 00 19 31 00 00 09 00 00 00 00 00 00 00 00 00"
-                f"{timestamp.hex().upper()} 00 00 00 {location_flag}"
+            self._paced_send(
+                PET_MOVE_PACKET,
+                on_sent=on_sent,
+                catch_time=int.from_bytes(timestamp, byteorder='big'),
+                location=0 if is_backpack else 1
             )
-            self.send_packet_processing.SendPacket(packet)
-            time.sleep(self.operation_delay)
             
         except Exception as e:
             self.logger.error(f"发送宠物数据包失败: {e}")
@@ -734,12 +942,9 @@ class PetFightPacketManager:
                 pet_info = self.get_cached_pet_info(pet_id)
                 
             # 发送切换宠物数据包
-            switch_packet = (
-                f"00 00 00 15 31 00 00 09 67 00 00 00 00 00 00 00 00 "
-                f"{pet_info.timestamp:08X}"
+            self._paced_send(
+                CHANGE_PET_PACKET, catch_time=pet_info.timestamp
             )
-            self.send_packet_processing.SendPacket(switch_packet)
-            time.sleep(self.operation_delay)
             
             return True
             
@@ -753,8 +958,7 @@ class PetFightPacketManager:
             heal_packet = (
                 '00 00 00 11 31 00 00 B8 20 00 00 00 00 00 00 00 00'
             )
-            self.send_packet_processing.SendPacket(heal_packet)
-            time.sleep(self.operation_delay)
+            self._paced_send(heal_packet)
             
         except Exception as e:
             self.logger.error(f"治疗宠物失败: {e}")
@@ -769,8 +973,7 @@ class PetFightPacketManager:
             escape_packet = (
                 '00 00 00 11 31 00 00 09 6A 00 00 00 00 00 00 00 00'
             )
-            self.send_packet_processing.SendPacket(escape_packet)
-            time.sleep(self.operation_delay)
+            self._paced_send(escape_packet)
             
         except Exception as e:
             self.logger.error(f"逃跑失败: {e}")
@@ -0,0 +1,229 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 宠物存取 (PET_RELEASE)，我们自己的存取请求的响应也是这个命令
+PET_RELEASE = 2304
+# 表示获得、捕获、交换或放生了宠物的服务器推送 (Command.json)，收到后背包/仓库内容可能已变化
+# 不按名称匹配：命令ID 0 对应多个无关的名称，PET_ROOM_INBAG 与频繁推送的 GET_EXP 共用 2341
+PET_CHANGE_COMMANDS = frozenset({
+    2409,  # CATCH_MONSTER
+    2518,  # BATTLE_LAB_GET_PET
+    2864,  # OLD_SEER_GET_PET
+    2902,  # EXCHANGE_PET_COMPLETE
+    4114,  # PICTURE_CAPSULE_GET_PET
+    4523,  # NEW_SEER_EXCHANGE_PET
+    9035,  # RELEASE_BLACKPET
+    9216,  # LM_GET_PET
+    9514,  # ELINGSHOU_COME_BACK_GET_PET
+    9535,  # BATMAN_GET_PET
+    9551,  # POPEYE_GET_PET
+    9612,  # COMPASS_GET_PET
+    9663,  # HALLOWEENCANDY_EXCHANGE_PET
+    9703,  # DEVILSOULCONTAINER_GET_PET
+    9708,  # DEVILSOULCONTAINER_WATER_GET_PET
+    9716,  # DEVILSOULCONTAINER_LIFE_GET_PET
+    9721,  # CALL_THREE_GIGANTIC_PET_GET_PET
+    9726,  # LITTLE_PET_SUPER_DREAM2_GET_PET
+    9734,  # KYLIN_VS_ELINGSHOU_SPEED_HATCH_GET_PET
+    9740,  # KYLIN_VS_ELINGSHOU_NORMAL_HATCH_GET_PET
+    9756,  # CATCH_RARE_PET
+    11178,  # BEST_PET_ANBEIDUOFEN_GET_PET
+    41013,  # TIME_CONTROL_GET_PET
+    43003,  # WISH_GET_PET
+    43012,  # SAIKEQI_GET_PET
+    45010,  # LOGIN_GET_PET
+    45019,  # GUAIZHANGTANG_GET_PET
+    46020,  # OUT_OF_PRINT_PET_GET_PET
+    46119,  # REFLOW_GET_PET
+    47023,  # KAIERSI_GET_PET
+    47080,  # SKY_CITY_GET_PET
+    48042,  # LOGINSIGN_GET_PET
+})
+
+@dataclass
+class PetInfo:
+    """宠物信息"""
+    pet_id: int
+    timestamp: int
+    location: str  # "backpack" 或 "warehouse"
+
+class PetInventory:
+    """背包/仓库模型
+
+    记录每只宠物所在的位置与捕获时间戳。自己发出的存取操作直接更新模型，
+    只有相关的服务器推送 (获得、捕获、交换宠物，或不是由我们发起的存取) 才会使模型失效，
+    模型有效期间的宠物检查完全在本地完成，不需要再请求背包与仓库列表。
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.RLock()
+        self.pets: Dict[int, PetInfo] = {}  # 宠物ID -> 宠物信息
+        self.backpack: List[int] = []  # 背包中的宠物ID (按背包顺序)
+        self.valid = False  # 背包内容是否已知且未失效
+        self.warehouse_complete = False  # 仓库内容是否全部已知
+        self.generation = 0  # 每次失效递增，用于丢弃失效前开始的刷新结果
+        self.own_moves = 0  # 已成功发出但尚未收到响应的存取请求数
+        self.sending_moves = 0  # 正在发送、尚不知道是否发出的存取请求数
+        self.early_releases = 0  # 发送期间先于确认到达的存取响应数
+        self.invalidations = 0  # 累计失效次数
+
+    def subscribe(self, receive_packet_analysis):
+        """订阅会改变背包/仓库内容的服务器推送
+
+        Args:
+            receive_packet_analysis: ReceivePacketAnalysis 实例
+        """
+        for command_id in PET_CHANGE_COMMANDS:
+            receive_packet_analysis.subscribe(command_id, self._on_pet_change, inline=True)
+        receive_packet_analysis.subscribe(PET_RELEASE, self._on_pet_release, inline=True)
+
+    def _on_pet_change(self, command_id: int, packet_data: bytes):
+        self.invalidate(f"收到命令 {command_id}")
+
+    def _on_pet_release(self, command_id: int, packet_data: bytes):
+        with self.lock:
+            if self.own_moves:  # 自己发出的存取请求的响应，模型已经更新过
+                self.own_moves -= 1
+                return
+            if self.sending_moves > self.early_releases:  # 可能是正在发送的请求的响应，等发送结果确定后再处理
+                self.early_releases += 1
+                return
+        self.invalidate("收到非本地发起的宠物存取")
+
+    def invalidate(self, reason: str = ''):
+        """使模型失效，下次检查时重新请求背包与仓库列表"""
+        with self.lock:
+            self.generation += 1
+            self.invalidations += 1
+            self.valid = False
+            self.warehouse_complete = False
+            self.pets.clear()
+            self.backpack.clear()
+        self.logger.debug(f"背包/仓库模型失效: {reason}")
+
+    def begin_refresh(self) -> int:
+        """开始刷新，返回当前版本号，刷新结果只有在此期间没有失效时才会生效"""
+        with self.lock:
+            return self.generation
+
+    def load_backpack(self, pets: Iterable[Tuple[int, int]], generation: int) -> bool:
+        """载入背包列表
+
+        Args:
+            pets: (宠物ID, 捕获时间戳) 序列，按背包顺序
+            generation: begin_refresh 返回的版本号
+
+        Returns:
+            bool: 是否生效 (刷新期间模型失效时丢弃)
+        """
+        with self.lock:
+            if generation != self.generation:
+                return False
+            for pet_id in self.backpack:  # 旧的背包记录作废
+                self.pets.pop(pet_id, None)
+            self.backpack = []
+            for pet_id, timestamp in pets:
+                self.pets[pet_id] = PetInfo(pet_id, timestamp, "backpack")
+                self.backpack.append(pet_id)
+            self.valid = True
+            return True
+
+    def load_warehouse(self, entries: Dict[int, Tuple[int, int]], complete: bool, generation: int) -> bool:
+        """载入仓库中的宠物
+
+        Args:
+            entries: 宠物ID -> (捕获时间戳, 槽位)
+            complete: entries 是否为仓库的全部内容
+            generation: begin_refresh 返回的版本号
+
+        Returns:
+            bool: 是否生效 (刷新期间模型失效时丢弃)
+        """
+        with self.lock:
+            if generation != self.generation:
+                return False
+            for pet_id, (timestamp, _) in entries.items():
+                if pet_id not in self.backpack:
+                    self.pets[pet_id] = PetInfo(pet_id, timestamp, "warehouse")
+            self.warehouse_complete = self.warehouse_complete or complete
+            return True
+
+    def unknown(self, pet_ids: Iterable[int]) -> List[int]:
+        """返回模型中还不知道位置的宠物ID"""
+        with self.lock:
+            return [pet_id for pet_id in pet_ids if pet_id not in self.pets]
+
+    def plan(self, pet_ids: Tuple[int, ...]) -> Tuple[List[PetInfo], List[PetInfo]]:
+        """计算使背包恰好为 pet_ids (按顺序) 所需的最少存取操作
+
+        背包开头与 pet_ids 顺序一致的部分保持不动，其余背包宠物放入仓库，再按顺序放入缺少的宠物。
+
+        Args:
+            pet_ids: 背包中需要的宠物ID (按顺序)
+
+        Returns:
+            Tuple[List[PetInfo], List[PetInfo]]: (要放入仓库的宠物, 要放入背包的宠物)
+
+        Raises:
+            KeyError: 如果某只宠物不在背包也不在仓库中
+        """
+        with self.lock:
+            for pet_id in pet_ids:
+                if pet_id not in self.pets:
+                    raise KeyError(pet_id)
+            keep = 0
+            while keep < min(len(self.backpack), len(pet_ids)) and self.backpack[keep] == pet_ids[keep]:
+                keep += 1
+            move_out = [self.pets[pet_id] for pet_id in self.backpack[keep:]]
+            move_in = [self.pets[pet_id] for pet_id in pet_ids[keep:]]
+            return move_out, move_in
+
+    def begin_move(self):
+        """开始发送存取请求 (在发送之前调用，之后必须调用 record_move)"""
+        with self.lock:
+            self.sending_moves += 1
+
+    def record_move(self, pet_id: int, to_backpack: bool, sent: bool = True):
+        """记录自己发出的存取操作的发送结果
+
+        只有确认发出的请求才会等待其响应；发送失败时不确定服务器是否执行了存取，模型失效。
+
+        Args:
+            pet_id: 宠物ID
+            to_backpack: True 放入背包，False 放入仓库
+            sent: 数据包是否已成功发出
+        """
+        with self.lock:
+            self.sending_moves -= 1
+            early = self.early_releases > self.sending_moves  # 这次请求的响应已经先到达了
+            if early:
+                self.early_releases -= 1
+            if not sent:
+                self.invalidate("宠物存取请求发送失败")
+                return
+            if not early:
+                self.own_moves += 1
+            pet = self.pets.get(pet_id)
+            if pet is None:
+                return
+            if pet_id in self.backpack:
+                self.backpack.remove(pet_id)
+            if to_backpack:
+                pet.location = "backpack"
+                self.backpack.append(pet_id)
+            else:
+                pet.location = "warehouse"
+
+    def get(self, pet_id: int) -> Optional[PetInfo]:
+        """获取宠物信息，不存在则返回 None"""
+        return self.pets.get(pet_id)
+
+    def clear(self):
+        """清空模型"""
+        self.invalidate("手动清理")
+
+    def __len__(self) -> int:
+        return len(self.pets)
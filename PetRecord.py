@@ -0,0 +1,190 @@
+import struct
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # 可选依赖，仅用于批量分析
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+class RecordLayout:
+    """定长记录的字段布局
+
+    由 (字段名, struct 格式) 列表生成一个大端序 struct.Struct，记录中未列出的部分以填充字节跳过。
+    字段名以下划线开头的字段同样会被跳过 (用于占位)。
+    """
+
+    def __init__(self, fields: Sequence[Tuple[str, str]], size: int):
+        """生成字段布局
+
+        Args:
+            fields: 按偏移顺序排列的 (字段名, struct 格式)，例如 ('level', 'I')、('name', '16s')
+            size: 记录长度 (字节)，不足的部分在末尾补齐
+
+        Raises:
+            ValueError: 如果字段总长度超过记录长度
+        """
+        fmt = '>'
+        self.names: List[str] = []  # 解码出的字段名
+        self.offsets: Dict[str, int] = {}  # 字段名 -> 记录内偏移
+        self.formats: Dict[str, str] = {}  # 字段名 -> struct 格式
+        for name, code in fields:
+            offset = struct.calcsize(fmt)
+            if name.startswith('_'):
+                fmt += f'{struct.calcsize(">" + code)}x'
+                continue
+            fmt += code
+            self.names.append(name)
+            self.offsets[name] = offset
+            self.formats[name] = code
+        padding = size - struct.calcsize(fmt)
+        if padding < 0:
+            raise ValueError(f"字段总长度超过记录长度 {size}")
+        self.struct = struct.Struct(fmt + (f'{padding}x' if padding else ''))
+        self.size = size
+        self._dtype = None
+
+    @property
+    def dtype(self):
+        """对应的 NumPy 结构化 dtype (需要安装 NumPy)"""
+        if np is None:
+            raise RuntimeError("未安装 NumPy")
+        if self._dtype is None:
+            formats = ['S' + code[:-1] if code.endswith('s') else '>u4' if code == 'I' else '>' + code
+                       for code in (self.formats[name] for name in self.names)]
+            self._dtype = np.dtype({
+                'names': self.names,
+                'formats': formats,
+                'offsets': [self.offsets[name] for name in self.names],
+                'itemsize': self.size,
+            })
+        return self._dtype
+
+    def table(self, data, count: int, offset: int = 0) -> 'PetTable':
+        """把连续的 count 条记录解码为按列存储的表
+
+        Args:
+            data: 包含记录的字节数据 (bytes、bytearray 或 memoryview)
+            count: 记录数量
+            offset: 第一条记录在 data 中的偏移
+
+        Returns:
+            PetTable: 解码后的表
+
+        Raises:
+            ValueError: 如果数据长度不足 count 条记录
+        """
+        end = offset + count * self.size
+        if count < 0 or end > len(data):
+            raise ValueError(f"数据长度不足 {count} 条记录")
+        with memoryview(data) as view:  # 直接在原始数据上解码，不复制记录
+            rows = self.struct.iter_unpack(view[offset:end])
+            columns = list(zip(*rows)) if count else [() for _ in self.names]
+        return PetTable(self, dict(zip(self.names, columns)), count)
+
+    def numpy(self, data, count: int, offset: int = 0):
+        """把连续的 count 条记录解释为 NumPy 结构化数组 (不复制数据)"""
+        return np.frombuffer(data, dtype=self.dtype, count=count, offset=offset)
+
+class PetTable:
+    """按列存储的宠物表
+
+    每个字段保存为一个元组，按列查询 (例如所有宠物的等级) 不需要为每只宠物创建对象。
+    """
+
+    __slots__ = ('layout', 'columns', 'count', '_index')
+
+    def __init__(self, layout: RecordLayout, columns: Dict[str, tuple], count: int):
+        self.layout = layout
+        self.columns = columns  # 字段名 -> 该字段所有记录的值
+        self.count = count
+        self._index: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, name: str) -> tuple:
+        """获取一列"""
+        return self.columns[name]
+
+    def row(self, position: int) -> Dict[str, object]:
+        """获取一条记录的所有字段"""
+        return {name: column[position] for name, column in self.columns.items()}
+
+    def index(self, pet_id: int) -> Optional[int]:
+        """获取宠物ID第一次出现的位置，不存在返回 None"""
+        if self._index is None:
+            self._index = {}
+            for position, value in enumerate(self.columns['pet_id']):
+                self._index.setdefault(value, position)
+        return self._index.get(pet_id)
+
+    def where(self, name: str, predicate) -> List[int]:
+        """返回某一列满足条件的记录位置，例如 table.where('level', lambda level: level >= 100)"""
+        return [position for position, value in enumerate(self.columns[name]) if predicate(value)]
+
+    def skills(self, position: int) -> List[Tuple[int, int]]:
+        """获取一条记录的技能 (技能ID, PP) 列表，只包含有效技能"""
+        count = self.columns['skill_num'][position]
+        return [
+            (self.columns[f'skill{i}_id'][position], self.columns[f'skill{i}_pp'][position])
+            for i in range(1, min(count, 4) + 1)
+        ]
+
+    @staticmethod
+    def decode_name(raw: bytes) -> str:
+        """解码名称字段 (UTF-8，去掉末尾的 \\x00)"""
+        return raw.split(b'\x00', 1)[0].decode('utf-8', errors='replace')
+
+# 背包宠物记录 (390 字节)
+# pet_id@0 与 catch_time@148 为现有解析代码使用的偏移；其余字段按客户端 PetInfo 的顺序排列，
+# 132~148 之间的 16 字节用途未知，148 之后的部分暂不解析
+PET_RECORD_SIZE = 390
+PET_RECORD = RecordLayout([
+    ('pet_id', 'I'), ('name', '16s'), ('dv', 'I'), ('nature', 'I'), ('level', 'I'),
+    ('exp', 'I'), ('level_exp', 'I'), ('next_level_exp', 'I'), ('hp', 'I'), ('max_hp', 'I'),
+    ('attack', 'I'), ('defence', 'I'), ('special_attack', 'I'), ('special_defence', 'I'), ('speed', 'I'),
+    ('ev_hp', 'I'), ('ev_attack', 'I'), ('ev_defence', 'I'),
+    ('ev_special_attack', 'I'), ('ev_special_defence', 'I'), ('ev_speed', 'I'),
+    ('skill_num', 'I'),
+    ('skill1_id', 'I'), ('skill1_pp', 'I'), ('skill2_id', 'I'), ('skill2_pp', 'I'),
+    ('skill3_id', 'I'), ('skill3_pp', 'I'), ('skill4_id', 'I'), ('skill4_pp', 'I'),
+    ('_unknown', '16s'),
+    ('catch_time', 'I'),
+], PET_RECORD_SIZE)
+
+# 仓库列表中每条记录开头的字段，记录长度由响应推出
+WAREHOUSE_FIELDS = [('pet_id', 'I'), ('catch_time', 'I')]
+
+def warehouse_layout(stride: int) -> RecordLayout:
+    """获取指定记录长度的仓库记录布局"""
+    layout = _warehouse_layouts.get(stride)
+    if layout is None:
+        layout = _warehouse_layouts[stride] = RecordLayout(WAREHOUSE_FIELDS, stride)
+    return layout
+
+_warehouse_layouts: Dict[int, RecordLayout] = {}
+
+def decode_pet_list(packet_body, layout: RecordLayout = PET_RECORD) -> PetTable:
+    """解码 数量(4) + 定长记录 格式的宠物列表包体
+
+    包体被截断时只解码完整的记录并记录警告，不抛出异常。
+
+    Args:
+        packet_body: 去掉17字节包头后的包体
+        layout: 记录布局，默认为 390 字节的背包宠物记录
+
+    Returns:
+        PetTable: 解码后的宠物表
+    """
+    if len(packet_body) < 4:
+        logger.warning(f"宠物列表包体只有 {len(packet_body)} 字节，没有宠物数量")
+        return layout.table(b'', 0)
+    count = int.from_bytes(packet_body[:4], byteorder='big')
+    complete = (len(packet_body) - 4) // layout.size
+    if count > complete:
+        logger.warning(f"宠物列表包体被截断：声明 {count} 条记录，只有 {complete} 条完整记录")
+        count = complete
+    return layout.table(packet_body, count, offset=4)
@@ -0,0 +1,279 @@
+import time # 导入 time 模块，用于计算令牌补充与等待时间
+import logging # 导入 logging 模块，用于日志记录
+import threading # 导入 threading 模块，用于保护令牌桶状态
+import weakref # 导入 weakref 模块，按等待方 Future 记录发送时间，放弃的等待自动清理
+from collections import Counter # 导入 Counter 统计批量中各命令的数量
+from typing import Dict, Iterable, Optional, Tuple # 从 typing 模块导入类型提示
+
+# 表示被踢下线或被限流的服务器通知 (Command.json)
+KICK_COMMANDS = (
+    5003, # LEAVE_GAME：服务器要求离开游戏 (被踢下线或账号在别处登录)
+    4511, # ANTI_ADDICTION_INFORM：防沉迷通知，随后会被强制下线
+)
+
+class TokenBucket: # 定义 TokenBucket 类，表示一个速率可调的令牌桶
+    """令牌桶
+
+    令牌按 rate 个/秒补充，最多积累 burst 个。预约令牌时允许透支，
+    透支的部分换算为调用方需要等待的时间，因此一次预约多个令牌 (批量发送) 也能正确排队。
+    """
+
+    def __init__(self, rate: float, burst: float, min_rate: float, max_rate: float): # 初始化方法
+        self.rate = rate # 当前速率 (令牌/秒)
+        self.burst = burst # 桶容量
+        self.min_rate = min_rate # 速率下限
+        self.max_rate = max_rate # 速率上限
+        self.tokens = burst # 当前令牌数，可以为负 (已被预约)
+        self.updated = time.monotonic() # 上次补充令牌的时间
+        self.last_decrease = 0.0 # 上次降速的时间，用于降速冷却
+
+    def reserve(self, count: int, now: float) -> float: # 预约令牌，返回需要等待的时间
+        """预约 count 个令牌 (调用方需持有锁)
+
+        Returns:
+            float: 需要等待的时间（秒），0 表示可以立即发送
+        """
+        self._refill(now)
+        self.tokens -= count
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def _refill(self, now: float): # 按当前速率补充到 now 为止的令牌
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate: float, now: float): # 修改速率，修改前的时间段仍按旧速率补充令牌
+        self._refill(now)
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+
+    def increase(self, step: float, now: float): # 加性增加速率
+        self.set_rate(self.rate + step, now)
+
+    def decrease(self, factor: float, now: float, cooldown: float) -> bool: # 乘性降低速率
+        """按 factor 降低速率，冷却时间内的重复降速被忽略，返回是否实际降速"""
+        if now - self.last_decrease < cooldown:
+            return False
+        self.last_decrease = now
+        self.set_rate(self.rate * factor, now)
+        return True
+
+class RateLimiter: # 定义 RateLimiter 类，在发送前按全局与单个命令的令牌桶限速
+    """自适应限速器
+
+    每次发送都要同时从全局令牌桶和该命令的令牌桶取得令牌。速率按加性增、乘性减 (AIMD) 自动调整：
+    收到正常响应且往返时间 (RTT) 没有明显变长时逐步提速；RTT 超过该命令最小 RTT 的 rtt_factor 倍、
+    响应的 result 字段为错误码时降速；连接被断开或收到踢下线通知时全局速率降到下限。
+    """
+
+    def __init__(self, rate: float = 5.0, burst: float = 5, min_rate: float = 0.5, max_rate: float = 50.0,
+                 command_rate: float = 5.0, command_burst: float = 3, command_max_rate: float = 20.0,
+                 limits: Optional[Dict[int, Tuple[float, float, float]]] = None): # 初始化方法
+        """初始化限速器
+
+        Args:
+            rate: 全局初始速率 (个/秒)
+            burst: 全局令牌桶容量
+            min_rate: 速率下限，全局与单个命令共用
+            max_rate: 全局速率上限
+            command_rate: 单个命令的初始速率 (个/秒)
+            command_burst: 单个命令的令牌桶容量
+            command_max_rate: 单个命令的速率上限
+            limits: 需要单独限制的命令，命令ID -> (初始速率, 令牌桶容量, 速率上限)
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.lock = threading.Lock() # 保护所有令牌桶与统计状态
+        self.min_rate = min_rate
+        self.command_rate = command_rate
+        self.command_burst = command_burst
+        self.command_max_rate = command_max_rate
+        self.limits = dict(limits or {})
+
+        self.global_bucket = TokenBucket(rate, burst, min_rate, max_rate) # 全局令牌桶
+        self.buckets: Dict[int, TokenBucket] = {} # 命令ID -> 令牌桶，第一次发送时创建
+
+        # 自适应参数
+        self.increase_step = 0.5 # 每个正常响应增加的速率 (个/秒)
+        self.decrease_factor = 0.5 # 收到错误响应时的降速倍数
+        self.congestion_factor = 0.8 # RTT 明显变长时的降速倍数
+        self.rtt_factor = 3.0 # RTT 超过最小 RTT 的倍数时视为拥塞
+        self.rtt_slack = 0.05 # 同时 RTT 至少比最小 RTT 多出这么多才视为拥塞（秒），避免低延迟下的抖动触发降速
+        self.cooldown = 1.0 # 同一令牌桶两次降速之间的最短间隔（秒）
+        self.reply_window = 10.0 # 超过该时间未收到的响应不再用于测量 RTT（秒）
+
+        # RTT 测量
+        self.receiver = None # attach 的 ReceivePacketAnalysis，发送时据此找到等待响应的 Future
+        self.sent_at = weakref.WeakKeyDictionary() # 等待响应的 Future -> 预计的发送时间
+        self.srtt: Dict[int, float] = {} # 命令ID -> 平滑后的 RTT
+        self.min_rtt: Dict[int, float] = {} # 命令ID -> 观察到的最小 RTT
+
+        # 统计信息
+        self.acquired = 0 # 已放行的发送数
+        self.delayed = 0 # 需要等待才放行的发送次数
+        self.waited = 0.0 # 累计等待时间（秒）
+        self.errors = 0 # 收到的错误响应数
+        self.kicks = 0 # 连接被断开或被踢下线的次数
+
+    def _bucket(self, command_id: int) -> TokenBucket: # 获取命令的令牌桶 (调用方需持有锁)
+        bucket = self.buckets.get(command_id)
+        if bucket is None:
+            rate, burst, max_rate = self.limits.get(
+                command_id, (self.command_rate, self.command_burst, self.command_max_rate)
+            )
+            bucket = self.buckets[command_id] = TokenBucket(rate, burst, self.min_rate, max_rate)
+        return bucket
+
+    def acquire(self, command_id: int) -> float: # 发送一个数据包前取得令牌
+        """发送一个数据包前调用，令牌不足时阻塞等待
+
+        Args:
+            command_id: 要发送的命令ID
+
+        Returns:
+            float: 实际等待的时间（秒）
+        """
+        return self.acquire_many((command_id,))
+
+    def acquire_many(self, command_ids: Iterable[int]) -> float: # 批量发送前一次取得所有令牌
+        """批量发送前调用，一次预约整批所需的令牌，令牌不足时阻塞等待
+
+        Args:
+            command_ids: 要发送的命令ID 序列
+
+        Returns:
+            float: 实际等待的时间（秒）
+        """
+        delay = self.reserve_many(command_ids)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def reserve_many(self, command_ids: Iterable[int]) -> float: # 一次预约所有令牌，不等待
+        """与 acquire_many 相同，但只预约令牌而不阻塞，由调用方等待返回的时间后再发送
+        (例如在事件循环中 await asyncio.sleep)
+
+        Args:
+            command_ids: 要发送的命令ID 序列
+
+        Returns:
+            float: 需要等待的时间（秒）
+        """
+        counts = Counter(command_ids)
+        if not counts:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            delay = self.global_bucket.reserve(sum(counts.values()), now)
+            for command_id, count in counts.items():
+                delay = max(delay, self._bucket(command_id).reserve(count, now))
+            if self.receiver is not None: # 在这些请求的等待方上记录预计的发送时间，用于测量 RTT
+                for command_id, count in counts.items():
+                    for future in self.receiver.waiting(command_id):
+                        if not count:
+                            break
+                        if future not in self.sent_at:
+                            self.sent_at[future] = now + delay
+                            count -= 1
+            self.acquired += sum(counts.values())
+            if delay > 0:
+                self.delayed += 1
+                self.waited += delay
+        return delay
+
+    def attach(self, receive_packet_analysis, kick_commands: Iterable[int] = KICK_COMMANDS): # 订阅响应以调整速率
+        """观察交给等待方的响应 (用于测量 RTT 与识别错误响应) 并订阅踢下线通知
+
+        只有被发送方登记的等待方认领的响应才算作请求的响应，同一命令的服务器推送不会影响测量。
+
+        Args:
+            receive_packet_analysis: ReceivePacketAnalysis 或 AsyncClient 实例
+            kick_commands: 表示被踢下线或被限流的服务器通知的命令ID
+        """
+        self.receiver = receive_packet_analysis
+        receive_packet_analysis.observe_replies(self._on_reply)
+        for command_id in kick_commands:
+            receive_packet_analysis.subscribe(command_id, self._on_kick_notice, inline=True)
+
+    def _on_reply(self, command_id: int, future, packet_data: bytes): # 等待方认领了一个响应
+        now = time.monotonic()
+        with self.lock:
+            sent = self.sent_at.pop(future, None)
+        if sent is None or now - sent > self.reply_window: # 不是经过限速发送的请求，或发送记录已过期
+            return
+        result = int.from_bytes(packet_data[13:17], byteorder='big')
+        if result != 0: # 服务器返回错误码
+            self.on_error(command_id, result)
+        else:
+            self.on_success(command_id, max(0.0, now - sent))
+
+    def _on_kick_notice(self, command_id: int, packet_data: bytes): # 收到踢下线通知
+        self.on_kick(f"收到命令 {command_id}")
+
+    def on_success(self, command_id: int, rtt: float): # 收到正常响应
+        """收到正常响应，RTT 没有明显变长时提速，否则降速
+
+        Args:
+            command_id: 命令ID
+            rtt: 往返时间（秒）
+        """
+        with self.lock:
+            srtt = self.srtt.get(command_id)
+            self.srtt[command_id] = rtt if srtt is None else srtt * 0.875 + rtt * 0.125
+            min_rtt = self.min_rtt[command_id] = min(self.min_rtt.get(command_id, rtt), rtt)
+            bucket = self._bucket(command_id)
+            now = time.monotonic()
+            srtt = self.srtt[command_id]
+            if srtt > min_rtt * self.rtt_factor and srtt - min_rtt > self.rtt_slack: # 服务器响应变慢，视为拥塞
+                bucket.decrease(self.congestion_factor, now, self.cooldown)
+                self.global_bucket.decrease(self.congestion_factor, now, self.cooldown)
+            else:
+                bucket.increase(self.increase_step, now)
+                self.global_bucket.increase(self.increase_step, now)
+
+    def on_error(self, command_id: int, result: int = 0): # 收到错误响应
+        """收到错误响应，该命令与全局速率都降低
+
+        Args:
+            command_id: 命令ID
+            result: 服务器返回的错误码
+        """
+        with self.lock:
+            self.errors += 1
+            now = time.monotonic()
+            decreased = self._bucket(command_id).decrease(self.decrease_factor, now, self.cooldown)
+            self.global_bucket.decrease(self.decrease_factor, now, self.cooldown)
+            rate = self.buckets[command_id].rate
+        if decreased:
+            self.logger.warning(f"命令 {command_id} 返回错误码 {result}，降速至 {rate:.2f} 个/秒")
+
+    def on_kick(self, reason: str = ''): # 连接被断开或被踢下线
+        """连接被断开或被踢下线，全局速率降到下限，所有命令的速率减半"""
+        with self.lock:
+            self.kicks += 1
+            now = time.monotonic()
+            self.global_bucket.set_rate(self.global_bucket.min_rate, now)
+            for bucket in self.buckets.values():
+                bucket.set_rate(bucket.rate * self.decrease_factor, now)
+            self.sent_at.clear()
+        self.logger.warning(f"连接被断开或被踢下线，全局速率降至 {self.min_rate:.2f} 个/秒: {reason}")
+
+    def rate(self, command_id: Optional[int] = None) -> float: # 获取当前速率
+        """获取全局或某个命令的当前速率 (个/秒)"""
+        with self.lock:
+            if command_id is None:
+                return self.global_bucket.rate
+            return self._bucket(command_id).rate
+
+    def stats(self) -> dict: # 获取限速统计信息
+        """获取限速统计信息"""
+        with self.lock:
+            return {
+                "rate": self.global_bucket.rate,
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "waited": self.waited,
+                "errors": self.errors,
+                "kicks": self.kicks,
+                "commands": {
+                    command_id: {"rate": bucket.rate, "srtt": self.srtt.get(command_id)}
+                    for command_id, bucket in self.buckets.items()
+                },
+            }
@@ -1,9 +1,15 @@
-import json # 导入 json 模块，用于处理 JSON 数据
+import time # 导入 time 模块，用于记录响应到达时间
+import queue # 导入 queue 模块，用作各处理阶段之间的有界队列
 import threading # 导入 threading 模块，用于多线程编程
+import struct # 导入 struct 模块，用于从接收缓冲区读取包长度
 import logging # 导入 logging 模块，用于日志记录
-from typing import Optional, Dict, Any # 从 typing 模块导入类型提示
+from collections import deque # 导入 deque，用作未认领响应的信箱
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError # 导入 Future，用于请求/响应关联
+from typing import Optional, Dict, List, Callable, Tuple, Union # 从 typing 模块导入类型提示
 from dataclasses import dataclass # 从 dataclasses 模块导入 dataclass，用于创建简单的数据类
 from Algorithms import Algorithms # 从 Algorithms 文件导入 Algorithms 类
+from PacketTrace import PacketTrace # 从 PacketTrace 文件导入封包追踪
+from CommandRegistry import CommandRegistry, get_registry # 从 CommandRegistry 文件导入共享的命令注册表
 
 @dataclass # 使用 dataclass 装饰器，自动生成 __init__, __repr__ 等方法
 class PacketInfo: # 定义 PacketInfo 数据类，用于存储数据包信息
@@ -12,10 +18,260 @@ class PacketInfo: # 定义 PacketInfo 数据类，用于存储数据包信息
     command_name: str # 命令名称
     packet_data: bytes # 数据包内容
 
+@dataclass # 使用 dataclass 装饰器，自动生成 __init__, __repr__ 等方法
+class QuarantinedFrame: # 定义 QuarantinedFrame 数据类，保存被隔离的异常数据，供排查使用
+    """被隔离的异常数据"""
+    timestamp: float # 隔离时间
+    reason: str # 隔离原因
+    data: bytes # 原始字节 (密文)
+
+_LENGTH = struct.Struct('>I') # 包头长度字段的格式
+MIN_FRAME_LENGTH = 18 # 最短的密文数据包：17字节包头加密后多出1字节
+MAX_FRAME_LENGTH = 4 * 1024 * 1024 # 默认允许的最长数据包
+RESYNC_CHAIN_DEPTH = 3 # 重新对齐时要求连续合理的包头数量
+MAX_QUARANTINE_BYTES = 65536 # 每次隔离最多保存的字节数
+
+class FrameError(ValueError): # 包长度字段不合理时抛出的异常
+    """包长度字段超出合理范围"""
+
+class ReceiveBuffer: # 定义 ReceiveBuffer 类，基于读写偏移的接收缓冲区
+    """基于读写偏移的接收缓冲区
+
+    预先分配一块可增长的 bytearray，socket 数据通过 recv_into 直接写入空闲尾部，
+    取出数据包只移动读偏移并返回 memoryview，不会复制剩余数据。
+    只有读偏移越过阈值或尾部空间不足时才把未读数据搬到开头 (压缩)，空间仍不足时再扩容。
+    每次读取的大小随实际到达的数据量自适应调整。
+
+    next_frame 返回的 memoryview 可以交给其他线程，处理完后调用 release 释放；
+    还有视图未释放时不会原地压缩或扩容，而是把未读数据搬到另一块存储 (旧存储的视图全部释放后重用)。
+    包长度字段超出 [min_frame, max_frame] 时 next_frame 抛出 FrameError 并进入重新对齐状态，
+    之后调用 resync 跳过错误数据，直到找到可以验证的包头。
+    """
+
+    def __init__(self, capacity: int = 65536, min_read: int = 4096, max_read: int = 262144,
+                 compact_threshold: Optional[int] = None,
+                 min_frame: int = MIN_FRAME_LENGTH, max_frame: int = MAX_FRAME_LENGTH): # 初始化方法
+        """初始化接收缓冲区
+
+        Args:
+            capacity: 初始容量
+            min_read: 单次读取的最小字节数
+            max_read: 单次读取的最大字节数
+            compact_threshold: 读偏移超过该值时压缩，默认容量的一半
+            min_frame: 合理的最短数据包长度
+            max_frame: 合理的最长数据包长度
+        """
+        self.data = bytearray(capacity) # 底层存储
+        self.start = 0 # 读偏移：第一个未处理字节
+        self.end = 0 # 写偏移：最后一个有效字节之后
+        self.min_read = min_read # 单次读取的最小字节数
+        self.max_read = max_read # 单次读取的最大字节数
+        self.read_size = min_read # 当前单次读取的字节数
+        self.compact_threshold = compact_threshold if compact_threshold is not None else capacity // 2
+        self.generation = 0 # 每次 clear 递增，用于丢弃与 clear 并发写入的数据
+        self.min_frame = min_frame # 合理的最短数据包长度
+        self.max_frame = max_frame # 合理的最长数据包长度
+        self.resyncing = False # 是否处于重新对齐状态
+        self.resync_offset = 0 # 重新对齐时从读偏移之后第几个字节开始查找 (读偏移处已确定无效时为1)
+        self.skipped = bytearray() # 重新对齐期间跳过的数据 (最多保存 MAX_QUARANTINE_BYTES 字节)
+        self.exports: Dict[int, int] = {} # id(存储) -> 尚未释放的视图数
+        self.exports_lock = threading.Lock() # 视图在其他线程中释放
+        self.exported_end = 0 # 当前存储上最后一个返回的视图的结束位置
+        self.spare: Optional[bytearray] = None # 换下来的旧存储，其上的视图全部释放后再次换用时重用
+        self.swaps = 0 # 因视图未释放而换用存储的次数
+
+    def __len__(self) -> int: # 未处理的字节数
+        return self.end - self.start
+
+    def _exported(self, data: bytearray) -> bool: # 存储上是否还有未释放的视图
+        return id(data) in self.exports
+
+    def _reserve(self, size: int): # 确保尾部至少有 size 字节的空闲空间
+        """确保尾部有足够的空闲空间，必要时压缩或扩容"""
+        if self._exported(self.data): # 视图仍指向读偏移之前的数据，不能原地搬移或扩容
+            if len(self.data) - self.end < size or self.end < self.exported_end:
+                self._swap(size)
+            return
+        if self.start == self.end: # 没有未读数据时直接回到开头，无需搬移
+            self.start = self.end = 0
+        free = len(self.data) - self.end
+        if self.start and (self.start >= self.compact_threshold or free < size): # 压缩：把未读数据搬到开头
+            pending = self.end - self.start
+            self.data[:pending] = self.data[self.start:self.end] # 等长切片赋值，不会改变底层大小
+            self.start, self.end = 0, pending
+            free = len(self.data) - self.end
+        if free < size: # 仍然不足时按倍数扩容
+            self.data.extend(bytes(max(size - free, len(self.data))))
+
+    def _swap(self, size: int): # 把未读数据搬到另一块存储，旧存储留给尚未释放的视图
+        pending = self.end - self.start
+        capacity = max(len(self.data), pending + size)
+        spare = self.spare
+        if spare is None or len(spare) < capacity or self._exported(spare): # 旧存储仍在使用时另外分配
+            spare = bytearray(capacity)
+        spare[:pending] = self.data[self.start:self.end]
+        self.spare, self.data = self.data, spare
+        self.start, self.end = 0, pending
+        self.exported_end = 0
+        self.swaps += 1
+
+    def _pending_frame_length(self) -> int: # 当前未完整到达的数据包还缺少的字节数
+        if len(self) < 4:
+            return 0
+        return max(_LENGTH.unpack_from(self.data, self.start)[0] - len(self), 0)
+
+    def recv_into(self, sock) -> int: # 从 socket 读取数据直接写入缓冲区
+        """从 socket 读取数据到缓冲区尾部
+
+        Args:
+            sock: socket 对象
+
+        Returns:
+            int: 读取的字节数，0 表示对端关闭连接
+        """
+        size = max(self.read_size, min(self._pending_frame_length(), self.max_read))
+        self._reserve(size)
+        generation, position = self.generation, self.end
+        with memoryview(self.data) as view, view[position:position + size] as target:
+            received = sock.recv_into(target, size)
+        if generation == self.generation: # 读取期间被 clear 时丢弃这部分数据
+            self.end = position + received
+
+        # 自适应读取大小：读满则加倍，明显不足则减半
+        if received >= self.read_size:
+            self.read_size = min(self.read_size * 2, self.max_read)
+        elif received < self.read_size // 4:
+            self.read_size = max(self.read_size // 2, self.min_read)
+        return received
+
+    def feed(self, data) -> None: # 追加一段已经读取到的数据
+        """追加数据到缓冲区尾部 (用于数据不是由本缓冲区读取的场合)"""
+        size = len(data)
+        self._reserve(size)
+        self.data[self.end:self.end + size] = data
+        self.end += size
+
+    def next_frame(self) -> Optional[memoryview]: # 取出下一个完整的数据包
+        """取出下一个完整的数据包
+
+        Returns:
+            Optional[memoryview]: 指向缓冲区内数据包的视图，数据不完整时返回 None
+
+        Raises:
+            FrameError: 如果包长度字段超出合理范围，此时进入重新对齐状态
+        """
+        if self.resyncing or len(self) < 4:
+            return None
+        packet_length = _LENGTH.unpack_from(self.data, self.start)[0] # 前4字节为包长度（大端序）
+        if not self.min_frame <= packet_length <= self.max_frame:
+            self.resyncing, self.resync_offset = True, 1
+            raise FrameError(f"包长度 {packet_length} 超出合理范围")
+        if len(self) < packet_length:
+            return None
+        frame = memoryview(self.data)[self.start:self.start + packet_length]
+        self.start += packet_length
+        self.exported_end = self.start
+        key = id(self.data)
+        with self.exports_lock:
+            self.exports[key] = self.exports.get(key, 0) + 1
+        return frame
+
+    def release(self, frame: memoryview): # 释放 next_frame 返回的视图
+        """释放 next_frame 返回的视图，可以在任意线程中调用"""
+        key = id(frame.obj)
+        frame.release()
+        with self.exports_lock:
+            count = self.exports[key] - 1
+            if count:
+                self.exports[key] = count
+            else: # 没有视图时存储可以原地压缩、扩容或重用
+                del self.exports[key]
+
+    def _check_chain(self, position: int) -> Optional[bool]: # 验证某个位置开始的包头链
+        """从 position 开始沿包长度字段向后跳，验证是否像真正的包头
+
+        Returns:
+            Optional[bool]: 连续 RESYNC_CHAIN_DEPTH 个包头都合理或恰好到达数据末尾时为 True，
+            遇到不合理的长度时为 False，已接收的数据不足以判断时为 None
+        """
+        for _ in range(RESYNC_CHAIN_DEPTH):
+            if position == self.end:
+                return True
+            if position + 4 > self.end:
+                return None
+            length = _LENGTH.unpack_from(self.data, position)[0]
+            if not self.min_frame <= length <= self.max_frame:
+                return False
+            position += length
+        return True
+
+    def resync(self) -> Optional[bytes]: # 跳过错误数据，重新对齐到可以验证的包头
+        """逐字节查找可以验证的包头并跳过其间的数据
+
+        确定不可能是包头的数据会立即丢弃；遇到暂时无法验证的位置时停在那里等待更多数据，
+        下次调用继续查找。
+
+        Returns:
+            Optional[bytes]: 重新对齐后返回被跳过的数据 (最多 MAX_QUARANTINE_BYTES 字节)，
+            仍需更多数据时返回 None
+        """
+        position = self.start + self.resync_offset
+        first_unknown = None
+        while position + 4 <= self.end:
+            verified = self._check_chain(position)
+            if verified:
+                break
+            if verified is None and first_unknown is None: # 记下第一个无法判断的位置，继续向后寻找
+                first_unknown = position
+            position += 1
+        else:
+            # 没有找到可以验证的包头：丢弃确定无效的数据，停在第一个无法判断的位置
+            position = first_unknown if first_unknown is not None else max(self.end - 3, self.start + 1)
+            self._skip_to(min(position, self.end))
+            self.resync_offset = 0 # 下次从这个尚未判断的位置重新验证
+            return None
+
+        self._skip_to(position)
+        self.resyncing = False
+        skipped, self.skipped = bytes(self.skipped), bytearray()
+        return skipped
+
+    def _skip_to(self, position: int): # 把读偏移移动到 position，并保存被跳过的数据
+        room = MAX_QUARANTINE_BYTES - len(self.skipped)
+        if room > 0:
+            self.skipped += self.data[self.start:min(position, self.start + room)]
+        self.start = position
+
+    def clear(self): # 丢弃所有未处理的数据
+        """丢弃所有未处理的数据"""
+        self.generation += 1
+        self.start = self.end = 0
+        self.resyncing = False
+        self.skipped = bytearray()
+
+PacketHandler = Callable[[int, bytearray], None] # 订阅回调：handler(命令ID, 解密后的数据包)
+PacketPredicate = Callable[[int], bool] # 订阅条件：predicate(命令ID) 为 True 时调用回调
+
 class ReceivePacketAnalysis: # 定义 ReceivePacketAnalysis 类，用于处理接收到的游戏数据包
     """处理接收到的游戏数据包"""
 
-    def __init__(self, algorithms: Algorithms, tcp_socket, userid: int): # 初始化方法
+    def __init__(self, algorithms: Algorithms, tcp_socket, userid: int, trace: Optional[PacketTrace] = None,
+                 frame_queue_size: int = 1024, handler_workers: int = 2, handler_queue_size: int = 256): # 初始化方法
+        """初始化接收处理
+
+        接收分为三个阶段：接收线程 (receive_data) 只负责从 socket 读取数据并切分出完整的密文数据包；
+        解码线程负责解密、分类、处理密钥初始化并通知等待方；订阅回调在一个小线程池中执行。
+        阶段之间是有界队列，队列满时上游阻塞等待，可以通过 stats 查看队列长度。
+
+        Args:
+            algorithms: Algorithms 类的实例，用于加解密
+            tcp_socket: TCP socket 连接对象
+            userid: 用户ID
+            trace: 封包追踪，可与发送端共享同一个实例
+            frame_queue_size: 接收线程与解码线程之间的队列容量
+            handler_workers: 执行回调的线程数
+            handler_queue_size: 尚未执行完的回调数量上限
+        """
         # 配置日志
         self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
 
@@ -23,108 +279,282 @@ class ReceivePacketAnalysis: # 定义 ReceivePacketAnalysis 类，用于处理
         self.algorithms = algorithms # Algorithms 类的实例，用于加解密
         self.tcp_socket = tcp_socket # TCP socket 连接对象
         self.userid = userid # 用户ID
+        self.trace = trace if trace is not None else PacketTrace() # 封包追踪，可与发送端共享同一个实例
+
+        # 命令ID与名称的映射关系，进程内所有实例共享同一份
+        self.commands: CommandRegistry = get_registry()
 
-        # 加载命令配置
-        self.command_dict = self._load_command_dict() # 加载命令ID与名称的映射关系
+        # 请求/响应关联：每个命令ID可以有任意多个等待方，按登记顺序依次认领响应
+        self.waiters: Dict[int, List[Future]] = {} # 命令ID -> 等待中的 Future 列表
+        self.waiters_lock = threading.Lock() # 保护等待方与信箱
+        # 信箱：暂存最近未被认领的响应，避免响应先于等待登记到达而丢失
+        self.mailbox = deque(maxlen=64) # (到达时间, 命令ID, 数据包内容)
+        self.mailbox_ttl = 2.0 # 信箱中响应的有效期（秒）
 
-        # 数据包处理相关
-        self.current_command_id: Optional[int] = None # 当前等待的特定命令ID
-        self.packet_data: Optional[bytes] = None # 存储接收到的特定数据包内容
-        self.data_ready_event = threading.Event() # 线程事件，用于通知特定数据包已准备好
+        # 订阅分发表：按命令ID索引，每个数据包只需一次字典查找；列表整体替换，分发时无需加锁
+        self.subscribers: Dict[int, Tuple[Tuple[PacketHandler, bool], ...]] = {} # 命令ID -> ((回调, 是否同步执行), ...)
+        self.predicate_subscribers: Tuple[Tuple[PacketPredicate, PacketHandler, bool], ...] = () # 按条件订阅的回调
+        self.subscribers_lock = threading.Lock() # 保护订阅表的修改
+        self.reply_observers: Tuple[Callable[[int, Future, bytearray], None], ...] = () # 响应交给等待方之后的回调
 
         # 接收缓冲区
-        self.buffer = bytearray() # 字节数组，用作接收数据的缓冲区
+        self.buffer = ReceiveBuffer() # 基于读写偏移的接收缓冲区
         self.buffer_lock = threading.Lock() # 线程锁，用于保护缓冲区的并发访问
 
+        # 接收线程 -> 解码线程：完整的密文数据包
+        self.frame_queue: queue.Queue = queue.Queue(maxsize=frame_queue_size)
+        self.decode_thread: Optional[threading.Thread] = None # 解码线程
+        # 解码线程 -> 回调线程池：信号量限制尚未执行完的回调数量
+        self.handler_executor = ThreadPoolExecutor(max_workers=handler_workers, thread_name_prefix='PacketHandler')
+        self.handler_slots = threading.BoundedSemaphore(handler_queue_size)
+        self.handler_queue_size = handler_queue_size
+        self.handler_lock = threading.Lock() # 保护回调计数
+
+        # 统计信息
+        self.frames_received = 0 # 接收线程切分出的数据包数
+        self.frames_decoded = 0 # 解码线程处理完的数据包数
+        self.frame_queue_max_depth = 0 # 观察到的最大解码队列长度
+        self.handlers_pending = 0 # 已提交但尚未执行完的回调数
+        self.handlers_max_pending = 0 # 观察到的最大回调积压数
+        self.handler_errors = 0 # 抛出异常的回调数
+
+        # 隔离区：保存长度不合理或解密处理出错的数据，只丢弃出错的那一段，其余数据继续处理
+        self.quarantine = deque(maxlen=16) # 最近被隔离的 QuarantinedFrame
+        self.quarantined_count = 0 # 累计被隔离的次数
+        self.resync_reason = '' # 最近一次进入重新对齐状态的原因
+
+        # 密钥初始化必须在解码线程中同步完成，后续数据包才能用新密钥解密
+        self.subscribe(1001, self._handle_key_init, inline=True)
+        self.key_ready = threading.Event() # 收到当前连接的 1001 数据包后置位
+
+        # 连接管理
+        self.receive_thread: Optional[threading.Thread] = None # 当前执行 receive_data 的线程
+        self.on_disconnect: Optional[Callable[[object], None]] = None # 连接意外断开时的回调，参数为断开的 socket
+
         # 超时设置
         self.receive_timeout = 5.0  # 默认接收超时时间（秒）
+        self.finish_timeout = 5.0 # 接收结束时等待解码线程处理完队列的最长时间（秒）
         self.running = True # 运行状态标志，控制接收循环
 
-    def _load_command_dict(self) -> Dict[str, Any]: # 加载命令配置文件的私有方法
-        """加载命令配置文件
+    def start(self): # 启动解码线程
+        """启动解码线程，receive_data 开始时会自动调用"""
+        if self.decode_thread and self.decode_thread.is_alive():
+            return
+        self.decode_thread = threading.Thread(target=self._decode_loop, name='PacketDecoder', daemon=True)
+        self.decode_thread.start()
 
-        Returns:
-            Dict: 命令字典，键为命令ID字符串，值为包含命令名称等信息的列表或字典
-            
-        Raises:
-            FileNotFoundError: 如果 Command.json 文件不存在
-            json.JSONDecodeError: 如果 Command.json 文件格式错误
+    def receive_data(self): # 接收数据包的主循环方法
+        """接收数据包的主循环
+
+        只负责把 socket 数据读入接收缓冲区并切分出完整的密文数据包，解密和后续处理都在解码线程中进行，
+        慢速的日志或回调不会阻塞 socket 读取。
         """
+        self.start() # 确保解码线程已启动
+        self.receive_thread = threading.current_thread()
+        tcp_socket = self.tcp_socket # 本次循环读取的连接，重连后由新的循环读取新连接
         try:
-            with open('Command.json', 'r') as file: # 打开 Command.json 文件进行读取
-                return json.load(file) # 解析 JSON 文件内容并返回字典
-        except FileNotFoundError: # 捕获文件未找到异常
-            self.logger.error("Command.json 文件不存在") # 记录错误日志
-            raise # 重新抛出异常
-        except json.JSONDecodeError: # 捕获 JSON 解析异常
-            self.logger.error("Command.json 格式错误") # 记录错误日志
-            raise # 重新抛出异常
-
-    def receive_data(self): # 接收并处理数据包的主循环方法
-        """接收并处理数据包的主循环"""
-        while self.running: # 当程序处于运行状态时循环
-            try:
-                if not self.tcp_socket: # 检查 TCP socket 是否存在
-                    self.logger.error('未连接到服务器') # 记录错误日志
+            while self.running: # 当程序处于运行状态时循环
+                try:
+                    if not tcp_socket: # 检查 TCP socket 是否存在
+                        self.logger.error('未连接到服务器') # 记录错误日志
+                        break # 跳出循环
+
+                    # 从 TCP socket 直接读取到接收缓冲区，读取大小自适应调整
+                    received = self.buffer.recv_into(tcp_socket)
+                    if not received: # 如果接收到的数据为空，表示服务器断开连接
+                        self.logger.error('服务器断开连接') # 记录错误日志
+                        break # 跳出循环
+
+                    # 切分出完整的数据包交给解码线程
+                    with self.buffer_lock: # 获取缓冲区锁，保证线程安全
+                        self._drain_frames() # 调用 _drain_frames 方法切分缓冲区中的数据
+
+                except Exception as e: # 捕获接收数据过程中可能发生的异常
+                    self.logger.error(f"接收数据时发生错误：{e}") # 记录错误日志
                     break # 跳出循环
+        finally:
+            self._finish_decoding() # 让解码线程处理完已接收的数据包后退出
+            # 不是主动停止时通知连接已断开
+            if self.running and tcp_socket is not None and self.on_disconnect is not None:
+                self.on_disconnect(tcp_socket)
 
-                # 从 TCP socket 接收数据，最多1024字节
-                recv_data = self.tcp_socket.recv(1024)
-                if not recv_data: # 如果接收到的数据为空，表示服务器断开连接
-                    self.logger.error('服务器断开连接') # 记录错误日志
-                    break # 跳出循环
+    def restart(self, tcp_socket) -> threading.Thread: # 在新连接上重新开始接收
+        """在新连接上重新开始接收 (重连后调用)
 
-                # 处理接收到的数据包
-                with self.buffer_lock: # 获取缓冲区锁，保证线程安全
-                    self.buffer.extend(recv_data) # 将接收到的数据追加到缓冲区
-                    self._process_buffer() # 调用 _process_buffer 方法处理缓冲区中的数据
+        等待旧连接的接收循环退出后，清空接收缓冲区并在新线程中开始读取新连接，
+        等待方与信箱保持不变，重放的请求的响应仍然交给原来的等待方。
 
-            except Exception as e: # 捕获接收数据过程中可能发生的异常
-                self.logger.error(f"接收数据时发生错误：{e}") # 记录错误日志
-                break # 跳出循环
+        Args:
+            tcp_socket: 新的 TCP socket 连接对象
 
-    def _process_buffer(self): # 处理接收缓冲区中的数据包的私有方法
-        """处理接收缓冲区中的数据包"""
-        while len(self.buffer) >= 4: # 当缓冲区中的数据长度大于等于4字节（至少包含一个包长度信息）
+        Returns:
+            threading.Thread: 新的接收线程
+        """
+        self.wait_stopped()
+        self.tcp_socket = tcp_socket
+        self.key_ready.clear()
+        self.clear_buffer()
+        thread = threading.Thread(target=self.receive_data, name='PacketReceiver', daemon=True)
+        thread.start()
+        return thread
+
+    def wait_stopped(self, timeout: float = 5.0) -> bool: # 等待当前的接收循环退出
+        """等待当前的接收循环退出 (连接关闭后调用)，返回是否已退出"""
+        thread = self.receive_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    @property
+    def receiving(self) -> bool: # 接收循环是否正在运行
+        thread = self.receive_thread
+        return self.running and thread is not None and thread.is_alive()
+
+    def wait_for_key(self, timeout: float) -> bool: # 等待当前连接的密钥初始化
+        """等待当前连接收到 1001 数据包并完成密钥初始化，返回是否完成"""
+        return self.key_ready.wait(timeout)
+
+    def _drain_frames(self): # 切分接收缓冲区中的完整数据包的私有方法
+        """把接收缓冲区中的完整数据包以视图的形式放入解码队列，解码线程处理完后释放"""
+        while True:
+            if self.buffer.resyncing: # 重新对齐：只跳过错误数据，而不是清空整个缓冲区
+                skipped = self.buffer.resync()
+                if skipped is None: # 等待更多数据后继续查找
+                    break
+                self._quarantine(f"重新对齐，跳过 {len(skipped)} 字节 ({self.resync_reason})", skipped)
+                continue
+
+            # 取出下一个完整的数据包，数据不完整时等待更多数据
             try:
-                # 从缓冲区前4字节提取数据包长度（大端序）
-                packet_length = int.from_bytes(self.buffer[:4], byteorder='big')
-
-                # 检查数据包是否完整，即缓冲区中的数据是否足够一个完整的数据包
-                if len(self.buffer) < packet_length:
-                    break # 如果数据不完整，则等待更多数据，跳出当前处理循环
-
-                # 提取完整的数据包
-                packet_data = bytes(self.buffer[:packet_length])
-                # 从缓冲区中移除已提取的数据包
-                self.buffer = self.buffer[packet_length:]
+                frame = self.buffer.next_frame()
+            except FrameError as e: # 长度字段不合理：进入重新对齐状态
+                self.resync_reason = str(e)
+                continue
+            if frame is None:
+                break
+            self._enqueue_frame(frame)
 
-                # 解密数据包
-                decrypted_data = self.algorithms.decrypt(packet_data)
+    def _enqueue_frame(self, frame: Optional[memoryview]) -> bool: # 放入解码队列，队列满时阻塞等待
+        """放入解码队列，队列满时阻塞等待
 
-                # 解析命令ID（从解密后数据的第5到第9字节，大端序）
-                command_value = int.from_bytes(decrypted_data[5:9], byteorder='big')
-                # 获取命令名称
-                command_str = self._get_command_name(command_value)
+        解码线程已经退出时不会再有人取走队列中的数据包，此时放弃 (数据包视图直接释放)；
+        结束标记 None 最多等待 finish_timeout 秒。
 
-                # 格式化解密后的数据包为十六进制字符串并记录日志
-                formatted_hex = ' '.join(
-                    [decrypted_data.hex()[i:i+2] for i in range(0, len(decrypted_data.hex()), 2)]
-                ).upper()
-                self.logger.info(f"{command_str}: {formatted_hex}") # 记录命令名称和数据包内容
+        Returns:
+            bool: 是否放入了队列
+        """
+        deadline = time.monotonic() + self.finish_timeout
+        while True:
+            try:
+                self.frame_queue.put(frame, timeout=0.5)
+                break
+            except queue.Full:
+                decoding = self.decode_thread is not None and self.decode_thread.is_alive()
+                if frame is None:
+                    if decoding and time.monotonic() < deadline:
+                        continue
+                    self.logger.warning('解码队列已满且解码线程没有响应，不再等待其结束') # 记录警告日志
+                    return False
+                if not decoding or not self.running: # 已停止或解码线程已退出时丢弃剩余数据包
+                    if not decoding:
+                        self.logger.error('解码线程已退出，丢弃数据包') # 记录错误日志
+                    self.buffer.release(frame)
+                    return False
+        if frame is not None:
+            self.frames_received += 1
+            self.frame_queue_max_depth = max(self.frame_queue_max_depth, self.frame_queue.qsize())
+        return True
+
+    def _finish_decoding(self): # 通知解码线程结束并等待其处理完队列
+        if not self._enqueue_frame(None): # None 表示接收结束
+            return
+        if self.decode_thread and self.decode_thread is not threading.current_thread():
+            self.decode_thread.join(timeout=self.finish_timeout)
+
+    def _decode_loop(self): # 解码线程主循环
+        """依次解密并处理解码队列中的数据包，密钥初始化在这里同步完成，保证后续数据包使用新密钥"""
+        while True:
+            frame = self.frame_queue.get()
+            if frame is None: # 接收结束
+                break
+            try:
+                self._decode_frame(frame)
+            except Exception as e: # 单个数据包出错只隔离该数据包，不影响后续数据包
+                self._quarantine(f"处理数据包时发生错误: {e}", bytes(frame))
+                self.trace.dump("(处理接收数据包出错)") # 输出最近的封包以便排查
+            finally:
+                self.buffer.release(frame) # 接收缓冲区在视图释放后才会重用这部分空间
+            self.frames_decoded += 1
 
-                # 处理特殊命令，例如密钥初始化
-                self._handle_special_commands(command_value, decrypted_data)
+    def _quarantine(self, reason: str, data: bytes): # 隔离一段异常数据
+        """隔离一段异常数据并记录日志
 
-                # 检查当前接收到的数据包是否是正在等待的特定数据包
-                if command_value == self.current_command_id:
-                    self._handle_target_packet(decrypted_data) # 如果是，则处理目标数据包
+        Args:
+            reason: 隔离原因
+            data: 被隔离的原始字节
+        """
+        self.quarantine.append(QuarantinedFrame(time.time(), reason, data))
+        self.quarantined_count += 1
+        self.logger.error(f"隔离 {len(data)} 字节异常数据: {reason}") # 记录错误日志
+
+    def _decode_frame(self, frame: memoryview): # 解密并分类一个数据包
+        """解密并处理一个完整的密文数据包 (接收缓冲区上的视图)"""
+        decrypted_data = bytearray(len(frame) - 1) # 明文比密文少1字节
+        self.algorithms.decrypt_into(frame, decrypted_data)
+
+        # 解析命令ID（从解密后数据的第5到第9字节，大端序）
+        command_value = int.from_bytes(decrypted_data[5:9], byteorder='big')
+        # 获取命令名称
+        command_str = self._get_command_name(command_value)
+
+        # 记录到封包追踪，十六进制日志只在对应级别开启时才格式化
+        self.trace.record('recv', command_value, decrypted_data, name=command_str)
+
+        # 分发给订阅方 (同步回调在这里执行，例如密钥初始化)，再交给等待该命令的请求方
+        self._dispatch(command_value, decrypted_data)
+        self._handle_target_packet(command_value, decrypted_data)
+
+    def _submit_handler(self, handler: Callable, *args): # 在回调线程池中执行回调
+        """在回调线程池中执行回调，积压达到上限时阻塞解码线程"""
+        self.handler_slots.acquire()
+        with self.handler_lock:
+            self.handlers_pending += 1
+            self.handlers_max_pending = max(self.handlers_max_pending, self.handlers_pending)
+        try:
+            self.handler_executor.submit(self._run_handler, handler, args)
+        except RuntimeError: # 线程池已关闭
+            self._handler_done()
 
-            except Exception as e: # 捕获处理数据包过程中可能发生的异常
-                self.logger.error(f"处理数据包时发生错误: {e}") # 记录错误日志
-                # 清空缓冲区以防止因错误数据导致的死循环
-                self.buffer.clear()
-                break # 跳出处理循环
+    def _run_handler(self, handler: Callable, args: tuple): # 回调线程中执行单个回调
+        try:
+            handler(*args)
+        except Exception as e: # 回调异常只记录日志
+            with self.handler_lock:
+                self.handler_errors += 1
+            self.logger.error(f"执行回调 {getattr(handler, '__name__', handler)} 时发生错误: {e}")
+        finally:
+            self._handler_done()
+
+    def _handler_done(self): # 回调执行完毕，释放积压名额
+        with self.handler_lock:
+            self.handlers_pending -= 1
+        self.handler_slots.release()
+
+    def stats(self) -> dict: # 获取接收各阶段的统计信息
+        """获取接收各阶段的队列长度与计数"""
+        return {
+            "buffered_bytes": len(self.buffer),
+            "buffer_swaps": self.buffer.swaps,
+            "frames_received": self.frames_received,
+            "frames_decoded": self.frames_decoded,
+            "frame_queue_depth": self.frame_queue.qsize(),
+            "frame_queue_max_depth": self.frame_queue_max_depth,
+            "handlers_pending": self.handlers_pending,
+            "handlers_max_pending": self.handlers_max_pending,
+            "handler_errors": self.handler_errors,
+            "quarantined": self.quarantined_count,
+        }
 
     def _get_command_name(self, command_value: int) -> str: # 根据命令ID获取命令名称的私有方法
         """获取命令名称
@@ -135,32 +565,172 @@ class ReceivePacketAnalysis: # 定义 ReceivePacketAnalysis 类，用于处理
         Returns:
             str: 命令名称，如果未找到则返回 'Unknown Command'
         """
-        # 从 command_dict 中查找命令ID对应的名称，如果找不到，则默认返回 ['Unknown Command']
-        return self.command_dict.get(str(command_value), ['Unknown Command'])[0]
+        # 从共享的命令注册表中按整数命令ID查找名称
+        return self.commands.name(command_value)
 
-    def _handle_special_commands(self, command_value: int, packet_data: bytes): # 处理特殊命令的私有方法
-        """处理特殊命令
+    def subscribe(self, command: Union[int, PacketPredicate], handler: PacketHandler, inline: bool = False): # 订阅服务器推送的数据包
+        """订阅数据包，之后每个匹配的数据包都会调用 handler(命令ID, 数据包内容)
+
+        Args:
+            command: 命令ID，或者接收命令ID并返回是否匹配的函数
+            handler: 回调函数，数据包内容与等待方共享，回调中不应修改
+            inline: 为 True 时在解码线程中同步执行 (应尽量简短)，否则在回调线程池中执行
+        """
+        with self.subscribers_lock:
+            if callable(command):
+                self.predicate_subscribers += ((command, handler, inline),)
+            else:
+                self.subscribers[command] = self.subscribers.get(command, ()) + ((handler, inline),)
+
+    def unsubscribe(self, command: Union[int, PacketPredicate], handler: PacketHandler) -> bool: # 取消订阅
+        """取消 subscribe 登记的订阅
+
+        Args:
+            command: 订阅时使用的命令ID或条件函数
+            handler: 订阅时使用的回调函数
+
+        Returns:
+            bool: 是否找到并取消了订阅
+        """
+        with self.subscribers_lock:
+            if callable(command):
+                remaining = tuple(entry for entry in self.predicate_subscribers
+                                  if not (entry[0] == command and entry[1] == handler))
+                removed = len(remaining) != len(self.predicate_subscribers)
+                self.predicate_subscribers = remaining
+                return removed
+            entries = self.subscribers.get(command, ())
+            remaining = tuple(entry for entry in entries if entry[0] != handler)
+            if remaining:
+                self.subscribers[command] = remaining
+            else:
+                self.subscribers.pop(command, None)
+            return len(remaining) != len(entries)
+
+    def _dispatch(self, command_value: int, packet_data: bytearray): # 把数据包分发给订阅方
+        """把数据包分发给订阅方，同步回调在当前线程执行，其余提交到回调线程池"""
+        for handler, inline in self.subscribers.get(command_value, ()):
+            self._call_handler(handler, inline, command_value, packet_data)
+        for predicate, handler, inline in self.predicate_subscribers:
+            if predicate(command_value):
+                self._call_handler(handler, inline, command_value, packet_data)
+
+    def _call_handler(self, handler: PacketHandler, inline: bool, command_value: int, packet_data: bytearray):
+        if not inline:
+            self._submit_handler(handler, command_value, packet_data)
+            return
+        try:
+            handler(command_value, packet_data)
+        except Exception as e: # 回调异常只记录日志，不影响后续分发
+            with self.handler_lock:
+                self.handler_errors += 1
+            self.logger.error(f"执行回调 {getattr(handler, '__name__', handler)} 时发生错误: {e}")
+
+    def _handle_key_init(self, command_value: int, packet_data: bytes): # 处理密钥初始化 (命令ID 1001)
+        """处理登录成功后的密钥交换 (命令ID 1001)
 
         Args:
             command_value: 命令ID
             packet_data: 解密后的数据包内容
         """
-        if command_value == 1001: # 如果是命令ID为 1001 (通常是登录成功后的密钥交换)
-            self.algorithms.InitKey(packet_data, self.userid) # 使用接收到的数据包和用户ID初始化/更新密钥
-            self.logger.info('密钥初始化完成') # 记录日志
-            # 从数据包的特定位置提取 result 值并更新到 algorithms 对象中
-            result = int.from_bytes(packet_data[13:17], byteorder='big')
-            self.algorithms.result = result
-            self.logger.info(f"Updated result to: {result}") # 记录更新后的 result 值
+        self.algorithms.InitKey(packet_data, self.userid) # 使用接收到的数据包和用户ID初始化/更新密钥
+        self.logger.info('密钥初始化完成') # 记录日志
+        # 从数据包的特定位置提取 result 值并更新到 algorithms 对象中
+        result = int.from_bytes(packet_data[13:17], byteorder='big')
+        self.algorithms.serial.reset(result) # 在分配器锁内重置序列号链
+        self.logger.info(f"Updated result to: {result}") # 记录更新后的 result 值
+        self.key_ready.set()
 
-    def _handle_target_packet(self, packet_data: bytes): # 处理目标数据包的私有方法
-        """处理目标数据包
+    def _handle_target_packet(self, command_value: int, packet_data: bytes): # 处理目标数据包的私有方法
+        """把数据包交给最早登记的等待方，没有等待方时放入信箱
 
         Args:
+            command_value: 命令ID
             packet_data: 解密后的目标数据包内容
         """
-        self.packet_data = packet_data # 将接收到的数据包存储起来
-        self.data_ready_event.set() # 设置事件，通知等待方数据已准备好
+        with self.waiters_lock:
+            waiters = self.waiters.get(command_value)
+            while waiters: # 跳过已被取消或已超时放弃的等待方
+                future = waiters.pop(0)
+                if future.set_running_or_notify_cancel():
+                    if not waiters:
+                        del self.waiters[command_value]
+                    break
+            else:
+                self.waiters.pop(command_value, None)
+                self.mailbox.append((time.monotonic(), command_value, packet_data)) # 暂存未被认领的响应
+                return
+        future.set_result(packet_data) # 在锁外通知等待方
+        for observer in self.reply_observers:
+            try:
+                observer(command_value, future, packet_data)
+            except Exception as e: # 观察方出错不影响后续数据包
+                self.logger.error(f"执行响应观察回调时发生错误: {e}")
+
+    def observe_replies(self, observer: Callable[[int, Future, bytearray], None]): # 观察交给等待方的响应
+        """登记响应观察回调，每当一个响应交给 expect 登记的等待方之后，在解码线程中调用
+        observer(命令ID, 等待方的 Future, 数据包内容)；进入信箱的未认领数据包不会触发
+
+        Args:
+            observer: 回调函数
+        """
+        with self.subscribers_lock:
+            self.reply_observers = self.reply_observers + (observer,)
+
+    def waiting(self, command_id: int) -> List[Future]: # 获取等待某个命令响应的 Future
+        """获取等待某个命令响应的 Future (按登记顺序)"""
+        with self.waiters_lock:
+            return list(self.waiters.get(command_id, ()))
+
+    def expect(self, command_id: int, use_mailbox: bool = True) -> Future: # 登记对某个命令响应的等待
+        """登记对某个命令响应的等待，应在发送请求之前调用，这样再快的响应也不会错过
+
+        Args:
+            command_id: 要等待的命令ID
+            use_mailbox: 是否先认领信箱中有效期内尚未被认领的同命令响应
+
+        Returns:
+            Future: 结果为解密后的数据包内容；不再需要时调用 future.cancel() 放弃等待
+        """
+        future = Future()
+        with self.waiters_lock:
+            if use_mailbox: # 先从信箱中认领有效期内最早到达的同命令响应
+                deadline = time.monotonic() - self.mailbox_ttl
+                for entry in list(self.mailbox):
+                    arrived, cmd, data = entry
+                    if arrived < deadline: # 清理过期的响应
+                        self.mailbox.remove(entry)
+                    elif cmd == command_id:
+                        self.mailbox.remove(entry)
+                        future.set_running_or_notify_cancel()
+                        future.set_result(data)
+                        return future
+            self.waiters.setdefault(command_id, []).append(future)
+        return future
+
+    def cancel_wait(self, command_id: int, future: Future) -> bool: # 放弃 expect 登记的等待
+        """放弃 expect 登记的等待
+
+        Args:
+            command_id: 等待的命令ID
+            future: expect 返回的 Future
+
+        Returns:
+            bool: 是否成功取消 (False 表示响应已经到达)
+        """
+        cancelled = future.cancel()
+        with self.waiters_lock:
+            waiters = self.waiters.get(command_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self.waiters[command_id]
+        return cancelled
+
+    def pending_count(self) -> int: # 当前等待中的请求数量
+        """获取当前等待中的请求数量"""
+        with self.waiters_lock:
+            return sum(len(waiters) for waiters in self.waiters.values())
 
     def wait_for_specific_data(self, command_id: int, timeout: float = None) -> Optional[bytes]: # 等待特定命令的数据包的方法
         """等待特定命令的数据包
@@ -175,31 +745,44 @@ class ReceivePacketAnalysis: # 定义 ReceivePacketAnalysis 类，用于处理
         if timeout is None: # 如果未指定超时时间
             timeout = self.receive_timeout # 使用类定义的默认超时时间
 
+        return self.wait_for_future(self.expect(command_id), command_id, timeout)
+
+    def wait_for_future(self, future: Future, command_id: int, timeout: float = None) -> Optional[bytes]: # 等待 expect 返回的 Future
+        """等待 expect 返回的 Future，超时后自动放弃等待
+
+        Args:
+            future: expect 返回的 Future
+            command_id: 等待的命令ID，用于日志
+            timeout: 超时时间(秒)，如果为 None，则使用默认超时时间
+
+        Returns:
+            Optional[bytes]: 接收到的数据包内容，如果超时、已停止或发生错误则返回 None
+        """
+        if timeout is None: # 如果未指定超时时间
+            timeout = self.receive_timeout # 使用类定义的默认超时时间
+
         try:
-            self.current_command_id = command_id # 设置当前需要等待的命令ID
-            self.data_ready_event.clear() # 清除事件状态，准备等待
-
-            # 等待事件被设置，带有超时时间
-            if self.data_ready_event.wait(timeout):
-                data = self.packet_data # 获取存储的数据包
-                self.packet_data = None # 清空存储的数据包
-                self.current_command_id = None # 清空当前等待的命令ID
-                return data # 返回获取到的数据
-            else:
+            return future.result(timeout) # 返回获取到的数据
+        except FutureTimeoutError: # 超时
+            if self.cancel_wait(command_id, future): # 放弃等待，之后到达的响应会进入信箱
                 self.logger.warning(f"等待命令 {command_id} ({self._get_command_name(command_id)}) 的响应超时") # 记录超时日志
                 return None # 超时返回 None
-
+            return future.result() # 取消前恰好收到了响应
         except Exception as e: # 捕获等待过程中可能发生的异常
             self.logger.error(f"等待数据包时发生错误: {e}") # 记录错误日志
             return None # 发生错误返回 None
-        finally: # 无论成功、超时或异常，都执行 finally 块
-            self.current_command_id = None # 清空当前等待的命令ID
-            self.data_ready_event.clear() # 清除事件状态
 
     def stop(self): # 停止接收数据的方法
         """停止接收数据"""
         self.running = False # 将运行状态设置为 False，使接收循环退出
-        self.data_ready_event.set()  # 设置事件，以解除可能正在等待的线程阻塞
+        self.handler_executor.shutdown(wait=False) # 不再接受新的回调
+        # 以 None 结束所有等待，以解除可能正在等待的线程阻塞
+        with self.waiters_lock:
+            waiters = [future for futures in self.waiters.values() for future in futures]
+            self.waiters.clear()
+        for future in waiters:
+            if future.set_running_or_notify_cancel():
+                future.set_result(None)
 
     def clear_buffer(self): # 清空接收缓冲区的方法
         """清空接收缓冲区"""
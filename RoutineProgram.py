@@ -0,0 +1,436 @@
+import os # 导入 os 模块，用于检查日常配置文件是否变化
+import hashlib # 导入 hashlib 模块，用于计算程序签名
+import asyncio # 导入 asyncio 模块，用于在线程池中写入进度文件
+import inspect # 导入 inspect 模块，用于判断 call 指令调用的方法是否为协程
+import json # 导入 json 模块，用于解析日常配置文件
+import logging # 导入 logging 模块，用于日志记录
+import threading # 导入 threading 模块，用于保护已编译程序的缓存
+from dataclasses import dataclass, field # 从 dataclasses 模块导入 dataclass，用于创建简单的数据类
+from typing import Any, Dict, List, Optional, Tuple # 从 typing 模块导入类型提示
+from PacketTemplate import PacketTemplate # 从 PacketTemplate 文件导入预编译的数据包模板
+
+DEFAULT_ROUTINES_PATH = 'routines.json' # 默认的日常配置文件
+
+# 指令操作码
+OP_SEND = 'send' # 发送数据包
+OP_BATTLE = 'battle' # 执行一场战斗
+OP_CHECK_PETS = 'check_pets' # 确保背包中恰好是指定的宠物
+OP_CALL = 'call' # 调用 PetFightPacketManager 的方法
+OP_LOOP = 'loop' # 循环开始
+OP_NEXT = 'next' # 循环结束，跳回循环开始
+OP_BATCH = 'batch' # 批量发送开始，之后的 send 只收集不发送
+OP_END_BATCH = 'end_batch' # 批量发送结束，一次性发出收集到的数据包并统一等待响应
+
+class RoutineError(Exception): # 日常配置或执行出错时抛出的异常
+    """日常配置错误"""
+    pass
+
+@dataclass # 使用 dataclass 装饰器，自动生成 __init__, __repr__ 等方法
+class Instruction: # 定义 Instruction 数据类，表示扁平程序中的一条指令
+    """扁平程序中的一条指令"""
+    op: str # 操作码
+    template: Optional[PacketTemplate] = None # send：预编译的数据包模板
+    values: Dict[str, int] = field(default_factory=dict) # send：固定的槽位取值
+    variables: Tuple[Tuple[str, str], ...] = () # send：(槽位名, 循环变量名)，执行时取循环变量的当前值
+    pace: bool = True # send：是否按节奏模式等待响应
+    wait: Optional[int] = None # send：必须等到的响应命令ID；batch 中为响应的命令ID (默认与请求相同)
+    battle: Optional[str] = None # send：紧随其后的战斗类型，发送前开始跟踪战斗，提前到达的战斗通知不会丢失
+    argument: Any = None # battle：战斗类型；check_pets：宠物ID元组；call：方法名
+    error: Optional[str] = None # 失败时抛出的错误信息
+    count: int = 0 # loop：循环次数
+    var: Optional[str] = None # loop：循环变量名
+    start: int = 0 # loop：循环变量初值
+    jump: int = 0 # loop：对应 next 的位置；next：对应 loop 的位置；batch：对应 end_batch 的位置
+
+class RoutineProgram: # 定义 RoutineProgram 类，表示编译好的日常程序
+    """编译好的日常程序
+
+    日常配置中的步骤、循环与子日常在加载时展开为一条扁平的指令序列，
+    数据包在编译时就解析为预编译模板，执行时只需填入循环变量并发送。
+    """
+
+    def __init__(self, name: str, title: str, instructions: List[Instruction]): # 初始化方法
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.name = name # 日常名称 (配置中的键)
+        self.title = title # 显示名称
+        self.instructions = instructions # 扁平指令序列
+        self.signature = self._signature() # 程序签名，日常定义修改后旧的断点进度不再适用
+
+    def _signature(self) -> str: # 由指令序列计算程序签名
+        digest = hashlib.md5()
+        for instruction in self.instructions:
+            template = instruction.template
+            digest.update(repr((
+                instruction.op, instruction.count, instruction.var, instruction.start, instruction.jump,
+                instruction.argument, instruction.wait, sorted(instruction.values.items()), instruction.variables,
+                (template.length, template.version, template.cmd_id,
+                 sorted((name, offset, packer.format) for name, (offset, packer) in template.slots.items()))
+                if template else None,
+            )).encode())
+            if template is not None: # 包体内容修改后旧的进度也不再适用
+                digest.update(template.body)
+        return digest.hexdigest()
+
+    def analyse(self) -> Dict[str, int]: # 在执行之前统计程序的通信量
+        """统计程序执行一次的发送数、需要等待服务器的往返次数、战斗次数等
+
+        Returns:
+            Dict[str, int]: 各类操作的次数，round_trips 为需要等待服务器的步骤数 (不含战斗内部的步骤)，
+                一次批量发送只算一次往返
+        """
+        totals = {'sends': 0, 'round_trips': 0, 'batches': 0, 'battles': 0, 'pet_checks': 0, 'calls': 0}
+        multiplier = 1
+        multipliers = []
+        in_batch = False
+        for instruction in self.instructions:
+            if instruction.op == OP_LOOP:
+                multipliers.append(multiplier)
+                multiplier *= instruction.count
+            elif instruction.op == OP_NEXT:
+                multiplier = multipliers.pop()
+            elif instruction.op == OP_BATCH:
+                in_batch = True
+                totals['batches'] += multiplier
+                totals['round_trips'] += multiplier
+            elif instruction.op == OP_END_BATCH:
+                in_batch = False
+            elif instruction.op == OP_SEND:
+                totals['sends'] += multiplier
+                if not in_batch and (instruction.pace or instruction.wait is not None):
+                    totals['round_trips'] += multiplier
+            elif instruction.op == OP_BATTLE:
+                totals['battles'] += multiplier
+            elif instruction.op == OP_CHECK_PETS:
+                totals['pet_checks'] += multiplier
+            elif instruction.op == OP_CALL:
+                totals['calls'] += multiplier
+        return totals
+
+    def run(self, manager, checkpoint=None): # 执行程序
+        """在 PetFightPacketManager 上执行程序
+
+        提供 checkpoint 时，每完成一轮循环或一个循环外的步骤就保存执行位置 (在下一次与服务器通信之前写入文件)；
+        上次中断时从中断的那一轮循环的开头继续 (先重新执行最近的宠物检查)，执行完毕后清除执行位置。
+
+        Args:
+            manager: PetFightPacketManager 实例
+            checkpoint: Checkpoint 实例，为 None 时不保存进度
+
+        Raises:
+            RoutineError: 如果某一步失败
+        """
+        steps = self._steps(checkpoint)
+        result = None
+        try:
+            while True:
+                try:
+                    op, instruction, payload = steps.send(result)
+                except StopIteration:
+                    return
+                if checkpoint is not None:
+                    checkpoint.flush()
+                result = self._perform(manager, op, instruction, payload)
+        finally:
+            if checkpoint is not None:
+                checkpoint.flush()
+
+    async def run_async(self, client, checkpoint=None): # 在事件循环中执行程序
+        """在 AsyncClient 上执行程序，与 run 共用同一套指令解释，只是每一步都以 await 完成，
+        进度文件在线程池中写入，不阻塞事件循环
+
+        Args:
+            client: AsyncClient 实例
+            checkpoint: Checkpoint 实例，为 None 时不保存进度
+
+        Raises:
+            RoutineError: 如果某一步失败
+        """
+        loop = asyncio.get_running_loop()
+        steps = self._steps(checkpoint)
+        result = None
+        try:
+            while True:
+                try:
+                    op, instruction, payload = steps.send(result)
+                except StopIteration:
+                    return
+                if checkpoint is not None and checkpoint.dirty:
+                    await loop.run_in_executor(None, checkpoint.flush)
+                result = await self._perform_async(client, op, instruction, payload)
+        finally:
+            if checkpoint is not None and checkpoint.dirty:
+                await loop.run_in_executor(None, checkpoint.flush)
+
+    def _steps(self, checkpoint=None): # 指令解释器
+        """逐条解释指令，需要与服务器通信的步骤交给执行方
+
+        生成 (操作码, 指令, 参数) 交给执行方，执行方把结果 send 回来：
+        end_batch 的参数为收集到的 (数据包, 取值, 响应命令ID) 列表，结果为响应列表；
+        send 的参数为槽位取值，结果为响应数据包 (需要等待响应时)；
+        check_pets 与 call 的结果为是否成功；battle 没有结果。
+        """
+        loops: List[List[int]] = [] # 循环栈：[剩余次数, 当前循环变量值]
+        variables: Dict[str, int] = {} # 循环变量的当前值
+        batch: Optional[list] = None # 批量发送中收集到的 (数据包, 取值, 响应命令ID)
+        position = 0
+
+        state = checkpoint.routine_state(self.name, self.signature) if checkpoint is not None else None
+        if state is not None: # 从上次中断的位置继续
+            position = state['position']
+            loops = [list(loop) for loop in state['loops']]
+            variables = dict(state['variables'])
+            self.logger.info(f"{self.title}从第 {position} 步继续")
+            # 跳过的部分中最近的一次宠物检查决定了继续执行时背包应有的宠物，中断期间背包可能已变化
+            recheck = self._last_pet_check(position)
+            if recheck is not None and not (yield OP_CHECK_PETS, recheck, None):
+                raise RoutineError(recheck.error or f"缺少宠物 {recheck.argument}")
+
+        while position < len(self.instructions):
+            instruction = self.instructions[position]
+            op = instruction.op
+
+            if op == OP_LOOP:
+                if instruction.count <= 0: # 零次循环直接跳过
+                    position = instruction.jump + 1
+                    continue
+                loops.append([instruction.count, instruction.start])
+                if instruction.var:
+                    variables[instruction.var] = instruction.start
+            elif op == OP_NEXT:
+                loop = loops[-1]
+                loop[0] -= 1
+                if loop[0] > 0: # 继续下一次循环
+                    loop[1] += 1
+                    head = self.instructions[instruction.jump]
+                    if head.var:
+                        variables[head.var] = loop[1]
+                    position = instruction.jump + 1
+                    if checkpoint is not None and batch is None: # 一轮循环完成
+                        self._save(checkpoint, position, loops, variables)
+                    continue
+                loops.pop()
+            elif op == OP_BATCH:
+                batch = []
+            elif op == OP_END_BATCH:
+                items, batch = batch, None
+                responses = yield op, instruction, items
+                if instruction.error and None in responses:
+                    raise RoutineError(instruction.error)
+            elif op == OP_SEND:
+                values = self._values(instruction, variables)
+                if batch is not None:
+                    batch.append((instruction.template, values, instruction.wait))
+                else:
+                    response = yield op, instruction, values
+                    if instruction.wait is not None and response is None: # 必须收到指定的响应
+                        raise RoutineError(instruction.error or f"等待命令 {instruction.wait} 的响应失败")
+            elif op == OP_BATTLE:
+                yield op, instruction, None
+            elif op == OP_CHECK_PETS:
+                if not (yield op, instruction, None):
+                    raise RoutineError(instruction.error or f"缺少宠物 {instruction.argument}")
+            elif op == OP_CALL:
+                result = yield op, instruction, None
+                if instruction.error and not result:
+                    raise RoutineError(instruction.error)
+            position += 1
+            # 循环外的步骤完成，或最外层循环结束
+            if checkpoint is not None and batch is None and not loops and op not in (OP_LOOP, OP_BATCH):
+                self._save(checkpoint, position, loops, variables)
+
+        if checkpoint is not None:
+            checkpoint.finish_routine(self.name, flush=False)
+
+    @staticmethod
+    def _perform(manager, op: str, instruction: Instruction, payload): # 在 PetFightPacketManager 上执行一步
+        if op == OP_END_BATCH:
+            return manager.send_batch(payload)
+        if op == OP_SEND:
+            if instruction.battle is not None:
+                manager._begin_battle(instruction.battle)
+            if instruction.wait is not None:
+                return manager.send_and_wait(instruction.template, instruction.wait, **payload)
+            if instruction.pace:
+                return manager._paced_send(instruction.template, **payload)
+            return manager.send_packet_processing.SendPacket(instruction.template, **payload)
+        if op == OP_BATTLE:
+            return manager._execute_battle_sequence(instruction.argument)
+        if op == OP_CHECK_PETS:
+            return manager.check_backpack_pets(instruction.argument)
+        return getattr(manager, instruction.argument)()
+
+    @staticmethod
+    async def _perform_async(client, op: str, instruction: Instruction, payload): # 在 AsyncClient 上执行一步
+        if op == OP_END_BATCH:
+            return await client.send_batch(payload)
+        if op == OP_SEND:
+            if instruction.battle is not None:
+                client._begin_battle(instruction.battle)
+            if instruction.wait is not None:
+                return await client.send_and_wait(instruction.template, instruction.wait, **payload)
+            if instruction.pace:
+                return await client.paced_send(instruction.template, **payload)
+            return await client.submit(instruction.template, **payload)
+        if op == OP_BATTLE:
+            return await client.execute_battle_sequence(instruction.argument)
+        if op == OP_CHECK_PETS:
+            return await client.check_backpack_pets(instruction.argument)
+        result = getattr(client, instruction.argument)()
+        return await result if inspect.isawaitable(result) else result
+
+    def _save(self, checkpoint, position: int, loops: List[List[int]], variables: Dict[str, int]): # 保存执行位置
+        checkpoint.save_routine(self.name, {
+            'signature': self.signature,
+            'position': position,
+            'loops': [list(loop) for loop in loops],
+            'variables': dict(variables),
+        }, flush=False) # 由执行方写入文件
+
+    def _last_pet_check(self, position: int) -> Optional[Instruction]: # position 之前最近的宠物检查
+        for instruction in reversed(self.instructions[:position]):
+            if instruction.op == OP_CHECK_PETS:
+                return instruction
+        return None
+
+    @staticmethod
+    def _values(instruction: Instruction, variables: Dict[str, int]) -> Dict[str, int]: # 获取 send 指令的槽位取值
+        values = instruction.values
+        if instruction.variables: # 填入循环变量的当前值
+            values = dict(values)
+            for slot, var in instruction.variables:
+                values[slot] = variables[var]
+        return values
+
+    def __repr__(self) -> str: # 返回对象的详细字符串表示
+        return f"RoutineProgram(name={self.name!r}, instructions={len(self.instructions)})"
+
+class RoutineCompiler: # 定义 RoutineCompiler 类，把日常配置编译为扁平程序
+    """日常配置编译器
+
+    配置格式 (JSON)：
+        templates: 命名模板，{"名称": {"packet": 十六进制字符串, "slots": {"槽位": [包体内偏移, struct 格式]}}}
+        routines: {"日常名称": {"title": 显示名称, "steps": [步骤...]}}
+
+    步骤：
+        {"send": 十六进制字符串或模板名, "slots": {...}, "values": {"槽位": 整数或 "$循环变量"}, "pace": true, "wait": 命令ID}
+        {"battle": 战斗类型}
+        {"check_pets": [宠物ID...], "error": 错误信息}
+        {"call": 方法名, "error": 返回值为假时的错误信息}
+        {"loop": 次数, "var": 循环变量名, "start": 初值, "steps": [步骤...]}
+        {"batch": [send 或 loop 步骤...], "error": 有数据包未收到响应时的错误信息} (一次性发出，统一等待响应)
+        {"routine": 其他日常名称} (编译时展开)
+    """
+
+    def __init__(self, config: Dict[str, Any]): # 初始化方法
+        self.config = config
+        self.routines: Dict[str, Any] = config.get('routines', {})
+        self.templates: Dict[str, PacketTemplate] = {
+            name: PacketTemplate(spec['packet'], {slot: tuple(value) for slot, value in spec.get('slots', {}).items()})
+            for name, spec in config.get('templates', {}).items()
+        }
+
+    def compile_all(self) -> Dict[str, RoutineProgram]: # 编译所有日常
+        """编译配置中的所有日常"""
+        return {name: self.compile(name) for name in self.routines}
+
+    def compile(self, name: str) -> RoutineProgram: # 编译单个日常
+        """编译单个日常
+
+        Raises:
+            RoutineError: 如果配置有误
+        """
+        if name not in self.routines:
+            raise RoutineError(f"未定义的日常: {name}")
+        instructions: List[Instruction] = []
+        self._compile_steps(self.routines[name].get('steps', []), instructions, (name,), (), False)
+        return RoutineProgram(name, self.routines[name].get('title', name), instructions)
+
+    def _compile_steps(self, steps: List[Dict[str, Any]], out: List[Instruction],
+                       including: Tuple[str, ...], scope: Tuple[str, ...], in_batch: bool): # 编译步骤列表
+        for step in steps:
+            if in_batch and 'send' not in step and 'loop' not in step: # 批量发送中只能发送数据包
+                raise RoutineError(f"批量发送中不支持的步骤: {step}")
+            if 'send' in step:
+                out.append(self._compile_send(step, scope))
+            elif 'battle' in step:
+                if out and out[-1].op == OP_SEND and not in_batch: # 发起战斗的请求
+                    out[-1].battle = step['battle']
+                out.append(Instruction(OP_BATTLE, argument=step['battle']))
+            elif 'check_pets' in step:
+                out.append(Instruction(OP_CHECK_PETS, argument=tuple(step['check_pets']), error=step.get('error')))
+            elif 'call' in step:
+                out.append(Instruction(OP_CALL, argument=step['call'], error=step.get('error')))
+            elif 'loop' in step:
+                head = Instruction(OP_LOOP, count=int(step['loop']), var=step.get('var'), start=int(step.get('start', 0)))
+                head_position = len(out)
+                out.append(head)
+                inner_scope = scope + (head.var,) if head.var else scope
+                self._compile_steps(step.get('steps', []), out, including, inner_scope, in_batch)
+                head.jump = len(out)
+                out.append(Instruction(OP_NEXT, jump=head_position))
+            elif 'batch' in step:
+                if in_batch:
+                    raise RoutineError("批量发送不能嵌套")
+                head = Instruction(OP_BATCH)
+                out.append(head)
+                self._compile_steps(step['batch'], out, including, scope, True)
+                head.jump = len(out)
+                out.append(Instruction(OP_END_BATCH, error=step.get('error')))
+            elif 'routine' in step:
+                name = step['routine']
+                if name not in self.routines:
+                    raise RoutineError(f"未定义的日常: {name}")
+                if name in including: # 防止日常互相包含导致无限展开
+                    raise RoutineError(f"日常循环包含: {' -> '.join(including + (name,))}")
+                self._compile_steps(self.routines[name].get('steps', []), out, including + (name,), scope, in_batch)
+            else:
+                raise RoutineError(f"无法识别的步骤: {step}")
+
+    def _compile_send(self, step: Dict[str, Any], scope: Tuple[str, ...]) -> Instruction: # 编译 send 步骤
+        packet = step['send']
+        if 'slots' in step: # 直接在步骤中声明参数槽位的数据包
+            template = PacketTemplate(packet, {slot: tuple(value) for slot, value in step['slots'].items()})
+        else:
+            template = self.templates.get(packet) or PacketTemplate.from_hex(packet)
+        values: Dict[str, int] = {}
+        variables = []
+        for slot, value in step.get('values', {}).items():
+            if slot not in template.slots:
+                raise RoutineError(f"模板中不存在参数槽位: {slot}")
+            if isinstance(value, str) and value.startswith('$'): # 引用循环变量
+                if value[1:] not in scope:
+                    raise RoutineError(f"未定义的循环变量: {value}")
+                variables.append((slot, value[1:]))
+            else:
+                values[slot] = int(value)
+        return Instruction(
+            OP_SEND, template=template, values=values, variables=tuple(variables),
+            pace=step.get('pace', True), wait=step.get('wait'), error=step.get('error')
+        )
+
+_programs: Dict[str, Tuple[Tuple[int, int], Dict[str, RoutineProgram]]] = {} # 绝对路径 -> (文件版本, 已编译程序)
+_programs_lock = threading.Lock() # 保护 _programs
+
+def load_routines(path: str = DEFAULT_ROUTINES_PATH) -> Dict[str, RoutineProgram]: # 加载并编译日常配置
+    """加载并编译日常配置，同一文件只编译一次，文件修改后自动重新编译
+
+    Args:
+        path: 日常配置文件路径
+
+    Returns:
+        Dict[str, RoutineProgram]: 日常名称 -> 编译好的程序
+
+    Raises:
+        FileNotFoundError: 如果配置文件不存在
+        RoutineError: 如果配置有误
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _programs_lock:
+        cached = _programs.get(key)
+        if cached is None or cached[0] != signature:
+            with open(path, 'r', encoding='utf-8') as file:
+                programs = RoutineCompiler(json.load(file)).compile_all()
+            cached = _programs[key] = (signature, programs)
+        return cached[1]
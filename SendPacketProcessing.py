@@ -1,12 +1,52 @@
 import logging # 导入 logging 模块，用于日志记录
 import time # 导入 time 模块，用于实现延迟
-from typing import Optional # 从 typing 模块导入 Optional 类型提示
+import random # 导入 random 模块，用于重连退避的随机抖动
+import socket # 导入 socket 模块，用于设置 TCP keepalive 与检查连接状态
+import threading # 导入 threading 模块，用于保证序列号顺序与写出顺序一致
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError # 导入 Future，用于表示异步发送结果
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union # 从 typing 模块导入类型提示
 from Algorithms import Algorithms # 从 Algorithms 文件导入 Algorithms 类
+from PacketTemplate import PacketTemplate # 从 PacketTemplate 文件导入预编译数据包模板
+from PacketTrace import PacketTrace # 从 PacketTrace 文件导入封包追踪
+from PacketWriter import PacketWriter, FrameDiscarded # 从 PacketWriter 文件导入发送队列与写线程
+from RateLimiter import RateLimiter # 从 RateLimiter 文件导入自适应限速器
+
+def enable_keepalive(tcp_socket, idle: int = 10, interval: int = 5, count: int = 3) -> bool: # 开启 TCP keepalive
+    """开启 TCP keepalive，由内核在连接空闲时探测对端，对端失联时接收循环会收到错误并触发重连
+
+    Args:
+        tcp_socket: TCP socket 连接对象
+        idle: 连接空闲多久后开始探测（秒）
+        interval: 探测间隔（秒）
+        count: 连续多少次探测无响应后判定连接断开
+
+    Returns:
+        bool: 是否设置成功 (非 TCP socket 或平台不支持时为 False)
+    """
+    try:
+        tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'): # Linux
+            tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+            tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+        elif hasattr(socket, 'SIO_KEEPALIVE_VALS'): # Windows
+            tcp_socket.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+        elif hasattr(socket, 'TCP_KEEPALIVE'): # macOS
+            tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+        return True
+    except (OSError, AttributeError, ValueError):
+        return False
+
+def is_connection_error(error: Exception) -> bool: # 判断异常是否表示连接已断开
+    """判断异常是否表示连接已断开 (写出超时不算)"""
+    return isinstance(error, OSError) and not isinstance(error, TimeoutError)
 
 class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游戏数据包的发送
     """处理游戏数据包的发送"""
 
-    def __init__(self, algorithms: Algorithms, tcp_socket, userid: int): # 初始化方法
+    def __init__(self, algorithms: Algorithms, tcp_socket, userid: int, trace: Optional[PacketTrace] = None,
+                 writer: Optional[PacketWriter] = None, rate_limiter: Optional[RateLimiter] = None,
+                 connector: Optional[Callable[[], Any]] = None, receiver=None): # 初始化方法
         # 配置日志
         self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
 
@@ -14,6 +54,11 @@ class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游
         self.algorithms = algorithms # Algorithms 类的实例，用于加解密和计算 result
         self.tcp_socket = tcp_socket # TCP socket 连接对象
         self.user_id = userid.to_bytes(length=4, byteorder='big') # 用户ID，转换为4字节大端序字节串
+        self.trace = trace if trace is not None else PacketTrace() # 封包追踪，可与接收端共享同一个实例
+        self.writer = writer # 发送队列与写线程，为 None 时在调用方线程同步写出
+        self.rate_limiter = rate_limiter # 自适应限速器，为 None 时不限速
+        # 序列号是链式计算的，服务器要求按分配顺序到达，因此分配序列号与入队/写出必须在同一把锁内完成
+        self.send_lock = threading.Lock()
 
         # 数据包属性 (用于解析和组装过程中的临时存储)
         self.length: Optional[bytes] = None # 数据包总长度 (字节串形式)
@@ -25,6 +70,27 @@ class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游
         # 重试配置
         self.max_retries = 3 # 最大重试次数
         self.retry_delay = 0.5  # 重试延迟时间（秒）
+        self.write_timeout = 5.0 # 经由写线程发送时等待写出完成的超时时间（秒）
+
+        # 重连配置
+        self.connector = connector # 重新登录并返回新 socket 的方法 (例如 lambda: login.login(userid, password))，为 None 时不重连
+        self.receiver = receiver # ReceivePacketAnalysis 实例，重连时切换到新连接并等待 1001 数据包
+        self.reconnect_attempts = 6 # 最大重连次数
+        self.reconnect_base_delay = 1.0 # 第一次重试前的等待时间（秒），之后每次翻倍
+        self.reconnect_max_delay = 30.0 # 重试等待时间上限（秒）
+        self.key_timeout = 10.0 # 重新登录后等待 1001 数据包的超时时间（秒）
+        self.reconnect_lock = threading.Lock() # 同一时间只进行一次重连
+        self.connection_generation = 0 # 每次重连成功递增
+        self.reconnects = 0 # 重连成功次数
+        self.replayed = 0 # 重连后重放的请求数
+        # 已发出但尚未收到响应的幂等请求，重连后重新发送；键为等待响应的 Future
+        self.unacked: Dict[Future, Tuple[Union[str, PacketTemplate], Dict[str, int]]] = {}
+        self.unacked_lock = threading.Lock()
+
+        if tcp_socket is not None:
+            enable_keepalive(tcp_socket)
+        if receiver is not None:
+            receiver.on_disconnect = self._on_disconnect
 
     def parse_packet(self, packet: bytes) -> 'SendPacketProcessing': # 解析数据包的方法
         """解析数据包
@@ -50,16 +116,17 @@ class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游
             self.result = packet[13:17] # 结果/序列号字段 (通常在 user_id 之后)
             self.body = packet[17:] # 包体内容
 
-            # 记录详细的解析日志 (使用 DEBUG 级别)
-            self.logger.debug(
-                f"解析数据包:\n"
-                f"  Length: {int.from_bytes(self.length, byteorder='big')}\n"
-                f"  Version: {self.version}\n"
-                f"  CmdId: {int.from_bytes(self.cmd_id, byteorder='big')}\n"
-                f"  UserId (from init): {int.from_bytes(self.user_id, byteorder='big')}\n" # 显示初始化时传入的UserId
-                f"  Result (from packet): {int.from_bytes(self.result, byteorder='big')}\n" # 显示从包中解析的result
-                f"  Body: {self.body.hex().upper()}"
-            )
+            # 记录详细的解析日志 (使用 DEBUG 级别，未开启时不做格式化)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(
+                    f"解析数据包:\n"
+                    f"  Length: {int.from_bytes(self.length, byteorder='big')}\n"
+                    f"  Version: {self.version}\n"
+                    f"  CmdId: {int.from_bytes(self.cmd_id, byteorder='big')}\n"
+                    f"  UserId (from init): {int.from_bytes(self.user_id, byteorder='big')}\n" # 显示初始化时传入的UserId
+                    f"  Result (from packet): {int.from_bytes(self.result, byteorder='big')}\n" # 显示从包中解析的result
+                    f"  Body: {self.body.hex().upper()}"
+                )
 
         except Exception as e: # 捕获解析过程中可能发生的其他异常
             self.logger.error(f"解析数据包失败: {e}") # 记录错误日志
@@ -67,11 +134,12 @@ class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游
 
         return self # 返回实例本身，支持链式调用
 
-    def GroupPacket(self, packet: str) -> bytes: # 组装数据包的方法
+    def GroupPacket(self, packet: Union[str, PacketTemplate], **values) -> bytes: # 组装数据包的方法
         """组装数据包
 
         Args:
-            packet: 十六进制字符串格式的原始数据包 (不包含动态计算的 result)
+            packet: 十六进制字符串格式的原始数据包 (不包含动态计算的 result)，或预编译的 PacketTemplate
+            **values: 模板参数槽位的取值
 
         Returns:
             bytes: 组装并计算了 result 后的完整数据包字节串
@@ -80,30 +148,8 @@ class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游
             ValueError: 如果输入的十六进制字符串格式错误
         """
         try:
-            # 验证并转换十六进制字符串为字节串
-            packet_bytes = bytes.fromhex(packet)
-
-            # 解析传入的原始数据包字节串，填充 self.length, self.version, self.cmd_id, self.body 等属性
-            self.parse_packet(packet_bytes)
-
-            # 使用 algorithms 对象计算新的 result 值
-            # 注意：这里的 self.result 将被 calculate_result 的返回值覆盖
-            self.result = self.algorithms.calculate_result(
-                int.from_bytes(self.cmd_id, byteorder='big'), # 将命令ID转换为整数传入
-                self.body # 传入包体
-            )
-
-            # 组装完整的数据包，包含动态计算的 user_id 和 result
-            complete_packet = (
-                self.length + # 包总长度 (从原始包解析得到)
-                self.version.to_bytes(length=1, byteorder='big') + # 版本号
-                self.cmd_id + # 命令ID
-                self.user_id + # 用户ID (从 __init__ 获取)
-                self.result.to_bytes(length=4, byteorder='big') + # 新计算的 result
-                self.body # 包体 (从原始包解析得到)
-            )
-
-            return complete_packet # 返回组装好的完整数据包
+            _, complete_packet = self._assemble(packet, values)
+            return bytes(complete_packet) # 返回组装好的完整数据包
 
         except ValueError as ve: # 捕获 bytes.fromhex 可能抛出的 ValueError (如包含非十六进制字符)
             self.logger.error(f"封包数据格式错误，请检查十六进制字符串: {packet} - {ve}") # 记录错误日志
@@ -112,12 +158,45 @@ class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游
             self.logger.error(f"组装数据包失败: {e}") # 记录错误日志
             raise # 重新抛出异常
 
-    def SendPacket(self, packed_message: str, retries: int = None) -> bool: # 发送数据包的方法，支持重试
+    def _assemble(self, packet: Union[str, PacketTemplate], values: Optional[Dict[str, int]] = None) -> Tuple[PacketTemplate, bytearray]: # 由模板组装数据包
+        """由模板组装数据包，字面量字符串只在第一次使用时解析
+
+        Args:
+            packet: 十六进制字符串或预编译的 PacketTemplate
+            values: 模板参数槽位的取值
+
+        Returns:
+            Tuple[PacketTemplate, bytearray]: 使用的模板与组装好的完整数据包
+        """
+        template = packet if isinstance(packet, PacketTemplate) else PacketTemplate.from_hex(packet)
+
+        # 复制原型并填入参数槽位，校验值只需在预计算值上异或槽位字节
+        buffer, crc = template.render(values)
+        # 使用序列号分配器推进 MSerial 链，再写入用户ID与序列号
+        serial = self.algorithms.serial.advance(template.cmd_id, len(template.body), crc)
+        template.stamp(buffer, self.user_id, serial)
+
+        # 记录最近一次组装的字段，保持与原有属性的兼容
+        self.version = template.version
+        self.cmd_id = buffer[5:9]
+        self.result = serial
+        self.logger.debug("Updated result to: %d", serial)
+
+        return template, buffer
+
+    def SendPacket(self, packed_message: Union[str, PacketTemplate], retries: int = None, idempotent: bool = False,
+                   **values) -> bool: # 发送数据包的方法，支持重试
         """发送数据包，支持重试机制
 
+        只有确定没有写出的封包 (没有被写线程接受，或在队列中被丢弃) 才会自动重发，必要时先重连；
+        可能已经写出的封包只有 idempotent 为 True 时才重发，其余封包 (宠物存取、领取奖励、战斗指令等)
+        重发可能让服务器重复执行。
+
         Args:
-            packed_message: 要发送的数据包 (十六进制字符串格式)
+            packed_message: 要发送的数据包 (十六进制字符串格式或预编译的 PacketTemplate)
             retries: 重试次数，如果为 None，则使用类定义的 self.max_retries
+            idempotent: 请求是否可以安全地重复发送 (例如查询列表)
+            **values: 模板参数槽位的取值
 
         Returns:
             bool: 发送是否成功 (True 表示成功，False 表示所有尝试均失败)
@@ -126,52 +205,275 @@ class SendPacketProcessing: # 定义 SendPacketProcessing 类，用于处理游
             retries = self.max_retries # 使用类定义的默认最大重试次数
 
         for attempt in range(retries): # 循环尝试发送
+            generation = self.connection_generation
+            future = None
             try:
-                # 组装数据包 (包含 result 计算)
-                packet = self.GroupPacket(packed_message)
-                self.logger.info(f'未加密Send封包 (CmdId: {int.from_bytes(self.cmd_id, byteorder="big")}): {packet.hex().upper()}')
-
-                # 加密数据包
-                encrypted_packet = self.algorithms.encrypt(packet)
-                self.logger.info(f'加密后Send封包 (CmdId: {int.from_bytes(self.cmd_id, byteorder="big")}): {encrypted_packet.hex().upper()}')
-
-                # 通过 TCP socket 发送加密后的数据包
-                self.tcp_socket.send(encrypted_packet)
+                # 组装、加密并交给写线程；抛出异常时封包没有被接受，序列号也没有消耗
+                future = self.submit_packet(packed_message, **values)
+                future.result(timeout=self.write_timeout) # 等待写出完成
                 return True # 发送成功，返回 True
 
+            except FutureTimeoutError: # 封包已在发送队列中，之后仍会写出
+                # 重新组装会让服务器收到两次请求，并且新的序列号与服务器推算的序列号链分叉，因此不再重试
+                self.logger.error("等待写出超时，封包仍在发送队列中，不再重试")
+                break
+
             except Exception as e: # 捕获发送过程中可能发生的异常 (如网络错误、组包错误等)
                 self.logger.error(f"发送数据包失败 (尝试 {attempt + 1}/{retries}): {e}") # 记录错误日志
+                if future is not None and not isinstance(e, FrameDiscarded) and not idempotent:
+                    # 写出失败时封包可能已经部分或全部到达服务器，不能自动重发；断线由接收循环触发重连
+                    if is_connection_error(e) and self.rate_limiter is not None:
+                        self.rate_limiter.on_kick(str(e))
+                    self.logger.error("封包可能已经写出，不自动重发")
+                    break
+                if is_connection_error(e) and attempt < retries - 1: # 连接被断开
+                    if self.rate_limiter is not None: # 通知限速器降速
+                        self.rate_limiter.on_kick(str(e))
+                    # 重连后重试；发送期间其他线程已经完成重连时直接重试
+                    if self.connection_generation != generation or self.reconnect(generation):
+                        continue
                 if attempt < retries - 1: # 如果还未达到最大重试次数
                     time.sleep(self.retry_delay) # 等待一段时间后重试
                 # continue 会直接进入下一次循环尝试
         # 如果所有尝试都失败了
+        self.trace.dump("(发送失败)") # 输出最近的封包以便排查
         return False # 返回 False 表示发送失败
 
+    def submit_packet(self, packed_message: Union[str, PacketTemplate], **values) -> Future: # 异步发送数据包的方法
+        """组装、加密数据包并交给写线程，不等待系统调用完成
+
+        Args:
+            packed_message: 要发送的数据包 (十六进制字符串格式或预编译的 PacketTemplate)
+            **values: 模板参数槽位的取值
+
+        Returns:
+            Future: 写出后结果为封包长度，写出失败时为对应异常；未配置写线程时同步写出并返回已完成的 Future
+
+        Raises:
+            FrameDiscarded: 写线程没有运行 (此时没有分配序列号)
+            queue.Full: 发送队列在 write_timeout 内一直处于高水位 (此时没有分配序列号)
+        """
+        if self.rate_limiter is not None: # 在锁外等待令牌，不阻塞其他线程的发送
+            template = packed_message if isinstance(packed_message, PacketTemplate) else PacketTemplate.from_hex(packed_message)
+            self.rate_limiter.acquire(template.cmd_id)
+
+        with self.send_lock: # 保证序列号分配顺序与写出顺序一致
+            if self.writer is not None: # 先确认写线程能接受封包，再分配序列号
+                self.writer.wait_writable(self.write_timeout)
+            previous = self.algorithms.serial.value
+
+            # 组装数据包 (包含 result 计算)
+            template, packet = self._assemble(packed_message, values)
+
+            # 加密数据包
+            encrypted_packet = self.algorithms.encrypt(packet)
+            # 记录到封包追踪，十六进制日志只在对应级别开启时才格式化
+            self.trace.record('send', template.cmd_id, packet, raw=encrypted_packet)
+
+            if self.writer is not None: # 交给写线程合并写出
+                try:
+                    return self.writer.submit(encrypted_packet, timeout=0)
+                except Exception: # 写线程恰好停止：封包没有入队，收回分配的序列号
+                    self.algorithms.serial.rewind(self.result, previous)
+                    raise
+
+            # 没有写线程时在当前线程写出，sendall 会处理部分写入
+            future = Future()
+            try:
+                self.tcp_socket.sendall(encrypted_packet)
+                future.set_result(len(encrypted_packet))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+    def submit_batch(self, packets: Iterable[Tuple[Union[str, PacketTemplate], Optional[Dict[str, int]]]]) -> List[Future]: # 批量发送数据包的方法
+        """组装、加密一批数据包并一次性交给写线程，不等待系统调用完成
+
+        整批数据包在一次加锁内连续分配序列号，全部加密后才入队，写线程可以把它们合并为一次或几次系统调用。
+
+        Args:
+            packets: (数据包, 参数槽位取值) 序列，数据包为十六进制字符串或预编译的 PacketTemplate，取值可以为 None
+
+        Returns:
+            List[Future]: 与 packets 一一对应的 Future，写出后结果为封包长度，写出失败时为对应异常
+
+        Raises:
+            ValueError: 如果某个数据包格式错误 (此时整批都不会发送)
+            FrameDiscarded: 写线程没有运行 (此时整批都不会发送，也没有分配序列号)
+            queue.Full: 发送队列在 write_timeout 内一直处于高水位 (同上)
+        """
+        # 锁外完成模板解析与参数填充，这部分与序列号无关
+        rendered = []
+        for packet, values in packets:
+            template = packet if isinstance(packet, PacketTemplate) else PacketTemplate.from_hex(packet)
+            buffer, crc = template.render(values)
+            rendered.append((template, buffer, crc))
+        if not rendered:
+            return []
+        if self.rate_limiter is not None: # 一次预约整批所需的令牌
+            self.rate_limiter.acquire_many(template.cmd_id for template, _, _ in rendered)
+
+        with self.send_lock: # 保证序列号分配顺序与写出顺序一致
+            if self.writer is not None: # 先确认写线程能接受这一批，等待有上限，不会无限期阻塞其他发送方
+                self.writer.wait_writable(self.write_timeout)
+            previous = self.algorithms.serial.value
+
+            # 一次加锁为整批分配连续的序列号
+            serials = self.algorithms.serial.advance_many(
+                (template.cmd_id, len(template.body), crc) for template, _, crc in rendered
+            )
+            frames = []
+            for (template, buffer, _), serial in zip(rendered, serials):
+                template.stamp(buffer, self.user_id, serial)
+                encrypted_packet = self.algorithms.encrypt(buffer)
+                self.trace.record('send', template.cmd_id, buffer, raw=encrypted_packet)
+                frames.append(encrypted_packet)
+            self.result = serials[-1]
+
+            if self.writer is not None: # 整批交给写线程合并写出
+                try:
+                    return self.writer.submit_many(frames, timeout=0)
+                except Exception: # 写线程恰好停止：整批都没有入队，收回分配的序列号
+                    self.algorithms.serial.rewind(serials[-1], previous)
+                    raise
+
+            # 没有写线程时拼接后一次写出
+            futures = [Future() for _ in frames]
+            try:
+                self.tcp_socket.sendall(b''.join(frames))
+                for future, frame in zip(futures, frames):
+                    future.set_result(len(frame))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            return futures
+
+    def track_unacked(self, packet: Union[str, PacketTemplate], values: Dict[str, int], future: Future): # 登记等待响应的幂等请求
+        """登记一个已发出、正在等待响应的幂等请求 (例如查询背包/仓库列表)，重连后若仍未收到响应则重新发送
+
+        Args:
+            packet: 请求数据包 (十六进制字符串或预编译模板)
+            values: 模板参数槽位的取值
+            future: 等待响应的 Future，完成或取消后自动移除登记
+        """
+        with self.unacked_lock:
+            self.unacked[future] = (packet, dict(values))
+        future.add_done_callback(self._untrack)
+
+    def _untrack(self, future: Future):
+        with self.unacked_lock:
+            self.unacked.pop(future, None)
+
     def is_connected(self) -> bool: # 检查 socket 连接状态的方法
-        """检查socket连接状态"""
+        """检查socket连接状态
+
+        不向连接写入任何数据：检查 socket 是否已关闭、是否有未处理的错误 (SO_ERROR，keepalive 探测失败时会置位)，
+        以及接收循环是否仍在运行。
+        """
         if not self.tcp_socket: # 如果 socket 对象不存在
             return False # 返回未连接
         try:
-            # 尝试发送一个空字节或一个简单的心跳字节来探测连接是否仍然有效
-            # 注意：对方服务器需要能正确处理这种探测包，或者忽略它
-            # 更可靠的方法是检查 socket 的错误状态或使用 socket.getpeername() 等
-            self.tcp_socket.send(b'\x00') # 尝试发送一个字节
-            return True # 如果发送没有立即引发异常，则认为连接是活动的
-        except Exception: # 捕获发送时可能发生的任何异常 (如 BrokenPipeError, ConnectionResetError)
-            return False # 发生异常则认为连接已断开
-
-    def reconnect(self) -> bool: # 重新建立连接的方法 (占位)
+            if self.tcp_socket.fileno() < 0: # socket 已关闭
+                return False
+            if self.tcp_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0: # 连接上有未处理的错误
+                return False
+        except OSError:
+            return False
+        # 接收循环退出表示对端已关闭连接
+        return self.receiver is None or self.receiver.receive_thread is None or self.receiver.receiving
+
+    def _on_disconnect(self, tcp_socket): # 接收循环发现连接断开
+        """接收循环发现连接断开时在后台重连；重连过程中主动关闭旧连接引起的通知被忽略"""
+        if self.connector is None or tcp_socket is not self.tcp_socket or self.reconnect_lock.locked():
+            return
+        self.logger.warning("连接已断开，开始重连")
+        generation = self.connection_generation
+        threading.Thread(target=self.reconnect, args=(generation,), name='Reconnect', daemon=True).start()
+
+    def reconnect(self, generation: Optional[int] = None) -> bool: # 重新建立连接的方法
         """重新建立连接
 
+        关闭旧连接后按指数退避重试：恢复初始密钥与序列号，通过 connector 重新登录，
+        把写线程与接收循环切换到新连接并等待 1001 数据包完成密钥初始化，最后重新发送尚未收到响应的幂等请求。
+
+        Args:
+            generation: 调用方观察到连接断开时的 connection_generation，
+                等锁期间其他线程已经重连成功时直接返回 True
+
         Returns:
             bool: 重连是否成功
         """
-        # 实际的重连逻辑需要在这里实现
-        # 这可能涉及到：
-        # 1. 关闭旧的、可能已损坏的 socket
-        # 2. 重新创建 socket 对象
-        # 3. 调用 Login 类的方法重新执行登录流程以获取新的有效 socket
-        # 4. 更新 self.tcp_socket 为新的 socket
-        self.logger.warning("reconnect 方法尚未完全实现")
-        pass # 目前是空实现
-        return False # 假设重连失败，直到实现为止
+        if self.connector is None:
+            self.logger.warning("未配置登录方法，无法重连")
+            return False
+
+        with self.reconnect_lock:
+            if generation is not None and generation != self.connection_generation and self.is_connected():
+                return True # 其他线程已经完成重连
+
+            self._close(self.tcp_socket)
+            for attempt in range(self.reconnect_attempts):
+                if attempt:
+                    delay = min(self.reconnect_max_delay, self.reconnect_base_delay * 2 ** (attempt - 1))
+                    time.sleep(delay * random.uniform(0.5, 1.0)) # 随机抖动，避免多个账号同时重连
+                tcp_socket = None
+                try:
+                    if self.receiver is not None: # 旧连接上的数据处理完之后才能恢复初始密钥
+                        self.receiver.wait_stopped()
+                    # 收到新连接的 1001 数据包之前不允许任何发送：此时组装的封包会用初始密钥与登录时的序列号加密，
+                    # 写入新连接会破坏新的会话
+                    with self.send_lock:
+                        self.algorithms.reset()
+                        tcp_socket = self.connector()
+                        if not tcp_socket:
+                            raise ConnectionError("登录失败")
+                        enable_keepalive(tcp_socket)
+                        self.tcp_socket = tcp_socket
+                        if self.writer is not None:
+                            self.writer.reset(tcp_socket)
+                        if self.receiver is not None:
+                            self.receiver.restart(tcp_socket)
+                            if not self.receiver.wait_for_key(self.key_timeout):
+                                raise ConnectionError("未收到密钥初始化数据包")
+                except Exception as e:
+                    self.logger.warning(f"重连失败 (尝试 {attempt + 1}/{self.reconnect_attempts}): {e}")
+                    self._close(tcp_socket)
+                    continue
+
+                self.connection_generation += 1
+                self.reconnects += 1
+                self.logger.info(f"重连成功 (尝试 {attempt + 1}/{self.reconnect_attempts})")
+                self._replay_unacked()
+                return True
+
+            self.logger.error(f"重连失败，已尝试 {self.reconnect_attempts} 次")
+            return False
+
+    def _replay_unacked(self): # 重新发送尚未收到响应的幂等请求
+        with self.unacked_lock:
+            pending = [(future, packet, values) for future, (packet, values) in self.unacked.items()]
+        replayed = 0
+        for future, packet, values in pending:
+            if future.done():
+                continue
+            try:
+                self.submit_packet(packet, **values)
+                replayed += 1
+            except Exception as e:
+                self.logger.error(f"重放请求失败: {e}")
+        if replayed:
+            self.replayed += replayed
+            self.logger.info(f"重连后重放 {replayed} 个未收到响应的请求")
+
+    @staticmethod
+    def _close(tcp_socket): # 关闭 socket，忽略已关闭等错误
+        if tcp_socket is None:
+            return
+        try:
+            tcp_socket.shutdown(socket.SHUT_RDWR) # 先 shutdown，阻塞在 recv 上的接收循环会立即返回
+        except OSError:
+            pass
+        try:
+            tcp_socket.close()
+        except OSError:
+            pass
@@ -0,0 +1,184 @@
+import time # 导入 time 模块，用于记录会话的开始与结束时间
+import asyncio # 导入 asyncio 模块，所有会话在同一个事件循环中运行
+import logging # 导入 logging 模块，用于日志记录
+import functools # 导入 functools 模块，用于给默认登录函数绑定参数
+from dataclasses import dataclass, field # 从 dataclasses 模块导入 dataclass，用于创建简单的数据类
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional # 从 typing 模块导入类型提示
+from CommandRegistry import CommandRegistry, get_registry # 从 CommandRegistry 文件导入共享的命令注册表
+from RoutineProgram import load_routines, DEFAULT_ROUTINES_PATH # 从 RoutineProgram 文件导入日常程序
+from Checkpoint import CheckpointStore # 从 Checkpoint 文件导入日常进度存储
+from RateLimiter import RateLimiter # 从 RateLimiter 文件导入自适应限速器
+from AsyncClient import AsyncClient, DAILY_ROUTINES, login # 从 AsyncClient 文件导入 asyncio 会话
+
+# 会话状态
+SESSION_IDLE = 'idle' # 尚未执行
+SESSION_WAITING = 'waiting' # 等待并发名额
+SESSION_LOGIN = 'login' # 正在登录
+SESSION_RUNNING = 'running' # 正在执行日常
+SESSION_DONE = 'done' # 日常全部成功
+SESSION_FAILED = 'failed' # 登录失败或有日常失败
+
+Connector = Callable[..., Awaitable[AsyncClient]] # connector(userid, password, commands=..., rate_limiter=...) -> 已登录的会话
+
+@dataclass # 使用 dataclass 装饰器，自动生成 __init__, __repr__ 等方法
+class Session: # 定义 Session 数据类，表示一个账号的会话
+    """一个账号的会话状态"""
+    userid: int # 用户ID
+    password: str = field(repr=False) # 密码，不出现在日志中
+    status: str = SESSION_IDLE # 会话状态
+    client: Optional[AsyncClient] = field(default=None, repr=False) # 执行期间的连接
+    rate_limiter: RateLimiter = field(default_factory=RateLimiter, repr=False) # 该账号的自适应限速器，跨多次执行保留学到的速率
+    error: Optional[str] = None # 最近一次失败的原因
+    runs: int = 0 # 执行次数
+    started_at: Optional[float] = None # 最近一次开始执行的时间
+    finished_at: Optional[float] = None # 最近一次执行结束的时间
+
+class SessionManager: # 定义 SessionManager 类，在一个进程中运行多个账号的会话
+    """多账号会话管理
+
+    所有账号的会话运行在同一个事件循环中 (AsyncClient)，不可变的部分在会话之间共享：
+    命令注册表、预编译的数据包模板 (PacketTemplate 缓存) 与编译好的日常程序 (load_routines 缓存)；
+    每个会话只持有自己的连接、密钥与序列号 (Algorithms)、限速器、背包模型与日常进度。
+    同时处于登录或执行状态的会话数不超过 max_concurrency，其余会话排队等待。
+    """
+
+    def __init__(self, max_concurrency: int = 16, routines_path: str = DEFAULT_ROUTINES_PATH,
+                 checkpoints: Optional[CheckpointStore] = None, commands: Optional[CommandRegistry] = None,
+                 connector: Optional[Connector] = None, interactive: bool = True): # 初始化方法
+        """
+        Args:
+            max_concurrency: 同时登录或执行日常的会话数上限
+            routines_path: 日常配置文件，所有会话共用编译好的程序
+            checkpoints: 日常进度存储，默认使用 checkpoints 目录
+            commands: 命令注册表，默认使用进程内共享的注册表
+            connector: 登录函数，默认为 AsyncClient.login
+            interactive: 默认登录函数遇到验证码时是否在控制台提示输入 (多个账号逐个提示)，
+                为 False 时该账号的会话以"需要输入验证码"失败，适合无人值守运行
+
+        Raises:
+            RoutineError: 如果日常配置有误 (在创建时就编译，而不是等到第一个会话执行时)
+        """
+        self.logger = logging.getLogger(__name__) # 获取当前模块的 logger 对象
+        self.max_concurrency = max_concurrency
+        self.routines_path = routines_path
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.commands = commands or get_registry()
+        self.connector = connector or functools.partial(login, interactive=interactive)
+        load_routines(routines_path) # 预先编译，之后每个会话命中同一份缓存
+        self.sessions: Dict[int, Session] = {} # 用户ID -> 会话
+
+        self._semaphore: Optional[asyncio.Semaphore] = None # 并发名额，绑定到创建它的事件循环
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # 统计信息
+        self.active = 0 # 当前占用名额的会话数
+        self.max_active = 0 # 同时占用名额的最大会话数
+
+    def add(self, userid: int, password: str) -> Session: # 添加账号
+        """添加账号，已存在时更新密码
+
+        Returns:
+            Session: 该账号的会话
+        """
+        session = self.sessions.get(userid)
+        if session is None:
+            session = self.sessions[userid] = Session(userid, password)
+        else:
+            session.password = password
+        return session
+
+    def remove(self, userid: int) -> bool: # 移除账号
+        """移除账号 (正在执行的会话会执行完当前这一轮)，返回是否存在该账号"""
+        return self.sessions.pop(userid, None) is not None
+
+    def _slots(self) -> asyncio.Semaphore: # 获取当前事件循环的并发名额
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def run_session(self, session: Session, routines: Iterable[str] = DAILY_ROUTINES) -> bool: # 执行一个账号的日常
+        """登录一个账号，依次执行日常后断开连接
+
+        Args:
+            session: 会话
+            routines: 要执行的日常名称
+
+        Returns:
+            bool: 是否登录成功且日常全部成功
+        """
+        session.status = SESSION_WAITING
+        async with self._slots():
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            session.runs += 1
+            session.started_at = time.time()
+            session.error = None
+            try:
+                session.status = SESSION_LOGIN
+                client = session.client = await self.connector(session.userid, session.password, commands=self.commands,
+                                                               rate_limiter=session.rate_limiter)
+                client.routines_path = self.routines_path
+                client.checkpoints = self.checkpoints # 执行日常时载入当天的进度
+
+                session.status = SESSION_RUNNING
+                success = await client.execute_daily_tasks(routines)
+                session.status = SESSION_DONE if success else SESSION_FAILED
+                if not success:
+                    session.error = "部分日常失败"
+                return success
+            except Exception as e:
+                self.logger.error(f"账号 {session.userid} 执行失败: {e}")
+                session.status = SESSION_FAILED
+                session.error = str(e)
+                return False
+            finally:
+                if session.client is not None:
+                    session.client.close()
+                    await session.client.wait_closed()
+                    session.client = None
+                session.finished_at = time.time()
+                self.active -= 1
+
+    async def run_all(self, routines: Iterable[str] = DAILY_ROUTINES,
+                      userids: Optional[Iterable[int]] = None) -> Dict[int, bool]: # 并发执行多个账号的日常
+        """并发执行多个账号的日常，同时执行的数量受 max_concurrency 限制
+
+        Args:
+            routines: 要执行的日常名称
+            userids: 要执行的账号，默认为全部账号
+
+        Returns:
+            Dict[int, bool]: 用户ID -> 是否全部成功
+        """
+        routines = tuple(routines)
+        sessions = [self.sessions[userid] for userid in (self.sessions if userids is None else userids)]
+        results = await asyncio.gather(*(self.run_session(session, routines) for session in sessions))
+        failed = results.count(False)
+        self.logger.info(f"{len(sessions)} 个账号执行完毕，{failed} 个失败")
+        return {session.userid: result for session, result in zip(sessions, results)}
+
+    def run(self, routines: Iterable[str] = DAILY_ROUTINES, userids: Optional[Iterable[int]] = None) -> Dict[int, bool]: # 在新的事件循环中执行
+        """在新的事件循环中执行 run_all，供同步代码 (例如 UI 回调) 调用"""
+        return asyncio.run(self.run_all(routines, userids))
+
+    def status(self) -> List[dict]: # 获取所有会话的状态
+        """获取所有会话的状态"""
+        return [
+            {
+                "userid": session.userid,
+                "status": session.status,
+                "error": session.error,
+                "runs": session.runs,
+                "duration": (session.finished_at - session.started_at
+                             if session.started_at is not None and session.finished_at is not None
+                             and session.finished_at >= session.started_at else None),
+                "client": session.client.stats() if session.client is not None else None,
+            }
+            for session in self.sessions.values()
+        ]
+
+    def __repr__(self) -> str: # 返回对象的详细字符串表示
+        return (f"SessionManager(sessions={len(self.sessions)}, max_concurrency={self.max_concurrency}, "
+                f"active={self.active})")
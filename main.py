@@ -6,6 +6,10 @@ from Login import Login # 从 Login 文件导入 Login 类
 from SendPacketProcessing import SendPacketProcessing # 从 SendPacketProcessing 文件导入 SendPacketProcessing 类
 from ReceivePacketAnalysis import ReceivePacketAnalysis # 从 ReceivePacketAnalysis 文件导入 ReceivePacketAnalysis 类
 from PetFightPacketManager import PetFightPacketManager # 从 PetFightPacketManager 文件导入 PetFightPacketManager 类
+from PacketTrace import PacketTrace # 从 PacketTrace 文件导入封包追踪
+from PacketWriter import PacketWriter # 从 PacketWriter 文件导入发送队列与写线程
+from RateLimiter import RateLimiter, KICK_COMMANDS # 从 RateLimiter 文件导入自适应限速器与踢下线通知
+from Checkpoint import CheckpointStore # 从 Checkpoint 文件导入日常进度存储
 import configparser # 导入 configparser 模块，用于读写配置文件
 
 class Main: # 定义 Main 类，作为程序的主控制类
@@ -20,6 +24,11 @@ class Main: # 定义 Main 类，作为程序的主控制类
         self.send_packet_processing = None # 初始化发送数据包处理对象为 None
         self.receive_packet_analysis = None # 初始化接收数据包分析对象为 None
         self.pet_fight_packet_manager = None # 初始化宠物战斗数据包管理器为 None
+        self.packet_trace = PacketTrace() # 收发共享的封包追踪，保留最近的封包用于出错时排查
+        self.packet_writer = None # 初始化发送队列与写线程为 None
+        self.rate_limiter = RateLimiter() # 按全局与单个命令的令牌桶限速，根据响应自动调整速率
+        self.checkpoints = CheckpointStore() # 每个账号每天的日常进度，中断后重新执行时从断点继续
+        self.userid = None # 当前登录的用户ID，每次执行日常时据此载入当天的进度
         self.config = self.load_config() # 加载配置文件
 
         # 线程控制
@@ -59,21 +68,34 @@ class Main: # 定义 Main 类，作为程序的主控制类
             self.receive_packet_analysis = ReceivePacketAnalysis(
                 self.algorithms, # 传入 algorithms 对象
                 self.tcp_socket, # 传入 TCP socket
-                userid # 传入用户ID
+                userid, # 传入用户ID
+                trace=self.packet_trace # 传入共享的封包追踪
             )
 
+            # 初始化发送队列与写线程，由单个线程合并写出所有加密封包
+            self.packet_writer = PacketWriter(self.tcp_socket)
+            self.packet_writer.start()
+
             # 初始化发送数据包处理对象
             self.send_packet_processing = SendPacketProcessing(
                 self.algorithms, # 传入 algorithms 对象
                 self.tcp_socket, # 传入 TCP socket
-                userid # 传入用户ID
+                userid, # 传入用户ID
+                trace=self.packet_trace, # 传入共享的封包追踪
+                writer=self.packet_writer, # 传入发送队列
+                rate_limiter=self.rate_limiter, # 传入限速器
+                connector=lambda: self.login.login(userid, password), # 断线后重新登录
+                receiver=self.receive_packet_analysis # 重连时切换接收循环并等待密钥初始化
             )
+            # 观察请求的响应，用于测量 RTT 与识别错误响应；收到踢下线通知时降速
+            self.rate_limiter.attach(self.receive_packet_analysis, kick_commands=KICK_COMMANDS)
 
             # 初始化宠物战斗数据包管理器
             self.pet_fight_packet_manager = PetFightPacketManager(
                 self.send_packet_processing, # 传入发送数据包处理对象
                 self.receive_packet_analysis # 传入接收数据包分析对象
             )
+            self.userid = userid # 记录用户ID，执行日常时载入当天的进度
 
             return True # 返回 True 表示初始化成功
 
@@ -138,9 +160,17 @@ class Main: # 定义 Main 类，作为程序的主控制类
 
             results = [] # 用于存储每个任务的执行结果
             success = True # 标记所有任务是否都成功
+            # 每次执行时按当前时间载入当天的日常进度，跨过重置时间后使用新一天的进度
+            checkpoint = self.pet_fight_packet_manager.checkpoint = self.checkpoints.load(self.userid)
             for task, name in daily_tasks: # 遍历日常任务列表
+                if checkpoint is not None and checkpoint.is_done(task.__name__): # 今天已经完成的任务直接跳过
+                    self.logger.info(f"{name} 今天已完成，跳过") # 记录跳过日志
+                    results.append(f"{name}: 已完成") # 添加跳过结果
+                    continue
                 try:
                     task() # 执行任务函数
+                    if checkpoint is not None: # 记录任务已完成
+                        checkpoint.mark_done(task.__name__)
                     self.logger.info(f"{name} 完成") # 记录任务完成日志
                     results.append(f"{name}: 成功") # 添加成功结果
                     time.sleep(0.3) # 等待0.3秒，避免操作过于频繁
@@ -192,6 +222,13 @@ class Main: # 定义 Main 类，作为程序的主控制类
     def cleanup(self): # 清理资源的方法
         """清理资源"""
         self.stop_threads() # 停止所有线程
+        if self.receive_packet_analysis: # 结束等待方并关闭回调线程池
+            self.receive_packet_analysis.stop()
+        if self.packet_writer: # 如果写线程存在
+            self.packet_writer.stop() # 停止写线程
+            self.packet_writer = None
+        if self.send_packet_processing: # 重连后当前连接是发送端持有的新 socket
+            self.tcp_socket = self.send_packet_processing.tcp_socket
         if self.tcp_socket: # 如果 TCP socket 存在
             self.tcp_socket.close() # 关闭 TCP socket
             self.tcp_socket = None # 将 TCP socket 设置为 None